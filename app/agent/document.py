@@ -1,21 +1,31 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 
-from app.agent.instructions.prompt import DOCUMENT_PROCESSOR, DOCUMENT_PROCESSOR_DNI
+from app.agent.instructions.builder import PromptBuilder
+from app.agent.instructions.prompt import DOCUMENT_FIELDS_PROCESSOR
 from app.agent.loader import extract_text_with_pypdfloader
-from app.agent.state.state import DocumentValidationDetails, DocumentValidationResponse, PageContent
-from app.agent.utils.util import convertir_fecha_spanish
+from app.agent.state.state import DocumentFields, DocumentValidationDetails, DocumentValidationResponse, PageContent
+from app.agent.utils.fast_extract import DOCUMENT_FIELDS, extract_known_fields, locate_person
+from app.agent.utils.insured_index import InsuredIndex, person_context
+from app.agent.utils.util import convertir_fecha_spanish_v2, es_fecha_emision_valida
 from app.config.config import get_settings
 import fitz
 import io
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
 from app.providers.llm_manager import LLMConfig, LLMManager, LLMType
+from app.providers.tiering import TieredLLM
+from app.service.extraction_store import get_extraction_store, section_digest
 import logging
 import re
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+DOCUMENT_FIELDS_BUILDER = PromptBuilder(DOCUMENT_FIELDS_PROCESSOR, name="document_processor",
+                                        budget=12000, trim_order=["document_data"])
+# Fechas que se guardan en dd/mm/yyyy, vengan de los patrones o del LLM
+DATE_FIELDS = ("start_date_validity", "end_date_validity", "date_of_issuance", "date_of_signature")
+
 
 class DocumentAgent:
     """
@@ -38,36 +48,77 @@ class DocumentAgent:
         )
         self.llm_manager = LLMManager(llm_config)
         # Get the primary LLM for report generation
-        self.primary_llm = self.llm_manager.get_llm(LLMType.GPT_4O_MINI)
+        self.primary_llm = TieredLLM(self.llm_manager, "document_processor", [LLMType.GPT_4O_MINI, LLMType.GPT_4O])
 
-    async def document_processor(self, state: PageContent) -> dict:
-        person_identifier = state["document_type"]
-        structured_llm = self.primary_llm.with_structured_output(DocumentValidationDetails)
-        if person_identifier == "dni":
-            system_instructions = DOCUMENT_PROCESSOR_DNI.format(
-                enterprise=state["enterprise"],
-                document_data=state["page_content"],
-                person_identifier=state["person"]
-            )
-        else:
-            system_instructions = DOCUMENT_PROCESSOR.format(
-                enterprise=state["enterprise"],
-                document_data=state["page_content"],
-                person=state["person"]
-            )
-        # system_instructions = DOCUMENT_PROCESSOR.format(
-        #     enterprise=state["enterprise"],
-        #     document_data=state["page_content"],
-        #     person=state["person"],
-        # )
-        #print(f"Document Processor Prompt: {system_instructions}")
-        result = structured_llm.invoke([
-            SystemMessage(content=system_instructions),
-            HumanMessage(
-                content="Extrae los datos clave de un documento, particularmente la vigencia (fechas o periodos), empresa, póliza")
-        ])
-        #print(f"Document Processor Result: {result}")
-        state["valid_data"] = result
-        date_issuance_format = convertir_fecha_spanish(state["valid_data"]["date_of_issuance"])
-        state["valid_data"]["date_of_issuance"] = date_issuance_format
+    @staticmethod
+    def check_extraction(result: dict) -> Optional[str]:
+        """Cross-check of an extraction: parseable dates, issuance within validity, policy present."""
+        try:
+            end_date_validity = convertir_fecha_spanish_v2(result.get("end_date_validity") or "")
+            date_of_issuance = convertir_fecha_spanish_v2(result.get("date_of_issuance") or "")
+            if not es_fecha_emision_valida(date_of_issuance, end_date_validity):
+                return "issuance date after end of validity"
+        except ValueError:
+            return "unparseable validity or issuance date"
+        if not result.get("policy_number"):
+            return "policy number missing"
+        return None
+
+    @staticmethod
+    def normalize_dates(fields: dict) -> dict:
+        """Fechas en dd/mm/yyyy ("31 de enero del 2024" → "31/01/2024"); las que faltan quedan en None."""
+        return {**fields, **{name: convertir_fecha_spanish_v2(fields[name].strip())
+                             for name in DATE_FIELDS if isinstance(fields.get(name), str)}}
+
+    async def document_fields(self, page_content: str, enterprise: str) -> DocumentFields:
+        """
+        Datos de la sección que no dependen de la persona, extraídos una sola vez.
+
+        Se buscan primero en el almacén de extracciones; si no están, se leen con los
+        patrones de la aseguradora y el LLM completa lo que falte.
+        """
+        store = get_extraction_store()
+        key = section_digest(page_content, enterprise)
+        stored = await store.get(key)
+        if stored is not None:
+            return stored
+
+        # Los formatos conocidos se leen con patrones; el LLM solo completa lo que falte
+        fast = extract_known_fields(page_content, enterprise)
+        missing = fast.missing(required=DOCUMENT_FIELDS)
+        fields = {name: value for name, value in fast.details().items() if name != "person_by_policy"}
+        source = "fast"
+        if missing:
+            logger.debug(f"Fields left to the LLM: {missing}")
+            structured_llm = self.primary_llm.with_structured_output(DocumentFields)
+            # Sin persona no hace falta ninguna fila de la tabla de asegurados
+            system_instructions = DOCUMENT_FIELDS_BUILDER.build(
+                enterprise=enterprise,
+                document_data=person_context(page_content, "")
+            ).text
+            result = await structured_llm.ainvoke([
+                SystemMessage(content=system_instructions),
+                HumanMessage(
+                    content="Extrae los datos clave de un documento, particularmente la vigencia (fechas o periodos), empresa, póliza")
+            ], check=self.check_extraction)
+            fields = {**result, **{name: value for name, value in fast.resolved().items() if name in fields}}
+            source = "llm"
+        # Mismo formato en las dos rutas: las extracciones guardadas se reutilizan para todas las personas
+        fields = self.normalize_dates(fields)
+        await store.put(key, enterprise, fields, source)
+        return fields
+
+    @staticmethod
+    def apply_person(state: PageContent, fields: DocumentFields, index: Optional[InsuredIndex] = None) -> PageContent:
+        """Completa la sección con la búsqueda de la persona sobre los datos ya extraídos del documento."""
+        lookup = locate_person(state["page_content"], state["person"], fields.get("policy_number"),
+                               fields.get("start_date_validity"), fields.get("company"), index=index)
+        state["insured_match"] = lookup.insured.as_dict() if lookup.insured else None
+        state["person_found"] = lookup.person_found
+        state["valid_data"] = DocumentValidationDetails(**fields, person_by_policy=lookup.person_by_policy)
         return state
+
+    async def document_processor(self, state: PageContent) -> dict:
+        # Etapa del documento (reutilizable entre personas) y etapa de la persona (búsqueda en el índice)
+        fields = await self.document_fields(state["page_content"], state["enterprise"])
+        return self.apply_person(state, fields)
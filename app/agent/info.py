@@ -1,5 +1,6 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from app.agent.instructions.builder import PromptBuilder
 from app.agent.instructions.prompt import DOCUMENT_PROCESSOR
 from app.agent.loader import extract_text_with_pypdfloader
 from app.agent.state.state import DocumentValidationDetails, DocumentValidationResponse, PageContent
@@ -8,13 +9,18 @@ import fitz
 import io
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
+from app.agent.document import DocumentAgent
 from app.providers.llm_manager import LLMConfig, LLMManager, LLMType
+from app.providers.tiering import TieredLLM
 import logging
 import re
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+INFO_PROCESSOR_BUILDER = PromptBuilder(DOCUMENT_PROCESSOR, name="info_processor",
+                                       budget=12000, trim_order=["document_data"])
+
 
 class InfoAgent:
     """
@@ -37,23 +43,23 @@ class InfoAgent:
         )
         self.llm_manager = LLMManager(llm_config)
         # Get the primary LLM for report generation
-        self.primary_llm = self.llm_manager.get_llm(LLMType.GPT_4O)
+        self.primary_llm = TieredLLM(self.llm_manager, "info_processor", [LLMType.GPT_4O_MINI, LLMType.GPT_4O])
 
     async def info_processor(self, state: PageContent) -> dict:
 
         structured_llm = self.primary_llm.with_structured_output(DocumentValidationDetails)
 
-        system_instructions = DOCUMENT_PROCESSOR.format(
+        system_instructions = INFO_PROCESSOR_BUILDER.build(
             enterprise=state["enterprise"],
             document_data=state["page_content"],
             person=state["person"]
-        )
+        ).text
 
-        result = structured_llm.invoke([
+        result = await structured_llm.ainvoke([
             SystemMessage(content=system_instructions),
             HumanMessage(
                 content="Extrae los datos clave de un documento, particularmente la vigencia (fechas o periodos), empresa, póliza")
-        ])
+        ], check=DocumentAgent.check_extraction)
 
         state["valid_data"] = result
         return state
@@ -0,0 +1,140 @@
+"""
+Prompt builder with token accounting.
+
+Counts the tokens of every section interpolated into a system prompt before it is
+dispatched, serializes structured state compactly (JSON instead of Python ``repr``)
+and enforces a per-call token budget by trimming the sections declared as
+trimmable, logging what was removed.
+"""
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Dict, Sequence
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken viene con langchain-openai
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Encoding de la familia gpt-4o; se usa como aproximación para el resto de modelos
+TOKEN_ENCODING = os.getenv("PROMPT_TOKEN_ENCODING", "o200k_base")
+CHARS_PER_TOKEN = 4
+TRIM_MARKER = "\n[... contenido recortado ...]"
+
+
+@lru_cache()
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        logger.warning(f"Tokenizer {TOKEN_ENCODING} unavailable, using character estimate: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text (character estimate when tiktoken is unavailable)."""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the first ``max_tokens`` tokens of a text."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens])
+
+
+def compact_dump(value: Any) -> str:
+    """Serialize state for a prompt: strings as-is, everything else as compact JSON."""
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return "null"
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+@dataclass
+class BuiltPrompt:
+    """Rendered prompt together with its token accounting."""
+    text: str
+    total_tokens: int
+    section_tokens: Dict[str, int] = field(default_factory=dict)
+    trimmed: Dict[str, int] = field(default_factory=dict)
+
+
+class PromptBuilder:
+    """Renders a template section by section under a token budget.
+
+    Args:
+        template: ``str.format`` template of the system prompt.
+        name: Name used in logs and for the ``PROMPT_BUDGET_<NAME>`` override.
+        budget: Maximum tokens of the rendered prompt.
+        trim_order: Sections that may be shortened, in the order they are trimmed.
+    """
+
+    def __init__(self, template: str, name: str, budget: int, trim_order: Sequence[str] = ()):
+        self.template = template
+        self.name = name
+        self.budget = int(os.getenv(f"PROMPT_BUDGET_{name.upper()}", budget))
+        self.trim_order = list(trim_order)
+        self.occurrences: Dict[str, int] = {}
+        for _, field_name, _, _ in Formatter().parse(template):
+            if field_name:
+                self.occurrences[field_name] = self.occurrences.get(field_name, 0) + 1
+        self.overhead_tokens = count_tokens(template.format(**{k: "" for k in self.occurrences}))
+
+    def build(self, **sections: Any) -> BuiltPrompt:
+        """
+        Render the template, trimming sections in ``trim_order`` until it fits the budget
+
+        Returns:
+            BuiltPrompt with the final text and the per-section token counts
+        """
+        values = {name: compact_dump(sections[name]) for name in self.occurrences}
+        tokens = {name: count_tokens(text) for name, text in values.items()}
+        total = self._total(tokens)
+        trimmed: Dict[str, int] = {}
+
+        for name in self.trim_order:
+            if total <= self.budget:
+                break
+            if name not in values:
+                continue
+            excess = total - self.budget
+            keep = max(tokens[name] - math.ceil(excess / self.occurrences[name]) - count_tokens(TRIM_MARKER), 0)
+            removed = tokens[name] - keep
+            values[name] = truncate_to_tokens(values[name], keep) + TRIM_MARKER
+            tokens[name] = count_tokens(values[name])
+            trimmed[name] = removed
+            total = self._total(tokens)
+            logger.info(f"Prompt {self.name}: trimmed {removed} tokens from '{name}' "
+                        f"(budget {self.budget}, now {total})")
+
+        if total > self.budget:
+            logger.warning(f"Prompt {self.name} still exceeds its budget: {total} > {self.budget} tokens")
+        logger.debug(f"Prompt {self.name}: {total} tokens, sections {tokens}")
+        return BuiltPrompt(
+            text=self.template.format(**values),
+            total_tokens=total,
+            section_tokens=tokens,
+            trimmed=trimmed
+        )
+
+    def _total(self, tokens: Dict[str, int]) -> int:
+        return self.overhead_tokens + sum(tokens[name] * self.occurrences[name] for name in tokens)
@@ -1,5 +1,5 @@
 
-DOCUMENT_PROCESSOR = """Valida la informacion del documento para la razon social {enterprise} y analisa la información clave del siguiente documento {document_data}, centrándote en las siguientes prioridades: vigencia, empresa, póliza, logo, y firma.
+DOCUMENT_PROCESSOR = """Valida la informacion del documento para la razon social {enterprise} y analisa la información clave del documento incluido en **Input Document Data**, centrándote en las siguientes prioridades: vigencia, empresa, póliza, logo, y firma.
 **Input Document Data:**
 "document_data":  {document_data}
 
@@ -30,7 +30,7 @@ Produce una respuesta estructurada en formato JSON con las siguientes claves:
 - Para la busqueda de personas aseguradas, se debe buscar el nombre de la persona asegurada con el numero de poliza en la lista de asegurados, si no se encuentra, se debe indicar null.
 """
 
-DOCUMENT_PROCESSOR_DNI = """Valida la informacion del documento para la razon social {enterprise} y analisa la información clave del siguiente documento {document_data}, centrándote en las siguientes prioridades: vigencia, empresa, póliza, logo, y firma.
+DOCUMENT_PROCESSOR_DNI = """Valida la informacion del documento para la razon social {enterprise} y analisa la información clave del documento incluido en **Input Document Data**, centrándote en las siguientes prioridades: vigencia, empresa, póliza, logo, y firma.
 **Input Document Data:**
 "document_data":  {document_data}
 
@@ -65,6 +65,37 @@ Produce una respuesta estructurada en formato JSON con las siguientes claves:
 - Para la búsqueda de personas aseguradas, independientemente de si buscas por nombre o DNI, debes proporcionar toda la información asociada a la persona encontrada.
 """
 
+DOCUMENT_FIELDS_PROCESSOR = """Analiza la información clave del documento de la aseguradora {enterprise} incluido en **Input Document Data**. Extrae solo los datos del documento; no busques a ningún asegurado en particular.
+**Input Document Data:**
+"document_data":  {document_data}
+
+# Steps
+
+1. **Comprender el Documento**: Lee completamente el documento para entender su contenido y estructura. La lista de asegurados puede aparecer recortada.
+2. **Buscar la Vigencia**: Identifica todas las menciones de fechas o periodos temporales que indiquen la vigencia del documento.
+3. **Fecha de emisión**: Busca la fecha de emisión del documento, normalmente en la parte superior, pero puede estar en cualquier lugar.
+4. **Empresa**: Busca el nombre de la empresa aseguradora que emite el documento y guárdalo en el campo "company".
+5. **Encontrar Información de la Póliza**: Busca números o identificadores que se mencionen junto a las palabras 'póliza' o 'Póliza de Pensiones'.
+6. **Número de constancia**: Si el documento tiene un número de constancia, guárdalo en "constancia_number".
+
+# Output Format
+
+Produce una respuesta estructurada en formato JSON con las siguientes claves:
+- "validity": [rango_fechas_o_null],
+- "start_date_validity": [fecha_inicio_o_null],
+- "end_date_validity": [fecha_fin_o_null],
+- "company": [nombre_empresa_o_null],
+- "policy_number": [numeros_de_poliza_o_null],
+- "date_of_issuance": fecha_de_emision_o_null,
+- "date_of_signature": fecha_de_firma_o_null,
+- "constancia_number": numero_de_constancia_o_null,
+
+# Notes
+
+- Indica la ausencia de alguno de los elementos requeridos con el valor null si dicha información no está claramente especificada en el documento.
+- La exactitud en la extracción de información y la claridad de los términos es prioritaria para asegurar la utilidad del resultado.
+"""
+
 LOGO_DETECTION_PROMPT = """Validar si el logotipo de la empresa dentro de un documento y corresponde a la razón social {enterprise} o la empresa {company}.
 
 Revise el documento para asegurar que el logotipo del mismo es coherente con los datos {document_data} de la empresa.
@@ -107,13 +138,23 @@ El veredicto final debe estructurarse en un formato que incluya la decisión de
 
 VERDICT_PAGE_PROMPT = """Elaborar un veredicto organizado y preciso basado en diversos aspectos de la validación del documento, incluida la vigencia ,el número de póliza y la persona asegurada, por numero de pagina {page_num}.
 
+# Datos de la página
+
+- **Persona buscada:** {person}
+- **Fila más parecida en la lista de asegurados:** {insured_match}
+- **Número(s) de póliza extraídos:** {policy_number}
+- **validation_passed:** {validation_passed}
+- **validity_passed:** {validity_passed}
+- **Contenido de la página:**
+{page_content}
+
 # Pasos
 
 1. **Validación de persona:**
-    - Analiza el nombre de la persona asegurada extraído de esta página: {person}.
-   - Compara este nombre con el nombre de la persona asegurada registrado en la póliza: {page_content}.
+    - Analiza el nombre de la persona buscada.
+   - Compara este nombre con el nombre de la persona asegurada registrado en la póliza (contenido de la página).
    - **Criterios de Coincidencia Flexible:**
-     - **Nombre y Apellido Principal:** Verifica si al menos un nombre y un apellido presentes en {person} coinciden con al menos un nombre y un apellido en {page_content}.  Considera el nombre y apellido principal como los elementos clave para la coincidencia.
+     - **Nombre y Apellido Principal:** Verifica si al menos un nombre y un apellido de la persona buscada coinciden con al menos un nombre y un apellido en el contenido de la página.  Considera el nombre y apellido principal como los elementos clave para la coincidencia.
      - **Flexibilidad en Variaciones:** Sé flexible con:
        - Mayúsculas y minúsculas (ignora la diferencia).
        - Comas, puntos, guiones y otros signos de puntuación en el nombre (ignóralos).
@@ -121,30 +162,24 @@ VERDICT_PAGE_PROMPT = """Elaborar un veredicto organizado y preciso basado en di
        - Pequeños errores de ortografía o tipeo (tolera errores leves).
        - Orden de los nombres (si el nombre y apellido principal son consistentes, el orden secundario no es crucial).
      - **Ejemplo de Coincidencia:** "JUAN PEREZ" se considera una coincidencia con "Perez, Juan Carlos", "Juan R. Perez", "Juan Pérez".
-   - **Número de Póliza como Confirmación (Opcional):**  Verifica que el número de póliza extraído de la página ({policy_number}) coincida con el número de póliza asociado a la persona asegurada (implícito en {page_content}).  Si hay coincidencia en el número de póliza, úsalo como una confirmación adicional de la validación de persona, pero la validación principal debe basarse en la coincidencia del nombre.
+   - **Número de Póliza como Confirmación (Opcional):**  Verifica que el número de póliza extraído coincida con el número de póliza asociado a la persona asegurada (implícito en el contenido de la página).  Si hay coincidencia en el número de póliza, úsalo como una confirmación adicional de la validación de persona, pero la validación principal debe basarse en la coincidencia del nombre.
    - **Resultado:** Determina si la validación de la persona asegurada es exitosa basándote en la coincidencia flexible del nombre.  En el veredicto, explica brevemente cómo se realizó la comparación del nombre y si se encontró una coincidencia flexible.
    
 2. **Validación de Poliza:**
-   - Verifica la existencia de al menos un número de póliza {policy_number}.
+   - Verifica la existencia de al menos un número de póliza extraído.
    
 3. **Validación de Vigencia:**
    - Considera los resultados de las validaciones de vigencia pre-calculadas:
-     - `validation_passed`: Indica si la fecha de emisión es válida respecto a la fecha de fin de vigencia. Valor: {validation_passed}.
-     - `validity_passed`: Indica si la fecha de fin de vigencia es válida respecto a una fecha de referencia. Valor: {validity_passed}.
+     - `validation_passed`: Indica si la fecha de emisión es válida respecto a la fecha de fin de vigencia.
+     - `validity_passed`: Indica si la fecha de fin de vigencia es válida respecto a una fecha de referencia.
    - **Resultado:** Determina si la validación de vigencia es exitosa basándote en que **ambos** `validation_passed` y `validity_passed` sean verdaderos.
    
 4. **Compilar veredicto final:**
    - Integra los resultados de las número de póliza y persona asegurada.
    - Genera un estatus para cada categoría de la revisión: `validity_validation_passed`, `policy_validation_passed`, `person_validation_passed`.
-   - validity_validation_passed: Será **verdadero** si **ambos** `validation_passed` es {validation_passed} y `validity_passed` es {validity_passed} son verdaderos. Si es **falso**, explica **cuál de los dos criterios no se cumple** (o ambos) y por qué.
-   - policy_validation_passed: si existe al menos un número de póliza {policy_number}. Debes explicar el criterio que no se cumple, en caso de que no se cumpla.
-   - person_validation_passed:* Verifica si al menos un nombre y un apellido presentes en {person} coinciden con al menos un nombre y un apellido en {page_content}.  Considera el nombre y apellido principal como los elementos clave para la coincidencia.
-     - **Flexibilidad en Variaciones:** Sé flexible con:
-       - Mayúsculas y minúsculas (ignora la diferencia).
-       - Comas, puntos, guiones y otros signos de puntuación en el nombre (ignóralos).
-       - Iniciales y nombres abreviados (considera "J." como posible coincidencia con "Juan").
-       - Pequeños errores de ortografía o tipeo (tolera errores leves).
-       - Orden de los nombres (si el nombre y apellido principal son consistentes, el orden secundario no es crucial).
+   - validity_validation_passed: Será **verdadero** si **ambos** `validation_passed` y `validity_passed` son verdaderos. Si es **falso**, explica **cuál de los dos criterios no se cumple** (o ambos) y por qué.
+   - policy_validation_passed: si existe al menos un número de póliza extraído. Debes explicar el criterio que no se cumple, en caso de que no se cumpla.
+   - person_validation_passed:* Verifica si al menos un nombre y un apellido de la persona buscada coinciden con al menos un nombre y un apellido en el contenido de la página, con la misma flexibilidad del paso 1.
 
 
 # Notas
@@ -153,22 +188,29 @@ VERDICT_PAGE_PROMPT = """Elaborar un veredicto organizado y preciso basado en di
 
 
 FINAL_VERDICTO_PROMPT = """ 
-Analisa solo la pagina donde se encontro a la persona asegurada {page_diagnosis}, luego genera un veredicto final en base al veredicto de esta hoja {pages_verdicts}. El veredicto debe seguir los siguientes pasos.
+Analisa solo la pagina donde se encontro a la persona asegurada (diagnóstico de páginas), luego genera un veredicto final en base al veredicto de esta hoja (veredictos de páginas). El veredicto debe seguir los siguientes pasos.
+
+# Datos (JSON)
+
+- **Diagnóstico de páginas:** {page_diagnosis}
+- **Veredictos de páginas:** {pages_verdicts}
+- **Diagnóstico de logotipo y firma:** {logo_diagnosis}
+- **Firmas detectadas por página (OpenCV):** {signature_diagnosis}
 
 # Pasos
 
 1. **Validación de firma:**
-    - Verifica si existe al menos una firma en el documento {logo_diagnosis}. Si es asi el veredicto es positivo.
+    - Verifica si existe al menos una firma en el documento según el diagnóstico de logotipo y firma o las firmas detectadas por página. Si es asi el veredicto es positivo.
     
 2. **Validación del logotipo:**
-   - revisa toda la información relacionada con el logotipo y la empresa para confirmar la validez del logotipo {logo_diagnosis}.
+   - revisa toda la información relacionada con el logotipo y la empresa en el diagnóstico de logotipo y firma para confirmar la validez del logotipo.
 
 3. **Validación de vigencia:**
-   - revisa solo el veredicto de la pagina donde se encontro a la persona asegurada {page_diagnosis}, para confirmar la validez de la vigencia {pages_verdicts}
+   - revisa solo el veredicto de la pagina donde se encontro a la persona asegurada (diagnóstico de páginas), para confirmar la validez de la vigencia en los veredictos de páginas.
    
 4. **Validación de persona:**
-   - Revisa los veredictos de persona asegurada de todas las páginas {pages_verdicts}.
-   - **Para cada página, considera la validación de persona como positiva si se encuentra el nombre de la persona asegurada {page_diagnosis} o una variación razonable del mismo.**
+   - Revisa los veredictos de persona asegurada de todas las páginas (veredictos de páginas).
+   - **Para cada página, considera la validación de persona como positiva si se encuentra el nombre de la persona asegurada del diagnóstico de páginas o una variación razonable del mismo.**
    - **Sé flexible con:**
      - Comas y otros signos de puntuación en el nombre.
      - Iniciales y nombres abreviados.
@@ -190,8 +232,8 @@ Estructura el veredicto final como un párrafo que incluya la decisión de valid
 
 Debe clasificar el documento como válido, observado o no válido. Siguiendo los siguientes criterios:
 
-- La primera parte valida el `{logo_diagnosis}` resaltando datos del logotipo y la firma. Si esta primera parte de validación es negativa, el documento estará observado.
-- La segunda parte evalúa `{pages_verdicts}` para validar vigencia, número de póliza y persona asegurada.Si esta segunda parte de validación es negativa, el documento sera catalogado como no válido.
+- La primera parte valida el diagnóstico de logotipo y firma, resaltando datos del logotipo y la firma. Si esta primera parte de validación es negativa, el documento estará observado.
+- La segunda parte evalúa los veredictos de páginas para validar vigencia, número de póliza y persona asegurada.Si esta segunda parte de validación es negativa, el documento sera catalogado como no válido.
 - Si ambas partes son positivas, el documento es válido.
 
 # Notas
@@ -1,5 +1,5 @@
 
-DOCUMENT_PROCESSOR = """Valida la informacion del documento para la razon social {enterprise} y analisa la información clave del siguiente documento {document_data}, centrándote en las siguientes prioridades: vigencia, empresa, póliza, logo, y firma.
+DOCUMENT_PROCESSOR = """Valida la informacion del documento para la razon social {enterprise} y analisa la información clave del documento incluido en **Input Document Data**, centrándote en las siguientes prioridades: vigencia, empresa, póliza, logo, y firma.
 **Input Document Data:**
 "document_data":  {document_data}
 
@@ -43,6 +43,14 @@ Revise el documento para asegurar que el logotipo del mismo es coherente con los
 - Solo responda si la firma se encuentra presente en el documento.
 - el diagnostioco dene reflejar si el logotipo coincide con la empresa y si la firma se encuentra en el documento."""
 
+LOGO_BATCH_DETECTION_PROMPT = LOGO_DETECTION_PROMPT + """
+
+# Varias páginas por solicitud
+
+- Recibirás varias imágenes, cada una precedida del texto "Página N".
+- Evalúa cada página por separado, sin mezclar logotipos ni firmas entre páginas.
+- Devuelve en el campo "pages" exactamente un elemento por cada página recibida, con su "page_num" igual al número N indicado."""
+
 VERDICT_PROMPT = """Elaborar un veredicto organizado y preciso basado en diversos aspectos de la validación de documentos, incluida la validación del logotipo, la validez del documento y la detección de firmas.
 
 # Pasos
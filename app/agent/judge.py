@@ -1,18 +1,30 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from app.agent.instructions.builder import PromptBuilder
 from app.agent.instructions.prompt import VERDICT_PROMPT, VERDICT_PAGE_PROMPT, \
     FINAL_VERDICTO_PROMPT
 from app.agent.state.state import DocumentValidationResponse, VerdictResponse, PageVerdict, OverallState, \
     VerdictDetails, PageContent, PageDiagnosis, FinalVerdictResponse, ObservationResponse
 from app.agent.utils.util import es_fecha_emision_valida, es_fecha_vigencia_valida, convertir_fecha_spanish, \
     convertir_fecha_spanish_v2
+from app.agent.utils.insured_index import person_context
+from app.agent.utils.verdict_rules import PageFacts, evaluate_rules, find_person
 from app.config.config import get_settings
 from app.providers.llm_manager import LLMConfig, LLMType, LLMManager
+from app.providers.rate_limit import Priority
+from app.providers.tiering import TieredLLM
+from app.agent.utils.early_exit_rules import decided_final_verdict
 import logging
+from typing import Optional
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+VERDICT_PAGE_BUILDER = PromptBuilder(VERDICT_PAGE_PROMPT, name="verdict_page",
+                                     budget=10000, trim_order=["page_content"])
+FINAL_VERDICT_BUILDER = PromptBuilder(FINAL_VERDICTO_PROMPT, name="final_verdict",
+                                      budget=8000, trim_order=["page_diagnosis", "logo_diagnosis"])
+
 
 class JudgeAgent:
     def __init__(self, settings=None):
@@ -23,7 +35,41 @@ class JudgeAgent:
             max_tokens=4000
         )
         self.llm_manager = LLMManager(llm_config)
-        self.primary_llm = self.llm_manager.get_llm(LLMType.GPT_4O)
+        # gpt-4o-mini responde primero; se escala a gpt-4o con baja confianza o incoherencias
+        self.primary_llm = TieredLLM(self.llm_manager, "validate_page", [LLMType.GPT_4O_MINI, LLMType.GPT_4O])
+        # El veredicto final cierra una petición en curso: pasa antes que las páginas en cola
+        self.final_llm = TieredLLM(self.llm_manager, "compile_verdict", [LLMType.GPT_4O_MINI, LLMType.GPT_4O],
+                                   priority=Priority.HIGH)
+
+    @staticmethod
+    def _date_check(check, *dates) -> Optional[bool]:
+        """Run a date check; None when the dates cannot be parsed."""
+        try:
+            return check(*dates)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _check_page_verdict(result: dict, dates_passed: Optional[bool]) -> Optional[str]:
+        """The verdict must agree with the deterministic date checks."""
+        if dates_passed is None:
+            return None
+        details = result.get("details") or {}
+        if details.get("validity_validation_passed") != dates_passed:
+            return f"validity_validation_passed disagrees with date checks ({dates_passed})"
+        if result.get("verdict") and not dates_passed:
+            return "verdict true with failed date checks"
+        return None
+
+    @staticmethod
+    def _check_final_verdict(result: dict, pages_verdicts: list) -> Optional[str]:
+        """A document cannot be valid unless a page where the person was found passed."""
+        approved = str(result.get("verdict")).strip().lower() == "true"
+        person_pages = [page for page in pages_verdicts
+                        if (page.get("details") or {}).get("person_validation_passed")]
+        if approved and not any(page.get("verdict") for page in person_pages):
+            return "final verdict true without an approved page for the person"
+        return None
 
     async def validate(self, state: PageContent) -> dict:
         structured_llm = self.primary_llm.with_structured_output(VerdictResponse)
@@ -38,35 +84,58 @@ class JudgeAgent:
         #print(f"date_of_issuance: {date_of_issuance}")
         #print(f"end_date_validity: {end_date_validity}")
         #print(f"start_date_validity: {start_date_validity}")
-        validation_passed = es_fecha_emision_valida(date_of_issuance, end_date_validity)
+        validation_passed = self._date_check(es_fecha_emision_valida, date_of_issuance, end_date_validity)
         reference_date = state["reference_date"]
         #print(f"reference_date: {reference_date}")
-        validity_passed = es_fecha_vigencia_valida(end_date_validity, reference_date)
-        print(f"validity_passed: {validity_passed}")
+        validity_passed = self._date_check(es_fecha_vigencia_valida, end_date_validity, reference_date)
+        logger.debug(f"Page {page_num}: validation_passed={validation_passed} validity_passed={validity_passed}")
 
-        system_instructions = VERDICT_PAGE_PROMPT.format(
-            enterprise=enterprise,
-            date_of_issuance=date_of_issuance,
-            validity=valid_data["validity"],
-            start_date_validity=start_date_validity,
+        page_diagnosis_obj = PageDiagnosis(  # Create the PageDiagnosis object
+            valid_info=valid_data,
+            page_num=page_num
+        )
+
+        # El índice de asegurados decide si la persona figura; sin índice se busca en el texto
+        insured_match = state.get("insured_match")
+        person_found = state.get("person_found")
+        if person_found is None and insured_match is None:
+            person_found = find_person(person, page_content)
+
+        # Las reglas resuelven las páginas cuyo veredicto ya está determinado sin llamar al LLM
+        facts = PageFacts(
+            page_num=page_num,
+            person=person,
+            policy_number=valid_data.get("policy_number"),
             end_date_validity=end_date_validity,
+            date_of_issuance=date_of_issuance,
+            reference_date=reference_date,
+            validation_passed=validation_passed,
+            validity_passed=validity_passed,
+            person_found=person_found
+        )
+        result = evaluate_rules(facts)
+        if result is not None:
+            logger.info(f"Page {page_num} verdict resolved by rules: {result['verdict']}")
+            return {
+                "pages_verdicts": [result],
+                "page_diagnosis": [page_diagnosis_obj]
+            }
+
+        system_instructions = VERDICT_PAGE_BUILDER.build(
             policy_number=valid_data["policy_number"],
             page_num=page_num,
-            page_content=page_content,
+            page_content=person_context(page_content, person),
             person=person,
+            insured_match=insured_match or "sin coincidencia en el índice",
             validation_passed=validation_passed,
             validity_passed=validity_passed
-        )
+        ).text
 
-        result = structured_llm.invoke([
+        dates_passed = None if None in (validation_passed, validity_passed) else validation_passed and validity_passed
+        result = await structured_llm.ainvoke([
             SystemMessage(content=system_instructions),
             HumanMessage(content="Generar un veredicto para la validación de documentos.")
-        ])
-
-        page_diagnosis_obj = PageDiagnosis(  # Create the PageDiagnosis object
-            valid_info=valid_data,
-            page_num=page_num
-        )
+        ], check=lambda answer: self._check_page_verdict(answer, dates_passed))
         #print(f"page_diagnosis_obj: {page_diagnosis_obj}")
         #print(f"result: {result}")
         return {
@@ -74,30 +143,35 @@ class JudgeAgent:
             "page_diagnosis": [page_diagnosis_obj]
         }
 
-    def summarize(self, state: OverallState) -> dict:
+    async def summarize(self, state: OverallState) -> dict:
         """Summarizes pages_verdicts para un veredicto final."""
 
         pages_verdicts = state["pages_verdicts"]
         pages_diagnosis = state["page_diagnosis"]
-        #signature_diagnosis = state["signature_diagnosis"]
         logo_diagnosis = state["logo_diagnosis"]
-        #total_found_signatures = sum([1 for page in signature_diagnosis if page["signature_status"]])
+        # Si una sección ya decidió el documento (o nadie encontró a la persona) no hace falta el resumen
+        decided = decided_final_verdict(state.get("early_exit"), pages_verdicts, logo_diagnosis,
+                                        state.get("signature_diagnosis") or [], state.get("skipped_pages") or [])
+        if decided is not None:
+            logger.info(f"Final verdict decided without the LLM: {decided['verdict']}")
+            return {"final_verdict": decided}
+        # Del resultado de OpenCV basta el conteo por página; las cajas no aportan al veredicto
+        signature_diagnosis = [{"page_num": page["metadata"]["page_number"],
+                                "signatures_found": page["metadata"]["signatures_found"]}
+                               for page in state.get("signature_diagnosis") or []]
         enterprise = state["page_contents"][0]["enterprise"]
         person = state["page_contents"][0]["person"]
-        structured_llm = self.primary_llm.with_structured_output(FinalVerdictResponse)
-        system_instructions = FINAL_VERDICTO_PROMPT.format(
+        structured_llm = self.final_llm.with_structured_output(FinalVerdictResponse)
+        system_instructions = FINAL_VERDICT_BUILDER.build(
             pages_verdicts=pages_verdicts,
-            #total_found_signatures=total_found_signatures,
             page_diagnosis=pages_diagnosis,
             logo_diagnosis=logo_diagnosis,
-            #signature_diagnosis=signature_diagnosis,
-            enterprise=enterprise,
-            person=person
-        )
-        final_verdict_response = structured_llm.invoke([
+            signature_diagnosis=signature_diagnosis,
+        ).text
+        final_verdict_response = await structured_llm.ainvoke([
             SystemMessage(content=system_instructions),
             HumanMessage(content="Analisa los veredictos de las páginas y genera un veredicto final.")
-        ])
+        ], check=lambda answer: self._check_final_verdict(answer, pages_verdicts))
         return {"final_verdict": final_verdict_response}
 
     def cleanup(self):
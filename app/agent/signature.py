@@ -1,3 +1,4 @@
+import asyncio
 from typing import List
 
 import numpy as np
@@ -14,6 +15,7 @@ import cv2
 from app.agent.state.state import SignatureValidationDetails, DocumentValidationResponse, OverallState
 from app.agent.tools.signature_detect import find_signature_bounding_boxes
 from app.config.config import get_settings
+from app.service.document_store import document_file
 from app.providers.llm_manager import LLMConfig, LLMManager, LLMType
 
 logging.basicConfig(level=logging.DEBUG)
@@ -34,6 +36,12 @@ class SignatureAgent:
     async def pdf_to_images(self, file: UploadFile) -> List[np.ndarray]:
         """Convierte PDF a lista de imágenes para OpenCV"""
         content = await file.read()
+        await file.seek(0)
+        # El renderizado a 300 dpi es CPU: fuera del event loop para no frenar las otras ramas
+        return await asyncio.to_thread(self._render_pages, content)
+
+    @staticmethod
+    def _render_pages(content: bytes) -> List[np.ndarray]:
         memory_stream = io.BytesIO(content)
 
         pdf_document = fitz.open(stream=memory_stream, filetype="pdf")
@@ -55,7 +63,7 @@ class SignatureAgent:
 
             images.append(img_array)
 
-        await file.seek(0)
+        pdf_document.close()
         return images
 
     def convert_signature_to_dict(self, signature: tuple) -> dict:
@@ -72,13 +80,13 @@ class SignatureAgent:
         """Detecta firmas usando OpenCV"""
         try:
             # Convertir PDF a imágenes
-            cv_images = await self.pdf_to_images(state["file_signature"])
+            cv_images = await self.pdf_to_images(document_file(state))
             signature_diagnosis = []
 
             # Procesar cada página
             for page_num, img in enumerate(cv_images, 1):
                 # Detectar firmas
-                signatures = find_signature_bounding_boxes(img)
+                signatures = await asyncio.to_thread(find_signature_bounding_boxes, img)
                 signatures_dict = [self.convert_signature_to_dict(sig) for sig in signatures]
 
                 # Crear resultado de la página
@@ -95,8 +103,8 @@ class SignatureAgent:
                 signature_diagnosis.append(page_result)
                 logger.debug(f"Processed page {page_num}, found {len(signatures)} signatures")
 
-            state["signature_diagnosis"] = signature_diagnosis
-            return state
+            # Solo la clave propia: las ramas paralelas no pueden escribir las mismas claves del estado
+            return {"signature_diagnosis": signature_diagnosis}
 
         except Exception as e:
             logger.error(f"Error en detección de firmas: {str(e)}")
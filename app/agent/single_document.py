@@ -1,5 +1,6 @@
 from langchain_core.messages import SystemMessage, HumanMessage
 
+from app.agent.instructions.builder import PromptBuilder
 from app.agent.instructions.single import DOCUMENT_PROCESSOR
 from app.agent.loader import extract_text_with_pypdfloader
 from app.agent.state.single import DocumentValidationDetails, DocumentValidationResponse
@@ -9,12 +10,16 @@ import io
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
 from app.providers.llm_manager import LLMConfig, LLMManager, LLMType
+from app.service.insurer_registry import get_insurer_registry
 import logging
 import re
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+SINGLE_DOCUMENT_PROCESSOR_BUILDER = PromptBuilder(DOCUMENT_PROCESSOR, name="single_document_processor",
+                                                  budget=12000, trim_order=["document_data"])
+
 
 class SingleDocumentAgent:
     """
@@ -38,35 +43,19 @@ class SingleDocumentAgent:
         # Get the primary LLM for report generation
         self.primary_llm = self.llm_manager.get_llm(LLMType.GPT_4O_MINI)
 
-    # Lista de empresas aseguradoras conocidas
-    INSURANCE_COMPANIES = {
-        "MAPFRE": ["MAPFRE", "MAPFRE PERU"],
-        "PACIFICO": ["PACIFICO", "PACIFICO SEGUROS", "PACIFICO EPS"],
-        "RIMAC": ["RIMAC", "RIMAC SEGUROS"],
-        "SANITAS": ["SANITAS", "SANITAS PERU"],
-        "LA POSITIVA": ["LA POSITIVA", "LA POSITIVA VIDA"]
-    }
-
     def _identify_company_from_filename(self, filename: str) -> Optional[str]:
         """Identifica la empresa aseguradora a partir del nombre del archivo."""
-        # Se limpia y estandariza el nombre del archivo.
-        clean_filename = re.sub(r'\.[^.]+$', '', filename.upper())
-        clean_filename = re.sub(r'[^A-Z0-9\s]', ' ', clean_filename)
-
-        for company, variations in self.INSURANCE_COMPANIES.items():
-            if any(variation.upper() in clean_filename for variation in variations):
-                logger.info(f"Empresa identificada por nombre de archivo: {company}")
-                return company
-        return None
+        match = get_insurer_registry().match_filename(filename)
+        if match:
+            logger.info(f"Empresa identificada por nombre de archivo: {match.company}")
+        return match.company if match else None
 
     def _identify_company_from_text(self, text: str) -> Optional[str]:
         """Identifica la empresa aseguradora presente en el contenido del texto."""
-        text_upper = text.upper()
-        for company, variations in self.INSURANCE_COMPANIES.items():
-            if any(variation.upper() in text_upper for variation in variations):
-                logger.info(f"Empresa identificada en el texto: {company}")
-                return company
-        return None
+        match = get_insurer_registry().match_text(text)
+        if match:
+            logger.info(f"Empresa identificada en el texto: {match.company}")
+        return match.company if match else None
 
     async def _extract_pdf_text(self, file) -> str:
         """
@@ -108,10 +97,10 @@ class SingleDocumentAgent:
     async def document_processor(self, state: DocumentValidationResponse) -> dict:
         structured_llm = self.primary_llm.with_structured_output(DocumentValidationDetails)
         logger.info(f"Document Processor Prompt: {state['valid_data']['enterprise']}")
-        system_instructions = DOCUMENT_PROCESSOR.format(
+        system_instructions = SINGLE_DOCUMENT_PROCESSOR_BUILDER.build(
             enterprise=state["valid_data"]["enterprise"],
             document_data=state["document_data"]
-        )
+        ).text
         result = structured_llm.invoke([
             SystemMessage(content=system_instructions),
             HumanMessage(
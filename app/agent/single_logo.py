@@ -1,3 +1,5 @@
+import asyncio
+import os
 from typing import List
 
 from fastapi import UploadFile
@@ -8,26 +10,44 @@ import io
 from PIL import Image
 import logging
 
-from app.agent.instructions.single import LOGO_DETECTION_PROMPT
+from app.agent.instructions.builder import PromptBuilder
+from app.agent.instructions.single import LOGO_DETECTION_PROMPT, LOGO_BATCH_DETECTION_PROMPT
 
-from app.agent.state.state import OverallState, LogoValidationDetails
-from app.agent.utils.pdf_utils import extract_pdf_text
+from app.agent.state.state import OverallState, LogoValidationDetails, LogoBatchValidationDetails
+from app.agent.utils.pdf_utils import extract_pdf_text, pdf_to_page_images
 from app.agent.utils.util import extract_name_enterprise
 from app.config.config import get_settings
+from app.service.document_store import document_file
 from app.providers.llm_manager import LLMConfig, LLMManager, LLMType
+from app.providers.policy import ResilientLLM
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Presupuesto de tokens de imagen por solicitud y máximo de páginas por lote
+LOGO_BATCH_TOKEN_BUDGET = int(os.getenv("LOGO_BATCH_TOKEN_BUDGET", 4500))
+LOGO_BATCH_MAX_PAGES = int(os.getenv("LOGO_BATCH_MAX_PAGES", 4))
+
+# Para el logotipo basta con el encabezado del texto, no el documento completo
+LOGO_DETECTION_BUILDER = PromptBuilder(LOGO_DETECTION_PROMPT, name="logo_detection",
+                                       budget=900, trim_order=["document_data"])
+LOGO_BATCH_DETECTION_BUILDER = PromptBuilder(LOGO_BATCH_DETECTION_PROMPT, name="logo_batch_detection",
+                                             budget=1000, trim_order=["document_data"])
+
 
 class SingleLogoAgent:
-    def __init__(self, settings=None):
+    def __init__(self, settings=None, batch_token_budget: int = LOGO_BATCH_TOKEN_BUDGET,
+                 max_batch_pages: int = LOGO_BATCH_MAX_PAGES):
         """Initialize LogoAgent with configuration settings.
 
         Args:
             settings: Optional application settings. If None, will load default settings.
+            batch_token_budget: Image tokens allowed per multimodal request.
+            max_batch_pages: Upper bound of pages packed in one request (1 disables batching).
         """
         self.settings = settings or get_settings()
+        self.batch_token_budget = batch_token_budget
+        self.max_batch_pages = max(max_batch_pages, 1)
         # Initialize LLM manager with compilation-specific configuration
         llm_config = LLMConfig(
             temperature=0.0,  # Use deterministic output for compilation
@@ -36,7 +56,7 @@ class SingleLogoAgent:
         )
         self.llm_manager = LLMManager(llm_config)
         # Get the primary LLM for report generation
-        self.primary_llm = self.llm_manager.get_llm(LLMType.GPT_4O_MINI)
+        self.primary_llm = ResilientLLM(self.llm_manager, LLMType.GPT_4O_MINI)
 
     @staticmethod
     async def pdf_to_base64_images(self, file: UploadFile) -> List[str]:
@@ -65,55 +85,112 @@ class SingleLogoAgent:
 
         return base64_images
 
+    def plan_batches(self, page_images: List[dict]) -> List[List[dict]]:
+        """Group consecutive pages so each request stays within the image token budget."""
+        batches: List[List[dict]] = []
+        current: List[dict] = []
+        current_tokens = 0
+        for page in page_images:
+            fits_budget = current_tokens + page["tokens"] <= self.batch_token_budget
+            if current and (not fits_budget or len(current) >= self.max_batch_pages):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(page)
+            current_tokens += page["tokens"]
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _verify_page(self, system_instructions: str, page: dict) -> LogoValidationDetails:
+        """Single-page request, used when batching is disabled or a batch misses a page."""
+        structured_llm = self.primary_llm.with_structured_output(LogoValidationDetails)
+        human_message = HumanMessage(
+            content=[
+                {
+                    "type": "text",
+                    "text": f"Identifica si hay logotipo en esta página {page['page_num']}. "  # Page number in prompt
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/png;base64,{page['base64']}"}
+                }
+            ]
+        )
+        response = await structured_llm.ainvoke([
+            SystemMessage(content=system_instructions),
+            human_message
+        ])
+        return self._to_page_detail(response, page["page_num"])
+
+    async def _verify_batch(self, system_instructions: str, batch_instructions: str,
+                            batch: List[dict]) -> List[LogoValidationDetails]:
+        """Packs several page images into one request and maps the answers back by page_num."""
+        if len(batch) == 1:
+            return [await self._verify_page(system_instructions, batch[0])]
+
+        page_nums = [page["page_num"] for page in batch]
+        content = [{
+            "type": "text",
+            "text": f"Identifica si hay logotipo y firma en cada una de las páginas {page_nums}."
+        }]
+        for page in batch:
+            content.append({"type": "text", "text": f"Página {page['page_num']}"})
+            content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/png;base64,{page['base64']}"}
+            })
+
+        structured_llm = self.primary_llm.with_structured_output(LogoBatchValidationDetails)
+        response = await structured_llm.ainvoke([
+            SystemMessage(content=batch_instructions),
+            HumanMessage(content=content)
+        ])
+        answers = {item.get("page_num"): item for item in (response or {}).get("pages") or []}
+
+        results = []
+        for page in batch:
+            answer = answers.get(page["page_num"])
+            if answer is None:
+                logger.warning(f"Batch response missed page {page['page_num']}, retrying it alone")
+                results.append(await self._verify_page(system_instructions, page))
+            else:
+                results.append(self._to_page_detail(answer, page["page_num"]))
+        return results
+
+    @staticmethod
+    def _to_page_detail(response: dict, page_num: int) -> LogoValidationDetails:
+        return LogoValidationDetails(
+            logo=response["logo"],
+            logo_status=response["logo_status"],
+            diagnostics=response["diagnostics"],
+            signature_status=response["signature_status"],
+            page_num=page_num
+        )
+
     async def verify_logo(self, state: OverallState) -> dict:
-        """Verify logos and store diagnosis per page."""
+        """Verify logos and store diagnosis per page, packing several pages per request."""
         try:
-            base64_images = await self.pdf_to_base64_images(self, state["file_logo"])
-            #logger.debug(f"Base64 images: {base64_images}")
-            logo_diagnosis_per_page: List[LogoValidationDetails] = []  # Change to PageLogoValidationDetails
+            file = document_file(state)
+            page_images = await pdf_to_page_images(file)
             try:
-                enterprise = await extract_name_enterprise(state["file_logo"])
+                enterprise = await extract_name_enterprise(file)
             except Exception as e:
                 enterprise = ""
-            document_data = await extract_pdf_text(state["file_logo"])
-
-            for page_num, base64_image in enumerate(base64_images, 1):
-                #logger.debug(f"Checking page {page_num} for logo")
-                structured_llm = self.primary_llm.with_structured_output(LogoValidationDetails)
-                system_instructions = LOGO_DETECTION_PROMPT.format(
-                    enterprise=enterprise,
-                    document_data=document_data
-                )
-
-                human_message = HumanMessage(
-                    content=[
-                        {
-                            "type": "text",
-                            "text": f"Identifica si hay logotipo en esta página {page_num}. "  # Page number in prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-                        }
-                    ]
-                )
-                response = structured_llm.invoke([
-                    SystemMessage(content=system_instructions),
-                    human_message
-                ])
-
-                # 2. Create PageLogoValidationDetails and append to list
-                page_logo_detail = LogoValidationDetails(  # Create PageLogoValidationDetails object
-                    logo=response["logo"],
-                    logo_status=response["logo_status"],
-                    diagnostics=response["diagnostics"],
-                    signature_status=response["signature_status"],
-                    page_num=page_num  # Add page_num here
-                )
-                logo_diagnosis_per_page.append(page_logo_detail)  # Append PageLogoValidationDetails
-            #state["enterprise"] = enterprise
-            state["logo_diagnosis"] = logo_diagnosis_per_page  # Store the list of PageLogoValidationDetails
-            return state
+            document_data = await extract_pdf_text(file)
+
+            prompt_values = {"enterprise": enterprise, "document_data": document_data}
+            system_instructions = LOGO_DETECTION_BUILDER.build(**prompt_values).text
+            batch_instructions = LOGO_BATCH_DETECTION_BUILDER.build(**prompt_values).text
+            batches = self.plan_batches(page_images)
+            logger.info(f"Logo detection: {len(page_images)} page(s) in {len(batches)} request(s)")
+
+            batch_results = await asyncio.gather(*[
+                self._verify_batch(system_instructions, batch_instructions, batch) for batch in batches
+            ])
+            logo_diagnosis_per_page: List[LogoValidationDetails] = [
+                page_detail for batch_result in batch_results for page_detail in batch_result
+            ]
+            return {"logo_diagnosis": logo_diagnosis_per_page}
 
         except Exception as e:
             logger.error(f"Error verifying logo: {str(e)}")
@@ -1,7 +1,6 @@
-from fastapi import UploadFile
 from pydantic import BaseModel, Field
 from typing import List, Optional, Annotated, Dict
-from typing_extensions import TypedDict
+from typing_extensions import NotRequired, TypedDict
 import operator
 
 class LogoValidationDetails(TypedDict):
@@ -12,6 +11,10 @@ class LogoValidationDetails(TypedDict):
     signature_status: bool
 
 
+class LogoBatchValidationDetails(TypedDict):
+    pages: List[LogoValidationDetails]  # Un elemento por página, identificado por page_num
+
+
 class SignatureMetadata(TypedDict):
     page_number: int
     signatures_found: int
@@ -39,6 +42,19 @@ class DocumentValidationDetails(TypedDict):
     date_of_issuance: str
     date_of_signature: str
     person_by_policy: PersonValidationDetails
+    constancia_number: NotRequired[Optional[str]]  # Lo completa la extracción determinista cuando lo encuentra
+
+
+class DocumentFields(TypedDict):
+    """Datos de la constancia que no dependen de la persona consultada."""
+    start_date_validity: str
+    end_date_validity: str
+    validity: str
+    policy_number: str
+    company: str
+    date_of_issuance: str
+    date_of_signature: str
+    constancia_number: Optional[str]
 
 
 class VerdictDetails(TypedDict):
@@ -105,12 +121,18 @@ class PageContent(TypedDict):
     person: str
     reference_date: str
     document_type: str
+    insured_match: NotRequired[Optional[dict]]  # Fila de la persona en el índice de asegurados
+    person_found: NotRequired[Optional[bool]]  # None si el índice no permite decidirlo
+
+
+def first_decision(current: Optional[dict], update: Optional[dict]) -> Optional[dict]:
+    """Reducer de early_exit: prevalece la primera sección que decidió."""
+    return current or update
 
 
 class OverallState(TypedDict):
-    file_signature: UploadFile
-    file_logo: UploadFile
-    file: UploadFile
+    document_digest: str  # SHA-256 del PDF en el almacén de documentos (serializable en el checkpoint)
+    filename: str
     page_contents: list[PageContent]
     page_diagnosis: Annotated[List[PageDiagnosis], operator.add]
     signature_diagnosis: list[SignatureValidationDetails]
@@ -120,6 +142,8 @@ class OverallState(TypedDict):
     worker: str
     worker_type: str
     user_date: Optional[str]
+    early_exit: Annotated[Optional[dict], first_decision]  # Regla y veredicto de la sección que decidió
+    skipped_pages: Annotated[List[int], operator.add]  # Secciones no validadas tras la decisión
 
 class PersonInfo(TypedDict):
     name: str
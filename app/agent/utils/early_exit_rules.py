@@ -0,0 +1,102 @@
+"""
+Reglas de terminación anticipada de la validación.
+
+Algunos veredictos de página deciden el documento: si la sección donde figura el
+asegurado tiene la vigencia vencida, o si ya lo aprobó, las demás secciones no
+pueden cambiar el resultado (solo contienen a otros asegurados). Las reglas de
+``EARLY_EXIT_RULES`` declaran qué resultados son decisivos y
+``decided_final_verdict`` arma el veredicto final sin el LLM cuando ya está
+decidido, también cuando ninguna sección encontró al asegurado.
+
+La coordinación entre las ramas de una ejecución está en ``app.workflow.early_exit``.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+from app.agent.state.state import FinalVerdictResponse, VerdictDetails, VerdictResponse
+
+logger = logging.getLogger(__name__)
+
+EARLY_EXIT_ENABLED = os.getenv("EARLY_EXIT_ENABLED", "true").lower() == "true"
+
+
+def _details(verdict: VerdictResponse) -> dict:
+    return verdict.get("details") or {}
+
+
+@dataclass(frozen=True)
+class EarlyExitRule:
+    """Resultado de página que decide el documento."""
+    name: str
+    decisive: Callable[[VerdictResponse], bool]
+
+
+EARLY_EXIT_RULES: Sequence[EarlyExitRule] = (
+    EarlyExitRule(
+        name="asegurado_con_vigencia_vencida",
+        decisive=lambda v: bool(_details(v).get("person_validation_passed"))
+                           and _details(v).get("validity_validation_passed") is False
+    ),
+    EarlyExitRule(
+        name="asegurado_aprobado",
+        decisive=lambda v: bool(_details(v).get("person_validation_passed")) and bool(v.get("verdict"))
+    ),
+)
+
+
+def decisive_rule(verdict: VerdictResponse, rules: Sequence[EarlyExitRule] = EARLY_EXIT_RULES) -> Optional[str]:
+    """Nombre de la primera regla que hace decisivo el veredicto, o None."""
+    if not EARLY_EXIT_ENABLED:
+        return None
+    return next((rule.name for rule in rules if rule.decisive(verdict)), None)
+
+
+def _any(items: List[dict], key: str) -> bool:
+    return any(item.get(key) for item in items or [])
+
+
+def decided_final_verdict(early_exit: Optional[dict], pages_verdicts: List[VerdictResponse],
+                          logo_diagnosis: List[dict], signature_diagnosis: List[dict],
+                          skipped_pages: List[int]) -> Optional[FinalVerdictResponse]:
+    """
+    Veredicto final cuando ya está decidido, sin llamar al LLM.
+
+    Returns:
+        El FinalVerdictResponse si hubo una decisión anticipada o ninguna sección
+        encontró al asegurado; None si el resumen debe hacerlo el LLM
+    """
+    logo_passed = _any(logo_diagnosis, "logo_status")
+    signature_passed = _any(logo_diagnosis, "signature_status") or _any(signature_diagnosis, "signature_status")
+    skipped = f" Secciones no validadas: {sorted(skipped_pages)}." if skipped_pages else ""
+
+    if early_exit:
+        page = early_exit["verdict"]
+        details = _details(page)
+        page_passed = bool(page.get("verdict"))
+        if not page_passed:
+            verdict = "false"
+        else:
+            verdict = "true" if logo_passed and signature_passed else "observado"
+        reason = f"Decidido en la sección {early_exit['page_num']} ({early_exit['rule']}): {page.get('reason')}"
+        validity_passed = bool(details.get("validity_validation_passed"))
+        person_passed = True
+    elif pages_verdicts and not any(_details(v).get("person_validation_passed") for v in pages_verdicts):
+        verdict = "false"
+        reason = "La persona no figura entre los asegurados de ninguna sección del documento."
+        validity_passed = _any([_details(v) for v in pages_verdicts], "validity_validation_passed")
+        person_passed = False
+    else:
+        return None
+
+    if verdict == "observado":
+        reason += " Falta el logotipo o la firma de la aseguradora."
+    return FinalVerdictResponse(
+        verdict=verdict,
+        reason=reason + skipped,
+        details=VerdictDetails(logo_validation_passed=logo_passed,
+                               validity_validation_passed=validity_passed,
+                               signature_validation_passed=signature_passed,
+                               person_validation_passed=person_passed)
+    )
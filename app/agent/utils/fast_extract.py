@@ -0,0 +1,248 @@
+"""
+Extracción determinista de campos para los formatos conocidos de cada aseguradora.
+
+Las constancias de las aseguradoras registradas repiten siempre
+las mismas anclas de texto ("VIGENCIA: 30/11/2023 AL 30/12/2023",
+"Póliza de Pensiones No. ...", "Lima, 31 de enero de 2024"), así que la mayoría
+de campos de ``DocumentValidationDetails`` se pueden leer con expresiones
+regulares precompiladas. Cada campo lleva su confianza; los que no alcanzan el
+umbral se dejan al LLM.
+"""
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from app.agent.state.state import DocumentValidationDetails
+from app.agent.utils.insured_index import InsuredIndex, InsuredMatch, build_insured_index
+from app.agent.utils.util import convertir_fecha_spanish_v2
+from app.agent.utils.verdict_rules import find_person
+from app.service.insurer_registry import get_insurer_registry
+
+logger = logging.getLogger(__name__)
+
+# Confianza por origen del valor
+LAYOUT_CONFIDENCE = 0.95  # patrón propio de la aseguradora
+GENERIC_CONFIDENCE = 0.85  # patrón genérico
+AMBIGUOUS_CONFIDENCE = 0.4  # varios candidatos distintos
+FAST_PATH_MIN_CONFIDENCE = 0.8
+
+_stats: Dict[str, int] = {"complete": 0, "partial": 0}
+_stats_lock = threading.Lock()
+
+# Campos del documento, independientes de la persona consultada
+DOCUMENT_FIELDS = ("start_date_validity", "end_date_validity", "date_of_issuance", "policy_number", "company")
+# Campos que deben quedar resueltos para no llamar al LLM
+REQUIRED_FIELDS = DOCUMENT_FIELDS + ("person_by_policy",)
+
+_DATE = r"(\d{2}/\d{2}/\d{4})"
+_LONG_DATE = r"(\d{1,2}\s+de\s+[a-záéíóú]+\s+del?\s+\d{4})"
+_FLAGS = re.IGNORECASE | re.MULTILINE
+
+GENERIC_PATTERNS: Dict[str, List[Pattern]] = {
+    "validity": [
+        re.compile(rf"vigencia\s*(?:del|:)?\s*{_DATE}\s*(?:al|hasta\s+el|-)\s*{_DATE}", _FLAGS),
+        re.compile(rf"desde\s+el\s+{_DATE}\s+hasta\s+el\s+{_DATE}", _FLAGS),
+    ],
+    "policy_number": [
+        re.compile(r"p[óo]liza(?:\s+de\s+[a-záéíóú]+)?\s*(?:n[°ºo]\.?|nro\.?|#|:)?\s*(\d[\d-]{5,}\d)", _FLAGS),
+    ],
+    "date_of_issuance": [
+        re.compile(rf"^\s*[a-záéíóúñ/ .]{{2,40}},\s*{_LONG_DATE}", _FLAGS),
+    ],
+    "constancia_number": [
+        re.compile(r"constancia\s*(?:n[°ºo]\.?|nro\.?|#)\s*:?\s*([A-Z0-9][A-Z0-9/-]{4,})", _FLAGS),
+    ],
+}
+
+# Anclas propias de cada aseguradora (se prueban antes que las genéricas)
+LAYOUT_PATTERNS: Dict[str, Dict[str, List[Pattern]]] = {
+    "MAPFRE": {
+        "validity": [re.compile(rf"con\s+vigencia\s+del\s+{_DATE}\s+hasta\s+el\s+{_DATE}", _FLAGS)],
+        "policy_number": [re.compile(r"P[óo]liza\s+de\s+Pensiones\s+No\.\s*(\d{6,})", _FLAGS)],
+        "date_of_issuance": [re.compile(rf"^{_DATE}\s+\d{{2}}:\d{{2}}:\d{{2}}\s*[ap]m", _FLAGS)],
+        "constancia_number": [re.compile(r"Nro\.\s*De\s+Constancia\s+(MP/\d{4}/\d+)", _FLAGS),
+                              re.compile(r"^\s*(MP/\d{4}/\d+)\s*$", _FLAGS)],
+    },
+    "LA POSITIVA": {
+        "validity": [re.compile(rf"^VIGENCIA\s*:\s*{_DATE}\s+AL\s+{_DATE}", _FLAGS)],
+        "policy_number": [re.compile(r"SCTR\s+(?:PENSIONES|SALUD)\s+P[óo]liza\s*#?\s*(\d{6,})", _FLAGS)],
+        "date_of_issuance": [re.compile(rf"^[^\n,]{{2,40}},\s*{_LONG_DATE}", _FLAGS)],
+    },
+    "PACIFICO": {
+        "policy_number": [re.compile(r"P[óo]liza\s*(?:N[°º]|Nro\.?)\s*:?\s*(\d{6,})", _FLAGS)],
+    },
+    "RIMAC": {
+        "policy_number": [re.compile(r"P[óo]liza\s*(?:N[°º]|Nro\.?)?\s*:?\s*(\d{4}-\d{5,}|\d{6,})", _FLAGS)],
+    },
+    "SANITAS": {
+        "policy_number": [re.compile(r"(?:P[óo]liza|Contrato)\s*(?:N[°º]|Nro\.?)?\s*:?\s*(\d{6,})", _FLAGS)],
+    },
+}
+
+
+@dataclass
+class FastExtraction:
+    """Campos leídos del texto y su confianza."""
+    insurer: Optional[str]
+    values: Dict[str, object] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+    insured: Optional[InsuredMatch] = None
+    person_found: Optional[bool] = None
+
+    def resolved(self, min_confidence: float = FAST_PATH_MIN_CONFIDENCE) -> Dict[str, object]:
+        """Campos cuya confianza alcanza el umbral."""
+        return {name: value for name, value in self.values.items()
+                if self.confidence.get(name, 0.0) >= min_confidence}
+
+    def missing(self, min_confidence: float = FAST_PATH_MIN_CONFIDENCE,
+                required: Tuple[str, ...] = REQUIRED_FIELDS) -> List[str]:
+        """Campos obligatorios que debe completar el LLM."""
+        resolved = self.resolved(min_confidence)
+        return [name for name in required if name not in resolved]
+
+    def details(self) -> DocumentValidationDetails:
+        """DocumentValidationDetails completo con los campos resueltos."""
+        resolved = self.resolved()
+        return DocumentValidationDetails(
+            start_date_validity=resolved.get("start_date_validity"),
+            end_date_validity=resolved.get("end_date_validity"),
+            validity=resolved.get("validity"),
+            policy_number=resolved.get("policy_number"),
+            company=resolved.get("company"),
+            date_of_issuance=resolved.get("date_of_issuance"),
+            date_of_signature=resolved.get("date_of_signature"),
+            person_by_policy=resolved.get("person_by_policy"),
+            constancia_number=resolved.get("constancia_number"),
+        )
+
+
+@dataclass
+class PersonLookup:
+    """Resultado de buscar a la persona en la tabla de asegurados de una sección."""
+    insured: Optional[InsuredMatch]
+    person_found: Optional[bool]
+    person_by_policy: Optional[dict]
+
+
+def locate_person(text: str, person: str, policy_number: Optional[str] = None,
+                  start_date: Optional[str] = None, insurer: Optional[str] = None,
+                  index: Optional[InsuredIndex] = None) -> PersonLookup:
+    """
+    Busca a la persona en la sección, sin volver a extraer los datos del documento.
+
+    Args:
+        index: Índice de asegurados de la sección ya construido (validación masiva); si no se
+            pasa, se construye a partir del texto
+
+    Returns:
+        PersonLookup; ``person_found`` es None cuando solo hay coincidencia aproximada
+        o no hay tabla reconocible, y entonces decide el LLM del veredicto
+    """
+    # La tabla de asegurados se indexa; sin tabla reconocible se busca en el texto completo
+    if index is None:
+        index = build_insured_index(text, policy_number, start_date)
+    insured = index.lookup(person) if index.rows else None
+    person_found = index.person_found(person) if index.rows else find_person(person, text)
+    person_by_policy = None
+    if person_found:
+        row = insured.insured if insured else None
+        person_by_policy = {"name": row.name if row else person,
+                            "policy_number": (row.policy_number if row else None) or policy_number,
+                            "company": insurer}
+    return PersonLookup(insured=insured, person_found=person_found, person_by_policy=person_by_policy)
+
+
+def _match(patterns: List[Pattern], text: str) -> List[Tuple[str, ...]]:
+    found: List[Tuple[str, ...]] = []
+    for pattern in patterns:
+        for match in pattern.finditer(text):
+            groups = tuple(g.strip() for g in match.groups())
+            if groups not in found:
+                found.append(groups)
+        if found:
+            break
+    return found
+
+
+def _field(insurer: Optional[str], name: str, text: str) -> Tuple[List[Tuple[str, ...]], float]:
+    """Candidatos de un campo y la confianza según el patrón que los encontró."""
+    layout = LAYOUT_PATTERNS.get(insurer or "", {}).get(name)
+    if layout:
+        found = _match(layout, text)
+        if found:
+            return found, LAYOUT_CONFIDENCE
+    found = _match(GENERIC_PATTERNS.get(name, []), text)
+    return found, GENERIC_CONFIDENCE if found else 0.0
+
+
+def extract_known_fields(text: str, insurer: Optional[str], person: str = "") -> FastExtraction:
+    """
+    Lee los campos de una constancia a partir de su capa de texto.
+
+    Args:
+        text: Texto de la página o sección
+        insurer: Aseguradora identificada (nombre en el registro de aseguradoras), si se conoce
+        person: Persona buscada (nombre o DNI), para ``person_by_policy``
+
+    Returns:
+        FastExtraction con los valores y su confianza por campo
+    """
+    insurer = (insurer or "").upper() or None
+    result = FastExtraction(insurer=insurer)
+
+    def put(name: str, value: object, confidence: float) -> None:
+        result.values[name] = value
+        result.confidence[name] = confidence
+
+    validity, confidence = _field(insurer, "validity", text)
+    if validity:
+        start, end = validity[0]
+        confidence = confidence if len(validity) == 1 else AMBIGUOUS_CONFIDENCE
+        put("start_date_validity", start, confidence)
+        put("end_date_validity", end, confidence)
+        put("validity", f"{start} AL {end}", confidence)
+
+    policies, confidence = _field(insurer, "policy_number", text)
+    if policies:
+        # Pensiones y salud suelen tener números distintos: se conservan todos
+        put("policy_number", ", ".join(p[0] for p in policies), confidence)
+
+    issuance, confidence = _field(insurer, "date_of_issuance", text)
+    if issuance:
+        dates = {convertir_fecha_spanish_v2(d[0]) for d in issuance}
+        if len(dates) == 1:
+            put("date_of_issuance", dates.pop(), confidence)
+        else:
+            put("date_of_issuance", convertir_fecha_spanish_v2(issuance[0][0]), AMBIGUOUS_CONFIDENCE)
+    put("date_of_signature", None, 0.0)
+
+    constancia, confidence = _field(insurer, "constancia_number", text)
+    if constancia:
+        put("constancia_number", constancia[0][0], confidence if len(constancia) == 1 else AMBIGUOUS_CONFIDENCE)
+
+    if insurer:
+        # Si el texto no nombra a la aseguradora identificada (p.ej. por el nombre del archivo), decide el LLM
+        variations = get_insurer_registry().variations(insurer)
+        named = any(variation.upper() in text.upper() for variation in variations)
+        put("company", insurer, LAYOUT_CONFIDENCE if named else AMBIGUOUS_CONFIDENCE)
+
+    if person:
+        lookup = locate_person(text, person, result.values.get("policy_number"),
+                               result.values.get("start_date_validity"), insurer)
+        result.insured, result.person_found = lookup.insured, lookup.person_found
+        if lookup.person_found is not None:
+            put("person_by_policy", lookup.person_by_policy, GENERIC_CONFIDENCE)
+
+    logger.debug(f"Fast path ({insurer}): {result.confidence}")
+    with _stats_lock:
+        _stats["partial" if result.missing(required=REQUIRED_FIELDS if person else DOCUMENT_FIELDS)
+               else "complete"] += 1
+    return result
+
+
+def fast_path_snapshot() -> Dict[str, int]:
+    """Extracciones resueltas solo con patrones frente a las completadas por el LLM."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,215 @@
+"""
+Índice de asegurados de una constancia, construido a partir de su capa de texto.
+
+La búsqueda de la persona no recorre la tabla: los DNI (y demás documentos) van
+a una tabla hash exacta y los nombres a claves normalizadas, sin tildes ni
+signos y con los tokens ordenados, de modo que "BENDEZÚ FLORES, HUGO ALEJANDRO"
+y "Hugo Alejandro Bendezu Flores" comparten clave. Para las filas con formato
+"APELLIDOS, NOMBRES" se indexa además la clave principal (primer apellido y
+primer nombre). Un índice invertido por token resuelve nombres parciales y
+acota el fallback aproximado (token a token) a las filas que comparten algún
+token con la persona.
+
+``person_context`` usa el mismo índice para recortar el texto que va al LLM:
+se conserva todo salvo las filas de la tabla alejadas de la persona.
+"""
+import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set
+
+from app.agent.utils.layout_segmenter import DOC_TYPE_PATTERN, is_insured_row
+from app.agent.utils.verdict_rules import DNI_PATTERN, FUZZY_TOKEN_RATIO, MIN_TOKEN_LENGTH
+from app.util.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_PATTERN = re.compile(r"\b\d{8,12}\b")
+DATE_PATTERN = re.compile(r"\b\d{2}/\d{2}/\d{4}\b")
+ORDINAL_PATTERN = re.compile(r"^\s*(\d{1,4})\s+|\s+(\d{1,4})\s*$")
+# Filas comparadas como máximo en el fallback aproximado
+MAX_FUZZY_CANDIDATES = 50
+# Filas vecinas que se conservan alrededor de la persona al recortar el contexto
+PRUNE_ROW_WINDOW = int(os.getenv("PRUNE_ROW_WINDOW", 2))
+OMITTED_ROWS = "[... {count} filas de asegurados omitidas ...]"
+
+EXACT_METHODS = ("document", "name", "tokens")
+
+
+@dataclass(frozen=True)
+class InsuredRow:
+    """Fila de la tabla de asegurados."""
+    row: Optional[int]
+    name: str
+    document: Optional[str]
+    policy_number: Optional[str]
+    start_date: Optional[str]
+
+
+@dataclass(frozen=True)
+class InsuredMatch:
+    """Resultado de buscar a la persona en el índice."""
+    insured: InsuredRow
+    method: str  # document, name, tokens o fuzzy
+    score: float
+
+    @property
+    def found(self) -> Optional[bool]:
+        """True si la coincidencia es exacta; None si es aproximada y debe confirmarla el LLM."""
+        return True if self.method in EXACT_METHODS else None
+
+    def as_dict(self) -> dict:
+        return {**asdict(self.insured), "method": self.method, "score": round(self.score, 3)}
+
+
+def name_tokens(name: str) -> List[str]:
+    """Tokens significativos del nombre, sin tildes ni signos."""
+    return [t for t in normalize_text(name).split() if len(t) >= MIN_TOKEN_LENGTH or t == "Ñ"]
+
+
+def name_key(name: str) -> str:
+    """Clave independiente del orden de nombres y apellidos."""
+    return " ".join(sorted(name_tokens(name)))
+
+
+def _principal_key(name: str) -> Optional[str]:
+    """Primer apellido y primer nombre de un "APELLIDOS, NOMBRES"."""
+    if "," not in name:
+        return None
+    surnames, given = (name_tokens(part) for part in name.split(",", 1))
+    return name_key(f"{surnames[0]} {given[0]}") if surnames and given else None
+
+
+def parse_row(line: str, policy_number: Optional[str] = None, start_date: Optional[str] = None) -> InsuredRow:
+    """Separa ordinal, documento, fecha de inicio y nombre de una fila."""
+    ordinal = ORDINAL_PATTERN.search(line)
+    document = DOCUMENT_PATTERN.search(line)
+    date = DATE_PATTERN.search(line)
+    name = ORDINAL_PATTERN.sub(" ", line)
+    name = DOC_TYPE_PATTERN.sub(" ", DATE_PATTERN.sub(" ", DOCUMENT_PATTERN.sub(" ", name.upper())))
+    return InsuredRow(
+        row=int(ordinal.group(1) or ordinal.group(2)) if ordinal else None,
+        name=" ".join(name.split()).strip(" ,"),
+        document=document.group(0) if document else None,
+        policy_number=policy_number,
+        start_date=date.group(0) if date else start_date
+    )
+
+
+@dataclass
+class InsuredIndex:
+    """Índice de las filas de asegurados de un texto."""
+    rows: List[InsuredRow] = field(default_factory=list)
+    by_document: Dict[str, InsuredRow] = field(default_factory=dict)
+    by_name: Dict[str, List[InsuredRow]] = field(default_factory=dict)
+    by_token: Dict[str, Set[int]] = field(default_factory=dict)
+
+    def add(self, insured: InsuredRow) -> None:
+        position = len(self.rows)
+        self.rows.append(insured)
+        if insured.document:
+            self.by_document.setdefault(insured.document, insured)
+        for key in filter(None, {name_key(insured.name), _principal_key(insured.name)}):
+            self.by_name.setdefault(key, []).append(insured)
+        for token in name_tokens(insured.name):
+            self.by_token.setdefault(token, set()).add(position)
+
+    def lookup(self, person: str) -> Optional[InsuredMatch]:
+        """
+        Busca a la persona por documento o nombre.
+
+        Returns:
+            La coincidencia (exacta o aproximada), o None si no figura
+        """
+        person = (person or "").strip()
+        if DNI_PATTERN.match(person) or person.isdigit():
+            insured = self.by_document.get(person)
+            return InsuredMatch(insured, "document", 1.0) if insured else None
+
+        key = name_key(person)
+        if not key:
+            return None
+        candidates = self.by_name.get(key, [])
+        if len(candidates) == 1:
+            return InsuredMatch(candidates[0], "name", 1.0)
+
+        tokens = key.split()
+        hits = Counter(position for token in tokens for position in self.by_token.get(token, ()))
+        full = sorted(position for position, count in hits.items() if count == len(tokens))
+        if full and len(tokens) >= 2:
+            insured = self.rows[full[0]]
+            return InsuredMatch(insured, "tokens", len(tokens) / len(name_tokens(insured.name)))
+
+        # Aproximado: cada token de la persona contra los de la fila, solo en filas que comparten
+        # algún token (o las primeras si ninguna lo comparte)
+        pool = sorted(hits) if hits else range(len(self.rows))
+        best: Optional[InsuredMatch] = None
+        for position in list(pool)[:MAX_FUZZY_CANDIDATES]:
+            insured = self.rows[position]
+            row_tokens = name_tokens(insured.name)
+            ratios = [max((SequenceMatcher(None, t, w).ratio() for w in row_tokens), default=0.0) for t in tokens]
+            if min(ratios) < FUZZY_TOKEN_RATIO and ratios.count(1.0) < 2:
+                continue
+            score = sum(ratios) / len(ratios)
+            if best is None or score > best.score:
+                best = InsuredMatch(insured, "fuzzy", score)
+        return best
+
+    def person_found(self, person: str) -> Optional[bool]:
+        """True si figura, None si solo coincide aproximadamente o no hay tabla, False si no figura."""
+        if not self.rows:
+            return None
+        match = self.lookup(person)
+        return match.found if match else False
+
+
+def build_insured_index(text: str, policy_number: Optional[str] = None,
+                        start_date: Optional[str] = None) -> InsuredIndex:
+    """Indexa las filas de asegurados presentes en el texto."""
+    index = InsuredIndex()
+    for line in (text or "").splitlines():
+        if is_insured_row(line):
+            index.add(parse_row(line, policy_number, start_date))
+    logger.debug(f"Insured index: {len(index.rows)} rows, {len(index.by_document)} documents")
+    return index
+
+
+def person_context(text: str, person: str, window: int = PRUNE_ROW_WINDOW) -> str:
+    """
+    Texto para el prompt con solo las filas de asegurados cercanas a la persona.
+
+    El encabezado, la vigencia, la póliza y el resto de líneas se conservan; las
+    filas omitidas se sustituyen por un marcador con su número. Sin coincidencia
+    no queda ninguna fila, porque el índice ya determinó que la persona no figura.
+    """
+    lines = (text or "").splitlines()
+    row_lines = [i for i, line in enumerate(lines) if is_insured_row(line)]
+    if len(row_lines) <= 2 * window + 1:
+        return text
+    index = InsuredIndex()
+    for i in row_lines:
+        index.add(parse_row(lines[i]))
+    match = index.lookup(person) if person else None
+    keep = set()
+    if match:
+        position = next(p for p, insured in enumerate(index.rows) if insured is match.insured)
+        keep.update(row_lines[max(position - window, 0):position + window + 1])
+
+    pruned: List[str] = []
+    omitted = 0
+    rows = set(row_lines)
+    for i, line in enumerate(lines):
+        if i in rows and i not in keep:
+            omitted += 1
+            continue
+        if omitted:
+            pruned.append(OMITTED_ROWS.format(count=omitted))
+            omitted = 0
+        pruned.append(line)
+    if omitted:
+        pruned.append(OMITTED_ROWS.format(count=omitted))
+    logger.debug(f"Person context: {len(keep)} of {len(row_lines)} insured rows kept")
+    return "\n".join(pruned)
@@ -0,0 +1,208 @@
+"""
+Segmentación local de constancias a partir de la disposición del texto.
+
+Reemplaza la llamada de segmentación al LLM: las palabras de cada página
+(``page.get_text("words")``) se agrupan en líneas visuales por su coordenada
+vertical y cada línea se clasifica en encabezado, línea de referencia, cuerpo,
+cabecera o fila de la tabla de asegurados, nota/descargo o bloque de firma.
+
+Cada sección emitida lleva el contexto del documento (encabezado, referencia,
+cuerpo y firmas, donde están la vigencia, la póliza y la fecha de emisión) más
+un tramo de la tabla de asegurados, de modo que las secciones se validan en
+paralelo y de forma independiente. Una tabla que continúa en la página
+siguiente se trata como una sola; un PDF con varias constancias (p.ej. salud y
+pensión) se separa en unidades, cada una con su propio contexto. Los descargos
+no se envían a validar.
+"""
+import asyncio
+import io
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import fitz
+from fastapi import UploadFile
+
+from app.util.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Filas de la tabla de asegurados por sección
+SEGMENT_MAX_ROWS = int(os.getenv("SEGMENT_MAX_ROWS", 25))
+# Fracción de la altura de la palabra para considerar que dos palabras están en la misma línea
+LINE_TOLERANCE = 0.5
+
+HEADER, REFERENCE, BODY, TABLE_HEADER, TABLE_ROW, DISCLAIMER, SIGNATURE = (
+    "header", "reference", "body", "table_header", "table_row", "disclaimer", "signature")
+
+TABLE_HEADER_WORDS = {"NRO", "NOMBRES", "APELLIDOS", "PATERNO", "MATERNO", "DOCUMENTO", "NRODOC", "TIPODOC",
+                      "ASEGURADO", "ASEGURADOS"}
+DOC_TYPE_PATTERN = re.compile(r"\b(?:DNI|CE|C\.E\.|PASAPORTE|PAS|CEX)\b")
+DOC_NUMBER_PATTERN = re.compile(r"\b\d{8,12}\b")
+ORDINAL_PATTERN = re.compile(r"^\d{1,4}\s+[A-ZÁÉÍÓÚÑ]")
+NOT_A_ROW_PATTERN = re.compile(r"p[óo]liza|contrato|ruc|vigencia|t\.[ps]\s*:", re.IGNORECASE)
+TITLE_PATTERN = re.compile(r"^\s*CONSTANCIA\b", re.IGNORECASE)
+REFERENCE_PATTERN = re.compile(r"^\s*ref(?:erencia)?\s*\.?\s*:", re.IGNORECASE)
+DISCLAIMER_PATTERN = re.compile(
+    r"^\s*(?:\*|nota\b)|no\s+se\s+brindar[áa]\s+cobertura|no\s+ampara|carecer[áa]\s+de\s+validez|"
+    r"sujet[oa]\s+a\s+la|puede\s+verificar\s+la\s+validez|cl[áa]usula", re.IGNORECASE)
+SIGNATURE_PATTERN = re.compile(
+    r"^[\s._-]{10,}$|\b(?:GERENTE|SUBGERENTE|JEFE|APODERADO|UNIDAD\s+DE|DIVISI[ÓO]N|FIRMA)\b", re.IGNORECASE)
+
+
+@dataclass
+class LayoutLine:
+    """Línea visual de una página."""
+    page: int
+    y: float
+    block: int
+    text: str
+    kind: str = BODY
+
+
+def _page_lines(page: "fitz.Page", page_num: int) -> List[LayoutLine]:
+    """Agrupa las palabras de la página en líneas según su posición vertical."""
+    words = page.get_text("words")  # (x0, y0, x1, y1, palabra, bloque, línea, nº)
+    words.sort(key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    rows: List[Tuple[float, float, List[tuple]]] = []
+    for word in words:
+        center, height = (word[1] + word[3]) / 2, word[3] - word[1]
+        if rows and abs(center - rows[-1][0]) <= LINE_TOLERANCE * max(height, rows[-1][1]):
+            rows[-1][2].append(word)
+        else:
+            rows.append((center, height, [word]))
+    lines = []
+    for center, _, row in rows:
+        row.sort(key=lambda w: w[0])
+        text = " ".join(w[4] for w in row).strip()
+        if text:
+            lines.append(LayoutLine(page=page_num, y=center, block=row[0][5], text=text))
+    return lines
+
+
+def is_insured_row(text: str) -> bool:
+    """Fila de la tabla de asegurados: número de documento junto al tipo de documento o al ordinal."""
+    if NOT_A_ROW_PATTERN.search(text) or not DOC_NUMBER_PATTERN.search(text):
+        return False
+    return bool(DOC_TYPE_PATTERN.search(text.upper()) or ORDINAL_PATTERN.match(text))
+
+
+def _is_table_header(text: str) -> bool:
+    words = set(normalize_text(text).split())
+    return len(words & TABLE_HEADER_WORDS) >= 2 and not DOC_NUMBER_PATTERN.search(text)
+
+
+def _is_continuation(text: str) -> bool:
+    """Nombre partido en varias líneas (o páginas) dentro de la tabla."""
+    words = text.split()
+    return len(words) <= 4 and not any(c.isdigit() for c in text) and text.upper() == text
+
+
+def split_documents(lines: List[LayoutLine]) -> List[List[LayoutLine]]:
+    """Separa las constancias de un mismo PDF: una página con título tras una tabla abre otra."""
+    units: List[List[LayoutLine]] = [[]]
+    has_rows = False
+    for page in dict.fromkeys(line.page for line in lines):
+        page_lines = [line for line in lines if line.page == page]
+        titled = any(TITLE_PATTERN.match(line.text) for line in page_lines)
+        if titled and has_rows:
+            units.append([])
+            has_rows = False
+        units[-1].extend(page_lines)
+        has_rows = has_rows or any(is_insured_row(line.text) for line in page_lines)
+    return [unit for unit in units if unit]
+
+
+def classify_lines(lines: List[LayoutLine]) -> List[LayoutLine]:
+    """Asigna a cada línea su tipo de sección, recorriendo la constancia en orden."""
+    in_table = False
+    seen_table = False
+    page = None
+    disclaimer_page = None
+    disclaimer_blocks = set()
+    for line in lines:
+        text = line.text
+        if line.page != page:
+            # La tabla puede continuar al inicio de la página siguiente
+            page, in_table = line.page, seen_table
+        if in_table and (is_insured_row(text) or _is_continuation(text)):
+            line.kind = TABLE_ROW
+            continue
+        in_table = False
+        if (line.page, line.block) in disclaimer_blocks or DISCLAIMER_PATTERN.search(text) or \
+                (disclaimer_page == line.page and not SIGNATURE_PATTERN.search(text)):
+            # Tras la tabla, las notas ocupan el resto de la página
+            line.kind = DISCLAIMER
+            disclaimer_blocks.add((line.page, line.block))
+            disclaimer_page = line.page if seen_table else None
+        elif _is_table_header(text):
+            line.kind = TABLE_HEADER
+            in_table = seen_table = True
+        elif is_insured_row(text):
+            line.kind = TABLE_ROW
+            in_table = seen_table = True
+        elif REFERENCE_PATTERN.match(text):
+            line.kind = REFERENCE
+        elif SIGNATURE_PATTERN.search(text):
+            line.kind = SIGNATURE
+        else:
+            line.kind = BODY if seen_table else HEADER
+    return lines
+
+
+def _rows(lines: List[LayoutLine]) -> List[str]:
+    """Filas de la tabla, uniendo las continuaciones a la fila anterior."""
+    rows: List[str] = []
+    for line in lines:
+        if line.kind != TABLE_ROW:
+            continue
+        if rows and not is_insured_row(line.text):
+            rows[-1] = f"{rows[-1]} {line.text}"
+        else:
+            rows.append(line.text)
+    return rows
+
+
+def build_sections(lines: List[LayoutLine], max_rows: int = SEGMENT_MAX_ROWS) -> List[str]:
+    """
+    Arma las secciones a validar: contexto del documento más un tramo de la tabla.
+
+    Returns:
+        Una sección por cada ``max_rows`` asegurados, o una sola con todo el
+        contexto si el documento no tiene tabla
+    """
+    by_kind: Dict[str, List[str]] = {}
+    for line in lines:
+        by_kind.setdefault(line.kind, []).append(line.text)
+    context = "\n".join(line.text for line in lines if line.kind in (HEADER, REFERENCE, BODY, SIGNATURE))
+    rows = _rows(lines)
+    if not rows:
+        return [context] if context else []
+
+    table_header = "\n".join(dict.fromkeys(by_kind.get(TABLE_HEADER, [])))
+    max_rows = max(max_rows, 1)
+    sections = []
+    for start in range(0, len(rows), max_rows):
+        table = "\n".join(filter(None, [table_header, *rows[start:start + max_rows]]))
+        sections.append(f"{context}\n\n{table}")
+    logger.debug(f"Layout segmentation: {len(rows)} insured rows in {len(sections)} sections, "
+                 f"{len(by_kind.get(DISCLAIMER, []))} disclaimer lines dropped")
+    return sections
+
+
+def segment_pdf_bytes(content: bytes, max_rows: int = SEGMENT_MAX_ROWS) -> List[str]:
+    """Segmenta un PDF en secciones; lista vacía si no tiene capa de texto (escaneado)."""
+    with fitz.open(stream=io.BytesIO(content), filetype="pdf") as pdf_document:
+        lines = [line for page_num, page in enumerate(pdf_document)
+                 for line in _page_lines(page, page_num)]
+    return [section for unit in split_documents(lines)
+            for section in build_sections(classify_lines(unit), max_rows)]
+
+
+async def segment_pdf_layout(file: UploadFile, max_rows: int = SEGMENT_MAX_ROWS) -> List[str]:
+    """Segmenta el PDF subido sin llamar al LLM, reiniciando el puntero del archivo."""
+    content = await file.read()
+    await file.seek(0)
+    return await asyncio.to_thread(segment_pdf_bytes, content, max_rows)
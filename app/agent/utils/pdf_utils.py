@@ -1,6 +1,7 @@
 import tempfile
 import os
 import io
+import math
 from typing import List
 import logging
 from fastapi import UploadFile
@@ -122,3 +123,40 @@ async def pdf_page_to_base64_image(file: UploadFile, page_num: int) -> str:
 
     await file.seek(0)
     return base64_image
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """
+    Estimate the input tokens a vision model bills for an image (OpenAI high detail).
+
+    The image is fitted into 2048x2048, its shortest side scaled to 768px and then
+    billed as 85 base tokens plus 170 tokens per 512px tile.
+    """
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+async def pdf_to_page_images(file: UploadFile) -> List[dict]:
+    """Render every PDF page as a base64 PNG along with its size and estimated token cost."""
+    page_images = []
+
+    content = await file.read()
+    with fitz.open(stream=io.BytesIO(content), filetype="pdf") as pdf_document:
+        for page_index in range(pdf_document.page_count):
+            pix = pdf_document[page_index].get_pixmap()
+            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG")
+            page_images.append({
+                "page_num": page_index + 1,
+                "base64": base64.b64encode(buffer.getvalue()).decode("utf-8"),
+                "tokens": estimate_image_tokens(pix.width, pix.height),
+            })
+
+    await file.seek(0)
+    return page_images
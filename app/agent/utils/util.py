@@ -11,42 +11,32 @@ import fitz
 import io
 from app.agent.utils.pdf_utils import extract_pdf_text, pdf_page_to_base64_image, pdf_to_base64_images, \
     extract_pdf_text_per_page
-from app.providers.llm import LLMType
-from app.providers.llm_manager import LLMManager
+from app.providers.llm_manager import LLMManager, LLMType
+from app.providers.policy import ResilientLLM
+from app.service.insurer_registry import DEFAULT_INSURERS, InsurerMatch, get_insurer_registry
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Lista de empresas aseguradoras conocidas
-INSURANCE_COMPANIES = {
-    "MAPFRE": ["MAPFRE", "MAPFRE PERU"],
-    "PACIFICO": ["PACIFICO", "PACIFICO SEGUROS", "PACIFICO EPS"],
-    "RIMAC": ["RIMAC", "RIMAC SEGUROS"],
-    "SANITAS": ["SANITAS", "SANITAS PERU"],
-    "LA POSITIVA": ["LA POSITIVA", "LA POSITIVA VIDA"]
-}
+# Aseguradoras por defecto; las vigentes están en el registro (app.service.insurer_registry)
+INSURANCE_COMPANIES = DEFAULT_INSURERS
 
 
-def _identify_company_from_filename(filename: str) -> Optional[str]:
-    """Identifica la empresa aseguradora a partir del nombre del archivo."""
-    clean_filename = re.sub(r'\.[^.]+$', '', filename.upper())
-    clean_filename = re.sub(r'[^A-Z0-9\s]', ' ', clean_filename)
-
-    for company, variations in INSURANCE_COMPANIES.items():
-        if any(variation.upper() in clean_filename for variation in variations):
-            logger.info(f"Empresa identificada por nombre de archivo: {company}")
-            return company
-    return None
+async def _first_page_text(file: UploadFile) -> str:
+    """Texto de la primera página, reiniciando el puntero del archivo."""
+    content = await file.read()
+    await file.seek(0)
+    with fitz.open(stream=io.BytesIO(content), filetype="pdf") as pdf_document:
+        return pdf_document[0].get_text() if pdf_document.page_count else ""
 
 
-def _identify_company_from_text(text: str) -> Optional[str]:
-    """Identifica la empresa aseguradora presente en el contenido del texto."""
-    text_upper = text.upper()
-    for company, variations in INSURANCE_COMPANIES.items():
-        if any(variation.upper() in text_upper for variation in variations):
-            logger.info(f"Empresa identificada en el texto: {company}")
-            return company
-    return None
+async def identify_insurer(file: UploadFile) -> Optional[InsurerMatch]:
+    """Aseguradora del PDF según el nombre del archivo y la primera página."""
+    first_page = await _first_page_text(file)
+    match = get_insurer_registry().identify(file.filename, first_page)
+    if match:
+        logger.info(f"Empresa identificada ({match.source}, {match.confidence}): {match.company}")
+    return match
 
 
 async def extract_name_enterprise(file: UploadFile) -> str:
@@ -55,13 +45,8 @@ async def extract_name_enterprise(file: UploadFile) -> str:
         if not file:
             raise ValueError("No se encontró el archivo en el estado.")
 
-        company = _identify_company_from_filename(file.filename)
-
-        if not company:
-            full_text = await extract_pdf_text(file)
-            company = _identify_company_from_text(full_text)
-
-        return company
+        match = await identify_insurer(file)
+        return match.company if match else None
 
     except Exception as e:
         raise ValueError(f"Error extracting text and metadata: {e}")
@@ -70,7 +55,7 @@ async def extract_name_enterprise(file: UploadFile) -> str:
 async def semantic_segment_pdf_with_llm(file: UploadFile, llm_manager: LLMManager) -> List[str]:
     """Semantically segments a specific page of a PDF document using a multimodal LLM."""
     base64_image = await pdf_to_base64_images(file)  # Convert PDF page to base64
-    primary_llm = llm_manager.get_llm(LLMType.GPT_4O_MINI)
+    primary_llm = ResilientLLM(llm_manager, LLMType.GPT_4O_MINI)
 
     segmentation_prompt = """
     Analyze the image of the PDF page and segment it into logical, semantically distinct sections.
@@ -135,7 +120,7 @@ async def semantic_segment_pdf_with_llm_v2(file: UploadFile, llm_manager: LLMMan
     base64_image = await pdf_to_base64_images(file)  # Convert PDF page to base64
     #print(f"base64_image: {base64_image}")
     extracted_text = await extract_pdf_text(file)
-    primary_llm = llm_manager.get_llm(LLMType.GPT_4O_MINI)
+    primary_llm = ResilientLLM(llm_manager, LLMType.GPT_4O_MINI)
 
     segmentation_prompt = """
     Analyze the following compiled text {compiled_text_document} representing an entire PDF document, which was extracted page by page using an LLM. Now, perform semantic segmentation on this **compiled text** to divide it into logical, semantically distinct sections that may span **across multiple original pages**.
@@ -191,7 +176,7 @@ async def semantic_segment_pdf_with_llm_v3(file: UploadFile, llm_manager: LLMMan
     """Semantically segments a specific page of a PDF document using a multimodal LLM."""
     base64_image = await pdf_to_base64_images(file)  # Convert PDF page to base64
     extracted_text = await extract_pdf_text(file)
-    primary_llm = llm_manager.get_llm(LLMType.GPT_4O_MINI)
+    primary_llm = ResilientLLM(llm_manager, LLMType.GPT_4O_MINI)
 
     segmentation_prompt = """
     Analyze the image of the PDF page and segment it into logical, semantically distinct sections.
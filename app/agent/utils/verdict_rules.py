@@ -0,0 +1,154 @@
+"""
+Reglas deterministas para el veredicto de una página.
+
+Cada regla declara qué detalle del ``VerdictResponse`` afecta, cómo se evalúa a
+partir de los hechos de la página y la plantilla del motivo cuando se incumple.
+Una regla devuelve ``True`` si se incumple, ``False`` si se cumple y ``None``
+si con los datos disponibles no se puede decidir. Solo cuando todas las reglas
+quedan decididas se emite el veredicto sin llamar al LLM.
+"""
+import logging
+import re
+import threading
+from dataclasses import dataclass, asdict
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Sequence
+
+from app.agent.state.state import VerdictResponse, VerdictPageDetails
+from app.util.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+DNI_PATTERN = re.compile(r"^\d{8}$")
+# Similitud mínima para considerar que un token del nombre aparece con errores de tipeo
+FUZZY_TOKEN_RATIO = 0.8
+MIN_TOKEN_LENGTH = 3
+
+_stats: Dict[str, int] = {"determined": 0, "ambiguous": 0}
+_stats_lock = threading.Lock()
+
+
+@dataclass
+class PageFacts:
+    """Hechos deterministas de una página, entrada de las reglas."""
+    page_num: int
+    person: str
+    policy_number: Optional[str]
+    end_date_validity: Optional[str]
+    date_of_issuance: Optional[str]
+    reference_date: Optional[str]
+    validation_passed: Optional[bool]
+    validity_passed: Optional[bool]
+    person_found: Optional[bool]
+
+
+def find_person(person: str, page_content: str) -> Optional[bool]:
+    """
+    Busca a la persona en el texto de la página.
+
+    Los tokens del nombre deben coincidir en una misma línea (una fila de la tabla de
+    asegurados): en una tabla grande, un nombre y un apellido sueltos en filas distintas
+    no identifican a nadie.
+
+    Returns:
+        True si aparece (DNI exacto, o nombre y apellido en la misma línea), False si ningún
+        token del nombre aparece ni siquiera aproximadamente, None si es dudoso
+    """
+    person = (person or "").strip()
+    if not person:
+        return None
+    if DNI_PATTERN.match(person):
+        return person in re.sub(r"\D+", " ", page_content or "").split()
+
+    tokens = [t for t in normalize_text(person).split() if len(t) >= MIN_TOKEN_LENGTH]
+    if not tokens:
+        return None
+    lines = [set(normalize_text(line).split()) for line in (page_content or "").splitlines()]
+    required = min(2, len(tokens))
+    if any(sum(t in line for t in tokens) >= required for line in lines):
+        return True
+    words = set().union(*lines)
+    if any(t in words for t in tokens):
+        return None
+    fuzzy = any(SequenceMatcher(None, t, w).ratio() >= FUZZY_TOKEN_RATIO
+                for t in tokens for w in words if abs(len(w) - len(t)) <= 2)
+    return None if fuzzy else False
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Regla declarativa del veredicto de página."""
+    name: str
+    detail: str  # Campo de VerdictPageDetails que invalida
+    violated: Callable[[PageFacts], Optional[bool]]
+    reason: str  # Plantilla con los campos de PageFacts
+
+
+VERDICT_RULES: Sequence[Rule] = (
+    Rule(
+        name="vigencia_vencida",
+        detail="validity_validation_passed",
+        violated=lambda f: None if f.validity_passed is None else not f.validity_passed,
+        reason="La vigencia terminó el {end_date_validity}, antes de la fecha de referencia {reference_date}."
+    ),
+    Rule(
+        name="emision_posterior_a_vigencia",
+        detail="validity_validation_passed",
+        violated=lambda f: None if f.validation_passed is None else not f.validation_passed,
+        reason="La fecha de emisión {date_of_issuance} es posterior al fin de vigencia {end_date_validity}."
+    ),
+    Rule(
+        name="poliza_ausente",
+        detail="policy_validation_passed",
+        violated=lambda f: not (f.policy_number or "").strip(),
+        reason="No se encontró un número de póliza en la página {page_num}."
+    ),
+    Rule(
+        name="persona_no_encontrada",
+        detail="person_validation_passed",
+        violated=lambda f: None if f.person_found is None else not f.person_found,
+        reason="{person} no figura en la página {page_num}."
+    ),
+)
+
+APPROVED_REASON = ("Página {page_num}: vigencia hasta {end_date_validity} válida a la fecha de referencia "
+                   "{reference_date}, póliza {policy_number} presente y {person} figura entre los asegurados.")
+
+
+def evaluate_rules(facts: PageFacts, rules: Sequence[Rule] = VERDICT_RULES) -> Optional[VerdictResponse]:
+    """
+    Aplica las reglas a los hechos de una página.
+
+    Returns:
+        El VerdictResponse cuando todas las reglas quedan decididas, None si la
+        página es ambigua y debe resolverla el LLM
+    """
+    outcomes = {rule.name: rule.violated(facts) for rule in rules}
+    if any(outcome is None for outcome in outcomes.values()):
+        with _stats_lock:
+            _stats["ambiguous"] += 1
+        return None
+
+    values = {k: ("hoy" if k == "reference_date" and v is None else v) for k, v in asdict(facts).items()}
+    details = VerdictPageDetails(validity_validation_passed=True, policy_validation_passed=True,
+                                 person_validation_passed=True)
+    reasons: List[str] = []
+    for rule in rules:
+        if outcomes[rule.name]:
+            details[rule.detail] = False
+            reasons.append(rule.reason.format(**values))
+
+    with _stats_lock:
+        _stats["determined"] += 1
+    return VerdictResponse(
+        verdict=not reasons,
+        reason=" ".join(reasons) if reasons else APPROVED_REASON.format(**values),
+        details=details,
+        page_num=facts.page_num
+    )
+
+
+def rules_snapshot() -> Dict[str, int]:
+    """Páginas resueltas por las reglas frente a las enviadas al LLM."""
+    with _stats_lock:
+        return dict(_stats)
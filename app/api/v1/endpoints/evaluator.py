@@ -1,10 +1,15 @@
+import asyncio
+import json
 import tempfile
+import uuid
 from datetime import datetime
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import re
 
 import cv2
-from fastapi import FastAPI, UploadFile, File, HTTPException, APIRouter, Depends, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, APIRouter, Depends, Form, Header, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy import desc
 from sqlalchemy.orm import Session
 import fitz
@@ -12,14 +17,17 @@ import numpy as np
 from app.agent.evaluator import DocumentValidatorAgent
 from app.agent.loader import extract_text_with_pypdfloader
 from app.agent.state.state import DocumentValidationResponse, OverallState
+from app.service.document_store import get_document_store
+from app.service.job_queue import DONE, FAILED, QUEUED, WebhookRejectedError, check_webhook_url, get_job_queue
+from app.service.validation_cache import CachedValidation, get_validation_cache
 from app.agent.tools.tools import find_signature_bounding_boxes
 from app.config.database import get_db
 import os
 import logging
 from langchain_community.document_loaders import PyPDFLoader
 
-from app.workflow.diagnosis_graph import diagnosis_graph
-from app.workflow.document_graph import document_graph
+from app.workflow.bulk import BULK_MAX_WORKERS, get_bulk_validator
+from app.workflow.registry import get_graph_registry, validation_thread_id
 
 logger = logging.getLogger(__name__)
 
@@ -254,16 +262,175 @@ async def extract_pdf_text(file: UploadFile) -> str:
         await file.seek(0)
 
 
+def _normalize_worker(value: str) -> Tuple[str, str]:
+    """
+    Normalizes a person name or DNI.
+
+    Returns:
+        (normalized value, "dni" | "name")
+    """
+    input_value = value.strip()
+    if not input_value:
+        raise HTTPException(
+            status_code=400,
+            detail="Person name or DNI is required"
+        )
+
+    # Determine if the input is a DNI (8 digits) or a name
+    if re.match(r'^\d{8}$', input_value):
+        # Store the DNI directly
+        logger.info(f"Identified input as DNI: {input_value}")
+        return input_value, "dni"
+    # Format as name - convert to uppercase and normalize spaces
+    normalized_value = " ".join(input_value.upper().split())
+    logger.info(f"Identified input as name: {normalized_value}")
+    return normalized_value, "name"
+
+
+def _normalize_user_date(user_date: Optional[str]) -> Optional[str]:
+    """Reference date of a form; an empty field means today (None)."""
+    return (user_date or "").strip() or None
+
+
+def _validation_job(digest: str, filename: str, worker: str, worker_type: str, user_date: str,
+                    page_concurrency: int, pages_per_batch: int) -> dict:
+    """Serializable description of one validation (the job queue stores it as is)."""
+    configurable = {key: value for key, value in
+                    {"page_concurrency": page_concurrency, "pages_per_batch": pages_per_batch}.items()
+                    if value is not None}
+    return {"document_digest": digest, "filename": filename, "worker": worker, "worker_type": worker_type,
+            "user_date": _normalize_user_date(user_date), "configurable": configurable}
+
+
+def _validation_state(job: dict) -> Tuple[OverallState, str]:
+    """Initial graph state of a job and its checkpoint thread."""
+    state = OverallState(document_digest=job["document_digest"],
+                         filename=job["filename"],
+                         worker=job["worker"],
+                         worker_type=job["worker_type"],
+                         user_date=job["user_date"])
+    # Un reintento de la misma validación reanuda desde el último nodo completado
+    thread_id = validation_thread_id(job["document_digest"], job["worker"], job["worker_type"], job["user_date"])
+    return state, thread_id
+
+
+async def run_validation(job: dict) -> dict:
+    """
+    Runs the diagnosis graph for a stored document and formats the response.
+
+    Args:
+        job: Output of ``_validation_job``
+
+    Returns:
+        Dict containing complete validation results
+    """
+    return (await _cached_validation(job)).result
+
+
+async def finish_validation_job(job: dict) -> None:
+    """Releases the stored document of a job that will not run again."""
+    holder = job["payload"].get("document_holder")
+    if holder:
+        get_document_store().release(holder)
+
+
+def _release_document(holder: str, thread_id: str) -> None:
+    """Releases a request's hold on its document once the shared run of the validation ends."""
+    running = get_validation_cache().in_flight(thread_id)
+    if running is None or running.done():
+        get_document_store().release(holder)
+    else:
+        # El cliente se fue pero la ejecución compartida sigue leyendo el documento
+        running.add_done_callback(lambda _: get_document_store().release(holder))
+
+
+async def _cached_validation(job: dict, progress: Optional[asyncio.Queue] = None,
+                             holder: Optional[str] = None) -> CachedValidation:
+    """
+    Validation result shared by identical requests: cached, in flight or run now.
+
+    Args:
+        progress: When given and this request runs the graph, receives ``(event, data)`` for each
+            completed node (see ``_progress_events``)
+        holder: Document hold of the request, released when the validation no longer needs it
+    """
+    state, thread_id = _validation_state(job)
+
+    async def execute() -> dict:
+        if progress is None:
+            result = await get_graph_registry().run("diagnosis", state, thread_id, job.get("configurable"))
+            return validation_response(thread_id, result)
+        result = None
+        async for mode, chunk in get_graph_registry().stream("diagnosis", state, thread_id,
+                                                             job.get("configurable")):
+            if mode == "values":
+                result = chunk
+                continue
+            for node, update in chunk.items():
+                for event in _progress_events(node, update):
+                    progress.put_nowait(event)
+        return validation_response(thread_id, result)
+
+    # El thread es la huella de la petición: documento, persona normalizada y fecha de referencia
+    try:
+        return await get_validation_cache().get_or_run(thread_id, execute)
+    finally:
+        if holder:
+            _release_document(holder, thread_id)
+
+
+def validation_response(thread_id: str, result: dict) -> dict:
+    """Formats the final state of the diagnosis graph."""
+    return {
+        "thread_id": thread_id,
+        "total_pages": len(result["page_diagnosis"]),
+        "pages": [
+            {
+                "page_number": page_content["page_num"],
+                "diagnostics": {
+                    "valid_info": page_content["valid_info"],
+                }
+            }
+            for i, page_content in enumerate(result["page_diagnosis"])
+        ],
+        "observations": [
+            {
+                "page_number": page_verdict["page_num"],
+                "verdict": page_verdict["verdict"],
+                "reason": page_verdict["reason"],
+                "details": page_verdict["details"]
+            }
+            for page_verdict in result["pages_verdicts"]
+        ],
+        "signatures": result["signature_diagnosis"],
+        "validation_images": result["logo_diagnosis"],
+        "final_verdict": result["final_verdict"],
+        # Secciones que no se validaron porque otra ya decidió el documento
+        "skipped_pages": sorted(result.get("skipped_pages") or []),
+        "early_exit": result.get("early_exit")
+    }
+
+
 @router.post("/v2/validate", response_model=dict)
 async def validate_document(
         file: UploadFile = File(...),
         person_name: str = Form(...),
         user_date: str = Form(None),
+        page_concurrency: int = Form(None),
+        pages_per_batch: int = Form(None),
+        if_none_match: str = Header(None),
         db: Session = Depends(get_db),
 ):
     """
     Validates a PDF document using the complete validation workflow.
 
+    ``page_concurrency`` caps the sections validated at once and ``pages_per_batch`` groups
+    sections per subgraph run; both default to the service configuration.
+
+    Identical requests (same PDF, person and reference date) share one execution while it runs
+    and then get the cached result; the response carries an ``ETag`` and a matching
+    ``If-None-Match`` returns 304.
+
     Args:
         file: PDF file to validate
         db: Database session
@@ -282,68 +449,20 @@ async def validate_document(
             )
 
         # Validate and normalize person_name
-        input_value = person_name.strip()
-        if not input_value:
-            raise HTTPException(
-                status_code=400,
-                detail="Person name or DNI is required"
-            )
-
-        # Determine if the input is a DNI (8 digits) or a name
-        is_dni = bool(re.match(r'^\d{8}$', input_value))
-
-        # Different formatting based on type
-        if is_dni:
-            # Store the DNI directly
-            input_type = "dni"
-            normalized_value = input_value
-            logger.info(f"Identified input as DNI: {normalized_value}")
-        else:
-            # Format as name - convert to uppercase and normalize spaces
-            input_type = "name"
-            normalized_value = " ".join(input_value.upper().split())
-            logger.info(f"Identified input as name: {normalized_value}")
+        normalized_value, input_type = _normalize_worker(person_name)
 
         # Execute workflow
         logger.info(f"Starting document validation: {file.filename}")
 
-        state = OverallState(file_signature=file,
-                             file_logo=file,
-                             file=file,
-                             worker=normalized_value,
-                             worker_type=input_type,
-                             user_date=user_date)
-        component = diagnosis_graph.compile()
-        result = await component.ainvoke(state)
-        #print(f"result: {result}")
-
-        # Format response
-        response = {
-            "total_pages": len(result["page_diagnosis"]),
-            "pages": [
-                {
-                    "page_number": page_content["page_num"],
-                    "diagnostics": {
-                        "valid_info": page_content["valid_info"],
-                    }
-                }
-                for i, page_content in enumerate(result["page_diagnosis"])
-            ],
-            "observations": [
-                {
-                    "page_number": page_verdict["page_num"],
-                    "verdict": page_verdict["verdict"],
-                    "reason": page_verdict["reason"],
-                    "details": page_verdict["details"]
-                }
-                for page_verdict in result["pages_verdicts"]
-            ],
-            #"signatures": result["signature_diagnosis"],
-            "validation_images": result["logo_diagnosis"],
-            "final_verdict": result["final_verdict"]
-        }
-
-        return response
+        holder = uuid.uuid4().hex
+        digest = get_document_store().put(await file.read(), holder=holder)
+        job = _validation_job(digest, file.filename, normalized_value, input_type, user_date,
+                              page_concurrency, pages_per_batch)
+        cached = await _cached_validation(job, holder=holder)
+        headers = {"ETag": cached.etag, "X-Validation-Cache": cached.source}
+        if if_none_match and cached.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=jsonable_encoder(cached.result), headers=headers)
 
     except Exception as e:
         logger.error(f"Error in document validation: {str(e)}")
@@ -351,3 +470,235 @@ async def validate_document(
             status_code=500,
             detail=f"Error processing document: {str(e)}"
         )
+
+
+@router.post("/v2/validate/bulk")
+async def validate_document_bulk(
+        file: UploadFile = File(...),
+        workers: List[str] = Form(...),
+        user_date: str = Form(None),
+):
+    """
+    Validates one PDF for many workers, streaming one NDJSON line per worker as it completes.
+
+    The document is segmented and extracted once; each worker is then resolved against the
+    insured index of every section. ``workers`` may be repeated and each value may hold one
+    name or DNI per line. The first line describes the document and the last one counts the
+    verdicts; a worker that fails gets a line with ``error`` instead of ``final_verdict``.
+
+    Args:
+        file: PDF file to validate
+        workers: Person names or DNIs
+        user_date: Reference date (dd/mm/yyyy), today when omitted
+
+    Returns:
+        application/x-ndjson stream
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400,
+            detail="Only PDF files are accepted"
+        )
+    entries = [line for value in workers for line in value.splitlines() if line.strip()]
+    if not entries:
+        raise HTTPException(
+            status_code=400,
+            detail="At least one person name or DNI is required"
+        )
+    if len(entries) > BULK_MAX_WORKERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BULK_MAX_WORKERS} workers per request"
+        )
+    normalized = [_normalize_worker(entry) for entry in entries]
+    user_date = _normalize_user_date(user_date)
+
+    holder = uuid.uuid4().hex
+    try:
+        digest = get_document_store().put(await file.read(), holder=holder)
+        validator = get_bulk_validator()
+        # Todo lo que se lee del documento se lee aquí: después ya no se necesita
+        document = await validator.prepare(digest, file.filename)
+    except Exception as e:
+        logger.error(f"Error in bulk document validation: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing document: {str(e)}"
+        )
+    finally:
+        get_document_store().release(holder)
+    logger.info(f"Starting bulk validation: {file.filename} for {len(normalized)} workers")
+
+    async def lines():
+        async for line in validator.stream(document, normalized, user_date):
+            yield json.dumps(jsonable_encoder(line), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/v2/jobs", status_code=202)
+async def submit_validation_job(
+        file: UploadFile = File(...),
+        person_name: str = Form(...),
+        user_date: str = Form(None),
+        page_concurrency: int = Form(None),
+        pages_per_batch: int = Form(None),
+        webhook_url: str = Form(None),
+):
+    """
+    Queues a validation and returns its job id without waiting for the graph run.
+
+    The result is available at ``/v2/jobs/{job_id}/result`` and, when ``webhook_url`` is
+    given, POSTed there as ``{"job_id", "status", "result", "error"}`` once the job ends.
+    The webhook host must be in ``JOB_WEBHOOK_ALLOWED_HOSTS`` or, when that is unset,
+    resolve only to public addresses.
+
+    Returns:
+        Dict with the job id and its status
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400,
+            detail="Only PDF files are accepted"
+        )
+    if webhook_url:
+        try:
+            await check_webhook_url(webhook_url)
+        except WebhookRejectedError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=str(e)
+            )
+    normalized_value, input_type = _normalize_worker(person_name)
+    # El trabajo retiene su documento hasta que termina (ver finish_validation_job)
+    holder = uuid.uuid4().hex
+    digest = get_document_store().put(await file.read(), holder=holder)
+    job = _validation_job(digest, file.filename, normalized_value, input_type, user_date,
+                          page_concurrency, pages_per_batch)
+    job["document_holder"] = holder
+    try:
+        job_id = await get_job_queue().submit(job, webhook_url)
+    except Exception:
+        get_document_store().release(holder)
+        raise
+    logger.info(f"Queued validation job {job_id}: {file.filename}")
+    return {"job_id": job_id, "status": QUEUED}
+
+
+async def _get_job(job_id: str) -> dict:
+    job = await get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/v2/jobs/{job_id}")
+async def get_validation_job(job_id: str):
+    """Status of a queued validation."""
+    job = await _get_job(job_id)
+    return {key: job[key] for key in ("id", "status", "attempts", "error", "webhook_status",
+                                      "created_at", "started_at", "finished_at")}
+
+
+@router.get("/v2/jobs/{job_id}/result")
+async def get_validation_job_result(job_id: str):
+    """Result of a finished validation; 409 while it is still queued or running."""
+    job = await _get_job(job_id)
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=f"Error processing document: {job['error']}")
+    if job["status"] != DONE:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}")
+    return job["result"]
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def _progress_events(node: str, update: dict) -> List[Tuple[str, dict]]:
+    """SSE events for the update of one diagnosis graph node."""
+    update = update or {}
+    if node == "extract_pages_content":
+        pages = update.get("page_contents") or []
+        return [("sections", {"total_pages": len(pages),
+                              "enterprise": pages[0]["enterprise"] if pages else None})]
+    if node == "logo_detection":
+        return [("logo", {"validation_images": update.get("logo_diagnosis")})]
+    if node == "detect_signatures":
+        return [("signatures", {"signatures": update.get("signature_diagnosis")})]
+    if node == "validate_page":
+        valid_info = {page["page_num"]: page["valid_info"] for page in update.get("page_diagnosis") or []}
+        events = [("page", {"page_number": verdict["page_num"],
+                            "verdict": verdict["verdict"],
+                            "reason": verdict["reason"],
+                            "details": verdict["details"],
+                            "valid_info": valid_info.get(verdict["page_num"])})
+                  for verdict in update.get("pages_verdicts") or []]
+        if update.get("skipped_pages"):
+            events.append(("skipped", {"pages": sorted(update["skipped_pages"]),
+                                       "early_exit": update.get("early_exit")}))
+        return events
+    if node == "compile_verdict":
+        return [("final_verdict", update.get("final_verdict"))]
+    return []
+
+
+@router.post("/v2/validate/stream")
+async def validate_document_stream(
+        file: UploadFile = File(...),
+        person_name: str = Form(...),
+        user_date: str = Form(None),
+        page_concurrency: int = Form(None),
+        pages_per_batch: int = Form(None),
+):
+    """
+    Streaming variant of ``/v2/validate``: Server-Sent Events as each graph node completes.
+
+    Events, in completion order: ``sections`` (segmentation done), ``logo``, ``signatures``, one
+    ``page`` per section verdict, ``skipped`` (sections not validated after an early exit),
+    ``final_verdict`` and finally ``result`` with the same body ``/v2/validate`` returns. A failure
+    ends the stream with an ``error`` event.
+
+    The stream shares executions with ``/v2/validate``: when an identical validation is cached or
+    already running, it waits for that one and sends only ``started`` and ``result``.
+
+    Returns:
+        text/event-stream
+    """
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(
+            status_code=400,
+            detail="Only PDF files are accepted"
+        )
+    normalized_value, input_type = _normalize_worker(person_name)
+    holder = uuid.uuid4().hex
+    digest = get_document_store().put(await file.read(), holder=holder)
+    job = _validation_job(digest, file.filename, normalized_value, input_type, user_date,
+                          page_concurrency, pages_per_batch)
+    _, thread_id = _validation_state(job)
+    logger.info(f"Starting streamed document validation: {file.filename}")
+
+    async def events():
+        yield _sse("started", {"thread_id": thread_id})
+        progress: asyncio.Queue = asyncio.Queue()
+        validation = asyncio.ensure_future(_cached_validation(job, progress, holder))
+        try:
+            while not validation.done():
+                next_event = asyncio.ensure_future(progress.get())
+                await asyncio.wait({next_event, validation}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield _sse(*next_event.result())
+                else:
+                    next_event.cancel()
+            while not progress.empty():
+                yield _sse(*progress.get_nowait())
+            yield _sse("result", validation.result().result)
+        except Exception as e:
+            logger.error(f"Error in streamed document validation: {str(e)}")
+            yield _sse("error", {"detail": f"Error processing document: {str(e)}"})
+        finally:
+            # Solo deja de esperar: la ejecución compartida sigue para los demás y queda en caché
+            validation.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,30 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.config.database import get_db
+from app.service.insurer_registry import get_insurer_registry
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/insurers", tags=["insurers"])
+
+
+@router.get("")
+async def list_insurers():
+    """Aseguradoras vigentes en el registro y su origen."""
+    registry = get_insurer_registry()
+    return {"source": registry.source, "insurers": registry.insurers}
+
+
+@router.post("/reload")
+def reload_insurers(db: Session = Depends(get_db)):
+    """Recarga el registro de aseguradoras sin reiniciar el servicio."""
+    registry = get_insurer_registry()
+    try:
+        insurers = registry.reload(db)
+    except Exception as e:
+        logger.error(f"Error recargando aseguradoras: {e}")
+        raise HTTPException(status_code=500, detail=f"Error recargando aseguradoras: {e}")
+    return {"source": registry.source, "insurers": insurers}
@@ -0,0 +1,47 @@
+import logging
+
+from fastapi import APIRouter
+
+from app.agent.utils.fast_extract import fast_path_snapshot
+from app.agent.utils.verdict_rules import rules_snapshot
+from app.providers.policy import policy_snapshot
+from app.providers.rate_limit import get_rate_limiter
+from app.providers.tiering import tiering_snapshot
+from app.service.extraction_store import get_extraction_store
+from app.service.job_queue import get_job_queue
+from app.service.validation_cache import get_validation_cache
+from app.workflow.node_cache import node_cache_snapshot
+from app.workflow.registry import get_graph_registry
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/llm")
+async def llm_metrics():
+    """Estado de los proveedores LLM: colas del rate limiter, latencias y circuit breakers."""
+    return {
+        "rate_limit": get_rate_limiter().snapshot(),
+        "policy": policy_snapshot(),
+        "tiering": tiering_snapshot(),
+        "verdict_rules": rules_snapshot(),
+        "fast_extract": fast_path_snapshot(),
+        "document_extractions": get_extraction_store().snapshot()
+    }
+
+
+@router.get("/graphs")
+async def graph_metrics():
+    """Tiempos de compilación y warmup de los grafos, caché de nodos y de validaciones completas."""
+    return {
+        "compile": get_graph_registry().snapshot(),
+        "node_cache": node_cache_snapshot(),
+        "validation_cache": get_validation_cache().snapshot()
+    }
+
+
+@router.get("/jobs")
+async def job_metrics():
+    """Trabajos de validación por estado."""
+    return await get_job_queue().snapshot()
@@ -24,5 +24,27 @@ class DocumentValidation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class Insurer(Base):
+    __tablename__ = "insurers"
+    __table_args__ = {"schema": "public"}
+
+    name = Column(String, primary_key=True)  # Nombre normalizado (e.g., MAPFRE)
+    variations = Column(JSON, nullable=False, default=list)  # Variantes que aparecen en archivos y documentos
+    active = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class DocumentExtraction(Base):
+    """Datos de una sección extraídos una sola vez, reutilizados para cualquier persona."""
+    __tablename__ = "document_extractions"
+    __table_args__ = {"schema": "public"}
+
+    section_digest = Column(String, primary_key=True)  # SHA-256 de la aseguradora y el texto de la sección
+    insurer = Column(String, nullable=True)
+    fields = Column(JSON, nullable=False)  # DocumentFields
+    source = Column(String, nullable=False)  # fast (patrones) o llm
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
 class DocumentValidationResponse:
     pass
\ No newline at end of file
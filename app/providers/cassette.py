@@ -0,0 +1,253 @@
+"""
+Cassette Module - Record and replay of LLM provider HTTP traffic
+
+An httpx transport that sits under the shared HTTP pools of ``LLMRegistry``:
+- ``record``: forwards every request to the provider and appends request,
+  response, token usage and observed latency to a JSONL cassette
+- ``replay``: answers from the cassette without network, waiting the recorded
+  latency (scaled by ``LLM_CASSETTE_SPEED``) so end-to-end timings stay realistic
+
+Requests are matched by a hash of method, path and canonical JSON body, and each
+recording is served once: a request with no recording left raises
+``CassetteMissError``, so extra or mismatched calls surface instead of silently
+reusing a response. With ``LLM_CASSETTE_MATCH=endpoint`` a request that was not
+recorded verbatim takes the next unused recording of the same endpoint and model,
+so a production day's document mix can be replayed against code that builds
+slightly different prompts.
+
+Prompts carry worker names, DNIs and insured tables, so the cassette never stores
+message content: each one is replaced by its SHA-256 and length. Responses are
+kept (replay needs them) and the file is created readable by its owner only.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Deque, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()  # off | record | replay
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "cassettes/llm_cassette.jsonl")
+LLM_CASSETTE_MATCH = os.getenv("LLM_CASSETTE_MATCH", "exact").lower()  # exact | endpoint
+LLM_CASSETTE_SPEED = float(os.getenv("LLM_CASSETTE_SPEED", 1.0))  # 0 responde sin esperar
+# Cabeceras de respuesta que se conservan (el resto puede contener datos de la cuenta)
+KEPT_HEADERS = ("content-type", "retry-after", "x-ratelimit-remaining-requests", "x-ratelimit-remaining-tokens")
+
+
+class CassetteMissError(httpx.TransportError):
+    """Raised in replay mode when no recording matches a request"""
+
+
+def _canonical_body(content: bytes) -> str:
+    try:
+        return json.dumps(json.loads(content), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except (ValueError, UnicodeDecodeError):
+        return content.decode("utf-8", errors="replace")
+
+
+def _redact_content(content):
+    """SHA-256 and length in place of a message content (text or multimodal parts)."""
+    if isinstance(content, list):
+        return [_redact_content(part) for part in content]
+    if isinstance(content, dict):
+        return {name: (value if name == "type" else _redact_content(value)) for name, value in content.items()}
+    if isinstance(content, str):
+        return f"sha256:{hashlib.sha256(content.encode('utf-8')).hexdigest()} ({len(content)} chars)"
+    return content
+
+
+def redact_body(body: str) -> str:
+    """Request body as stored in the cassette: message contents hashed, everything else kept."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return f"sha256:{hashlib.sha256(body.encode('utf-8')).hexdigest()} ({len(body)} chars)"
+    if isinstance(payload, dict) and isinstance(payload.get("messages"), list):
+        payload["messages"] = [{**message, "content": _redact_content(message.get("content"))}
+                               if isinstance(message, dict) else message
+                               for message in payload["messages"]]
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _model_of(body: str) -> str:
+    try:
+        return json.loads(body).get("model", "")
+    except (ValueError, AttributeError):
+        return ""
+
+
+def request_key(method: str, path: str, body: str) -> str:
+    """Stable identifier of a request"""
+    return hashlib.sha256(f"{method} {path}\n{body}".encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Recordings of a cassette file, indexed for replay"""
+
+    def __init__(self, path: str, match: str = LLM_CASSETTE_MATCH):
+        self.path = path
+        self.match = match
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Deque[dict]] = defaultdict(deque)
+        self._by_endpoint: Dict[Tuple[str, str], Deque[dict]] = defaultdict(deque)
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+
+    def load(self) -> "Cassette":
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._by_key[entry["key"]].append(entry)
+                    self._by_endpoint[(entry["path"], entry["model"])].append(entry)
+        logger.info(f"Loaded cassette {self.path}: {sum(len(v) for v in self._by_key.values())} recording(s)")
+        return self
+
+    def append(self, entry: dict) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Solo el propietario puede leer la cassette: las respuestas contienen datos de los asegurados
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _take(self, entries: Deque[dict]) -> dict:
+        # Cada grabación se sirve una sola vez y en orden; se retira de ambos índices
+        entry = entries.popleft()
+        for index, name in ((self._by_key, entry["key"]), (self._by_endpoint, (entry["path"], entry["model"]))):
+            if index.get(name) is not entries:
+                try:
+                    index[name].remove(entry)
+                except ValueError:
+                    pass
+        return entry
+
+    def find(self, key: str, path: str, model: str) -> Optional[dict]:
+        """Next unused recording for the request; None when there is none left."""
+        with self._lock:
+            if self._by_key.get(key):
+                self.hits += 1
+                return self._take(self._by_key[key])
+            if self.match == "endpoint" and self._by_endpoint.get((path, model)):
+                self.fallbacks += 1
+                return self._take(self._by_endpoint[(path, model)])
+            self.misses += 1
+            return None
+
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport recording to, or replaying from, a cassette
+
+    Args:
+        mode: ``record`` or ``replay``.
+        cassette: Cassette to write to or read from.
+        inner: Real transport used in record mode.
+        speed: Factor applied to the recorded latencies in replay mode.
+    """
+
+    def __init__(self, mode: str, cassette: Cassette, inner=None, speed: float = LLM_CASSETTE_SPEED):
+        self.mode = mode
+        self.cassette = cassette
+        self.inner = inner
+        self.speed = speed
+
+    def _describe(self, request: httpx.Request) -> Tuple[str, str, str, str]:
+        body = _canonical_body(request.read())
+        path = request.url.path
+        return request_key(request.method, path, body), path, body, _model_of(body)
+
+    def _record(self, request: httpx.Request, response: httpx.Response, latency: float) -> None:
+        key, path, body, model = self._describe(request)
+        content = response.content
+        try:
+            usage = json.loads(content).get("usage")
+        except (ValueError, AttributeError):
+            usage = None
+        self.cassette.append({
+            "key": key,
+            "method": request.method,
+            "path": path,
+            "model": model,
+            "request": redact_body(body),
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+            "response": content.decode("utf-8", errors="replace"),
+            "usage": usage,
+            "latency": round(latency, 4),
+            "recorded_at": datetime.now().isoformat(),
+        })
+
+    def _replay(self, request: httpx.Request) -> Tuple[httpx.Response, float]:
+        key, path, _, model = self._describe(request)
+        entry = self.cassette.find(key, path, model)
+        if entry is None:
+            raise CassetteMissError(f"No unused recording for {request.method} {path} (model={model}, key={key[:12]})",
+                                    request=request)
+        response = httpx.Response(status_code=entry["status"], headers=entry["headers"],
+                                  content=entry["response"].encode("utf-8"), request=request)
+        return response, entry["latency"] * self.speed
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "replay":
+            response, delay = self._replay(request)
+            time.sleep(delay)
+            return response
+        start = time.monotonic()
+        response = self.inner.handle_request(request)
+        response.read()
+        self._record(request, response, time.monotonic() - start)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "replay":
+            response, delay = self._replay(request)
+            await asyncio.sleep(delay)
+            return response
+        start = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        self._record(request, response, time.monotonic() - start)
+        return response
+
+    def close(self) -> None:
+        if self.inner is not None:
+            self.inner.close()
+
+    async def aclose(self) -> None:
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+_cassettes: Dict[str, Cassette] = {}
+
+
+def cassette_transport(limits: httpx.Limits, asynchronous: bool) -> Optional[CassetteTransport]:
+    """Transport for the shared HTTP pools according to LLM_CASSETTE_MODE (None when off)"""
+    if LLM_CASSETTE_MODE not in ("record", "replay"):
+        return None
+    if LLM_CASSETTE_PATH not in _cassettes:
+        cassette = Cassette(LLM_CASSETTE_PATH)
+        _cassettes[LLM_CASSETTE_PATH] = cassette.load() if LLM_CASSETTE_MODE == "replay" else cassette
+        logger.info(f"LLM cassette {LLM_CASSETTE_MODE}: {LLM_CASSETTE_PATH}")
+    inner = None
+    if LLM_CASSETTE_MODE == "record":
+        inner = httpx.AsyncHTTPTransport(limits=limits) if asynchronous else httpx.HTTPTransport(limits=limits)
+    return CassetteTransport(LLM_CASSETTE_MODE, _cassettes[LLM_CASSETTE_PATH], inner)
+
+
+def cassette_stats() -> dict:
+    """Replay hits, fallbacks and misses per cassette"""
+    return {path: {"hits": c.hits, "fallbacks": c.fallbacks, "misses": c.misses} for path, c in _cassettes.items()}
@@ -0,0 +1,295 @@
+"""
+Fake Provider Module - Deterministic local chat models for offline runs
+
+Serves ``LLMType.FAKE`` (and every type when ``LLM_OFFLINE`` is set) without
+network calls, so the validation graphs can be benchmarked and load-tested:
+- Latency sampled from a configurable distribution, with error injection
+- Schema-valid structured outputs for the TypedDicts used by the agents,
+  derived from the prompt when possible (dates, policy numbers, page numbers)
+- Plain-text answers echoing the document text for the segmentation calls
+"""
+
+import asyncio
+import copy
+import math
+import os
+import random
+import re
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Literal, Optional, Union, get_args, get_origin, get_type_hints
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, Field
+
+from app.providers.llm_manager import LLMConfig, LLMManager, LLMType
+
+# Perfil del proveedor fake: "distribución:mediana:p95" en segundos
+LLM_FAKE_LATENCY = os.getenv("LLM_FAKE_LATENCY", "lognormal:1.5:6.0")
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", 0.0))
+LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED")) if os.getenv("LLM_FAKE_SEED") else None
+
+# Cuantil 95 de la normal estándar
+Z_95 = 1.645
+DATE_PATTERN = re.compile(r"\b(\d{2})/(\d{2})/(\d{4})\b")
+POLICY_PATTERN = re.compile(r"p[óo]liza[^\d\n]{0,20}(\d{6,})", re.IGNORECASE)
+PAGE_PATTERN = re.compile(r"p[áa]gina[s]?\s*(\d+)", re.IGNORECASE)
+PAGE_LIST_PATTERN = re.compile(r"p[áa]ginas\s*\[([\d,\s]+)\]", re.IGNORECASE)
+FLAG_PATTERN = re.compile(r"(validation_passed|validity_passed)\W+(true|false)", re.IGNORECASE)
+
+
+class FakeProviderError(RuntimeError):
+    """Error injected by a fake provider"""
+
+
+class LatencyProfile(BaseModel):
+    """Latency distribution of a fake provider
+
+    ``median`` and ``p95`` are in seconds; ``lognormal`` reproduces the long
+    tail of real LLM APIs, ``uniform`` and ``constant`` are kept for simple cases.
+    """
+    distribution: Literal["constant", "uniform", "lognormal"] = "lognormal"
+    median: float = Field(default=0.5, gt=0)
+    p95: float = Field(default=2.0, gt=0)
+    error_rate: float = Field(default=0.0, ge=0, le=1)
+
+    @classmethod
+    def from_spec(cls, spec: str, error_rate: float = 0.0) -> "LatencyProfile":
+        """Profile from a "distribution:median:p95" spec"""
+        distribution, median, p95 = (spec.split(":") + ["", ""])[:3]
+        median = float(median or 0.5)
+        return cls(distribution=distribution or "lognormal", median=median, p95=float(p95 or median),
+                   error_rate=error_rate)
+
+    @classmethod
+    def from_env(cls) -> "LatencyProfile":
+        """Profile configured by LLM_FAKE_LATENCY and LLM_FAKE_ERROR_RATE"""
+        return cls.from_spec(LLM_FAKE_LATENCY, LLM_FAKE_ERROR_RATE)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            return self.median
+        if self.distribution == "uniform":
+            width = max(self.p95 - self.median, 0) / 0.45
+            return max(rng.uniform(self.median - width / 2, self.median + width / 2), 0.0)
+        sigma = max(math.log(self.p95) - math.log(self.median), 0) / Z_95
+        return rng.lognormvariate(math.log(self.median), sigma)
+
+
+def _message_texts(messages: Any) -> List[str]:
+    """Text parts of the messages, in order"""
+    if not isinstance(messages, (list, tuple)):
+        messages = [messages]
+    texts = []
+    for message in messages:
+        content = getattr(message, "content", message)
+        for part in content if isinstance(content, list) else [content]:
+            if isinstance(part, dict):
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+            elif isinstance(part, str):
+                texts.append(part)
+    return texts
+
+
+def _default_for(annotation: Any) -> Any:
+    """Type-driven default for TypedDicts without a dedicated generator"""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _default_for(args[0]) if args else None
+    if origin in (list, List):
+        args = get_args(annotation)
+        return [_default_for(args[0])] if args else []
+    if origin in (dict, Dict) or annotation is dict:
+        return {}
+    if annotation is bool:
+        return True
+    if annotation is int:
+        return 1
+    if annotation is float:
+        return 1.0
+    if annotation is str:
+        return "fake"
+    if hasattr(annotation, "__annotations__"):
+        return {name: _default_for(hint) for name, hint in get_type_hints(annotation).items()}
+    return None
+
+
+def _document_details(text: str) -> dict:
+    dates = [f"{d}/{m}/{y}" for d, m, y in DATE_PATTERN.findall(text)]
+    if len(dates) >= 2:
+        start, end = dates[0], dates[1]
+        issuance = dates[2] if len(dates) > 2 else dates[0]
+    else:
+        today = date.today()
+        start = (today - timedelta(days=15)).strftime("%d/%m/%Y")
+        end = (today + timedelta(days=15)).strftime("%d/%m/%Y")
+        issuance = start
+    policy = POLICY_PATTERN.search(text)
+    return {
+        "start_date_validity": start,
+        "end_date_validity": end,
+        "validity": f"{start} AL {end}",
+        "policy_number": policy.group(1) if policy else "0000000",
+        "company": "FAKE SEGUROS",
+        "date_of_issuance": issuance,
+        "date_of_signature": issuance,
+        "constancia_number": None,
+        "person_by_policy": {"name": "FAKE", "policy_number": policy.group(1) if policy else "0000000",
+                             "company": "FAKE SEGUROS"},
+    }
+
+
+def _logo_details(page_num: int) -> dict:
+    return {"logo": "FAKE SEGUROS", "logo_status": True, "diagnostics": "Logotipo y firma presentes (fake).",
+            "page_num": page_num, "signature_status": True}
+
+
+def _page_verdict(text: str) -> dict:
+    flags = {name: value.lower() == "true" for name, value in FLAG_PATTERN.findall(text)}
+    validity = flags.get("validation_passed", True) and flags.get("validity_passed", True)
+    page = PAGE_PATTERN.search(text)
+    return {
+        "verdict": validity,
+        "reason": "Veredicto generado por el proveedor fake.",
+        "details": {"validity_validation_passed": validity, "policy_validation_passed": True,
+                    "person_validation_passed": True},
+        "page_num": int(page.group(1)) if page else 1,
+    }
+
+
+def _final_verdict(text: str) -> dict:
+    verdict = '"verdict":false' not in text.replace(" ", "")
+    return {
+        "verdict": str(verdict),
+        "reason": "Veredicto final generado por el proveedor fake.",
+        "details": {"logo_validation_passed": True, "validity_validation_passed": verdict,
+                    "signature_validation_passed": True, "person_validation_passed": True},
+    }
+
+
+def _logo_batch(text: str) -> dict:
+    pages = PAGE_LIST_PATTERN.search(text)
+    page_nums = [int(n) for n in pages.group(1).split(",") if n.strip()] if pages else [1]
+    return {"pages": [_logo_details(page_num) for page_num in page_nums]}
+
+
+# Generadores por nombre de esquema; el resto se rellena a partir de sus anotaciones
+STRUCTURED_OUTPUTS: Dict[str, Callable[[str], dict]] = {
+    "DocumentValidationDetails": _document_details,
+    "DocumentFields": lambda text: {k: v for k, v in _document_details(text).items() if k != "person_by_policy"},
+    "LogoValidationDetails": lambda text: _logo_details(
+        int(PAGE_PATTERN.search(text).group(1)) if PAGE_PATTERN.search(text) else 1),
+    "LogoBatchValidationDetails": _logo_batch,
+    "VerdictResponse": _page_verdict,
+    "FinalVerdictResponse": _final_verdict,
+}
+
+
+def fake_structured_output(schema: Any, messages: Any) -> Any:
+    """Schema-valid answer for ``schema`` given the request messages"""
+    text = "\n".join(_message_texts(messages))
+    generator = STRUCTURED_OUTPUTS.get(getattr(schema, "__name__", ""))
+    if generator is None:
+        return _default_for(schema)
+    result = generator(text)
+    # Campos añadidos al esquema (p.ej. confidence) se rellenan por tipo
+    for name, hint in get_type_hints(schema).items():
+        result.setdefault(name, _default_for(hint))
+    return result
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering after a sampled latency
+
+    Plain calls echo the largest text part of the request split into sections
+    (what the segmentation prompts expect); structured calls return
+    ``response`` when set, a generated schema-valid object otherwise.
+    """
+    profile: LatencyProfile = Field(default_factory=LatencyProfile)
+    response: Any = None
+    seed: Optional[int] = None
+    max_tokens: Optional[int] = None
+    rng: random.Random = Field(default=None, exclude=True)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _outcome(self) -> float:
+        if self.rng.random() < self.profile.error_rate:
+            raise FakeProviderError("Injected provider error")
+        return self.profile.sample(self.rng)
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        if self.response is not None:
+            content = self.response if isinstance(self.response, str) else str(self.response)
+        else:
+            content = max(_message_texts(messages), key=len, default="")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._outcome())
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._outcome())
+        return self._result(messages)
+
+    def _structured(self, schema: Any, messages: Any) -> Any:
+        if self.response is not None:
+            return copy.deepcopy(self.response)
+        return fake_structured_output(schema, messages)
+
+    def with_structured_output(self, schema: Any, **kwargs) -> RunnableLambda:
+        """Answer a schema-valid object for ``schema``"""
+
+        def respond(messages: Any) -> Any:
+            time.sleep(self._outcome())
+            return self._structured(schema, messages)
+
+        async def arespond(messages: Any) -> Any:
+            await asyncio.sleep(self._outcome())
+            return self._structured(schema, messages)
+
+        return RunnableLambda(respond, afunc=arespond)
+
+
+class FakeLLMManager(LLMManager):
+    """LLMManager handing out fake models, one per LLMType
+
+    Args:
+        profiles: Latency profile of each LLMType; types not listed use the default profile.
+        response: Response returned by every fake (schema-driven when None).
+        seed: Seed of the latency samples.
+    """
+
+    def __init__(self, profiles: Optional[Dict[LLMType, LatencyProfile]] = None, response: Any = None,
+                 seed: Optional[int] = None, config: LLMConfig = LLMConfig()):
+        super().__init__(config)
+        self.profiles = profiles or {}
+        self.fakes: Dict[LLMType, FakeChatModel] = {}
+        self.response = response
+        self.seed = seed
+
+    def get_llm(self, llm_type: LLMType) -> FakeChatModel:
+        if llm_type not in self.fakes:
+            self.fakes[llm_type] = FakeChatModel(
+                profile=self.profiles.get(llm_type, LatencyProfile()),
+                response=self.response,
+                seed=self.seed
+            )
+        return self.fakes[llm_type]
@@ -2,19 +2,24 @@
 LLM Manager Module - Centralized management of Language Models
 
 This module provides a unified interface for managing different Language Model providers
-including OpenAI, Anthropic, and Google Vertex AI. It includes:
+including OpenAI, Anthropic, Google Vertex AI and a local fake provider. It includes:
 - LLM type definitions
 - Provider-specific configurations
-- Caching mechanisms
+- A process-wide client registry with pooled HTTP connections
+- Optional record/replay of the provider traffic (see ``cassette``)
 - Error handling
 - Logging
 """
 
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import Enum
 import logging
+import os
+import threading
 from functools import lru_cache
-from typing import Optional, Union
-from urllib.parse import urlparse
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
 
 import httpx
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
@@ -24,10 +29,40 @@ from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from pydantic import BaseModel, Field
 
+from app.providers.cassette import LLM_CASSETTE_MODE, cassette_transport
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Parámetros del pool HTTP compartido por todos los clientes OpenAI/Azure
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 20))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 120))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", 10))
+LLM_HTTP_READ_TIMEOUT = float(os.getenv("LLM_HTTP_READ_TIMEOUT", 120))
+LLM_HTTP_PRECONNECT = int(os.getenv("LLM_HTTP_PRECONNECT", 2))
+# Sirve todos los modelos con el proveedor fake (benchmarks y pruebas de carga sin red)
+LLM_OFFLINE = os.getenv("LLM_OFFLINE", "false").lower() == "true"
+
+# Latencia fake forzada en el contexto actual (warmup de los grafos); no afecta a otras tareas
+_offline_latency: ContextVar[Optional[str]] = ContextVar("llm_offline_latency", default=None)
+
+
+@contextmanager
+def offline_context(latency: str = "constant:0.001:0.001"):
+    """Serve every LLM of the current context (and the tasks it spawns) with the fake provider"""
+    token = _offline_latency.set(latency)
+    try:
+        yield
+    finally:
+        _offline_latency.reset(token)
+
+
+def in_offline_context() -> bool:
+    """True inside ``offline_context``"""
+    return _offline_latency.get() is not None
+
 
 class LLMType(str, Enum):
     """Supported LLM types with their corresponding model identifiers"""
@@ -36,12 +71,26 @@ class LLMType(str, Enum):
     AZURE_OPENAI = "azure-gpt-4o"
     ANTHROPIC_CLAUDE = "claude-3-5-sonnet-20240620"
     GEMINI = "gemini-2.0-flash-exp"
+    FAKE = "fake"
 
     @classmethod
     def get_default(cls) -> "LLMType":
         """Get the default LLM type"""
         return cls.GPT_4O_MINI
 
+    @property
+    def provider(self) -> str:
+        """Provider that serves this model"""
+        if self in (LLMType.GPT_4O_MINI, LLMType.GPT_4O):
+            return "openai"
+        if self == LLMType.AZURE_OPENAI:
+            return "azure"
+        if self == LLMType.ANTHROPIC_CLAUDE:
+            return "anthropic"
+        if self == LLMType.FAKE:
+            return "fake"
+        return "vertex"
+
 
 class LLMConfig(BaseModel):
     """Configuration for LLM instances"""
@@ -58,18 +107,141 @@ class LLMConfig(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+    def cache_key(self) -> str:
+        """Stable representation used to share clients with identical configuration"""
+        return self.model_dump_json()
+
+
+class LLMRegistry:
+    """Process-wide registry of shared, thread-safe LLM clients.
+
+    Clients are keyed by (provider, model, config) so every agent asking for the same
+    model with the same configuration receives the same instance. OpenAI and Azure
+    clients share one keep-alive HTTP pool (sync and async), so TLS handshakes and
+    client construction happen once per process instead of once per agent. With
+    LLM_CASSETTE_MODE set, the pools record to or replay from a cassette file.
+    """
+
+    PRECONNECT_URLS = {
+        "openai": os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    }
+
+    def __init__(self):
+        self._clients: Dict[Tuple[str, str, str], Any] = {}
+        self._lock = threading.RLock()
+        self._http_client: Optional[httpx.Client] = None
+        self._async_http_client: Optional[httpx.AsyncClient] = None
+        self.callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    @staticmethod
+    def _timeout() -> httpx.Timeout:
+        return httpx.Timeout(LLM_HTTP_READ_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+
+    @property
+    def http_client(self) -> httpx.Client:
+        """Shared synchronous HTTP pool"""
+        with self._lock:
+            if self._http_client is None or self._http_client.is_closed:
+                self._http_client = httpx.Client(limits=self._limits(), timeout=self._timeout(),
+                                                 transport=cassette_transport(self._limits(), asynchronous=False))
+            return self._http_client
+
+    @property
+    def async_http_client(self) -> httpx.AsyncClient:
+        """Shared asynchronous HTTP pool"""
+        with self._lock:
+            if self._async_http_client is None or self._async_http_client.is_closed:
+                self._async_http_client = httpx.AsyncClient(
+                    limits=self._limits(), timeout=self._timeout(),
+                    transport=cassette_transport(self._limits(), asynchronous=True))
+            return self._async_http_client
+
+    def get_or_create(self, provider: str, model: str, config: LLMConfig, factory: Callable[[], Any]) -> Any:
+        """
+        Return the shared client for (provider, model, config), building it once
+
+        Args:
+            provider: Provider name (openai, azure, anthropic, vertex)
+            model: Model identifier
+            config: Configuration the client was built with
+            factory: Callable that builds the client when it is not registered yet
+
+        Returns:
+            The shared client instance
+        """
+        key = (provider, model, config.cache_key())
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = factory()
+                self._clients[key] = client
+                logger.info(f"Registered shared LLM client: provider={provider} model={model}")
+            return client
+
+    async def preconnect(self, providers: Iterable[str] = ("openai",)) -> None:
+        """
+        Open keep-alive connections to the provider endpoints ahead of the first request
+
+        Any HTTP status is fine here: the goal is only to complete DNS, TCP and TLS so the
+        pooled connections are warm. Failures are logged and never abort startup.
+        """
+        if LLM_CASSETTE_MODE == "replay":
+            return
+        for provider in providers:
+            url = self.PRECONNECT_URLS.get(provider)
+            if not url:
+                continue
+            try:
+                await asyncio.gather(*[
+                    self.async_http_client.head(url) for _ in range(max(LLM_HTTP_PRECONNECT, 1))
+                ])
+                await asyncio.to_thread(self.http_client.head, url)
+                logger.info(f"Pre-connected {LLM_HTTP_PRECONNECT} connection(s) to {provider} ({url})")
+            except Exception as e:
+                logger.warning(f"Could not pre-connect to {provider}: {str(e)}")
+
+    def clear(self) -> None:
+        """Drop every registered client; the HTTP pools are kept"""
+        with self._lock:
+            self._clients.clear()
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP pools and drop every registered client"""
+        self.clear()
+        if self._async_http_client is not None:
+            await self._async_http_client.aclose()
+        if self._http_client is not None:
+            self._http_client.close()
+
+
+@lru_cache()
+def get_llm_registry() -> LLMRegistry:
+    """Get the process-wide LLM registry"""
+    return LLMRegistry()
+
 
 class LLMManager:
     """Manager class for handling different LLM providers"""
 
-    def __init__(self, config: LLMConfig = LLMConfig()):
+    def __init__(self, config: LLMConfig = LLMConfig(), registry: Optional[LLMRegistry] = None):
         self.config = config
-        self._callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
+        self.registry = registry or get_llm_registry()
+        self._callback_manager = self.registry.callback_manager
 
-    @lru_cache(maxsize=4)
     def get_openai_llm(self, model: str = "gpt-4o-mini", azure: bool = False) -> Union[ChatOpenAI, AzureChatOpenAI]:
         """
-        Get an OpenAI LLM instance with caching
+        Get a shared OpenAI LLM instance from the process registry
 
         Args:
             model: The model identifier to use
@@ -82,6 +254,11 @@ class LLMManager:
             ValueError: If Azure is requested but configuration is incomplete
             Exception: For other initialization errors
         """
+        provider = "azure" if azure else "openai"
+        return self.registry.get_or_create(provider, model, self.config,
+                                           lambda: self._build_openai_llm(model, azure))
+
+    def _build_openai_llm(self, model: str, azure: bool) -> Union[ChatOpenAI, AzureChatOpenAI]:
         try:
             if not azure:
                 return ChatOpenAI(
@@ -89,7 +266,9 @@ class LLMManager:
                     temperature=self.config.temperature,
                     streaming=self.config.streaming,
                     max_tokens=self.config.max_tokens,
-                    callback_manager=self._callback_manager
+                    callback_manager=self._callback_manager,
+                    http_client=self.registry.http_client,
+                    http_async_client=self.registry.async_http_client
                 )
 
             if not all([
@@ -108,17 +287,18 @@ class LLMManager:
                 temperature=self.config.temperature,
                 streaming=self.config.streaming,
                 max_tokens=self.config.max_tokens,
-                callback_manager=self._callback_manager
+                callback_manager=self._callback_manager,
+                http_client=self.registry.http_client,
+                http_async_client=self.registry.async_http_client
             )
 
         except Exception as e:
             logger.error(f"Failed to initialize OpenAI LLM: {str(e)}")
             raise
 
-    @lru_cache(maxsize=2)
     def get_anthropic_llm(self) -> ChatAnthropic:
         """
-        Get an Anthropic Claude instance with caching
+        Get a shared Anthropic Claude instance from the process registry
 
         Returns:
             ChatAnthropic instance
@@ -126,6 +306,10 @@ class LLMManager:
         Raises:
             Exception: For initialization errors
         """
+        return self.registry.get_or_create("anthropic", LLMType.ANTHROPIC_CLAUDE.value, self.config,
+                                           self._build_anthropic_llm)
+
+    def _build_anthropic_llm(self) -> ChatAnthropic:
         try:
             return ChatAnthropic(
                 model_name="claude-3-5-sonnet-20240620",
@@ -138,10 +322,9 @@ class LLMManager:
             logger.error(f"Failed to initialize Anthropic LLM: {str(e)}")
             raise
 
-    @lru_cache(maxsize=1)
     def get_google_llm(self) -> ChatVertexAI:
         """
-        Get a Google Vertex AI instance with caching
+        Get a shared Google Vertex AI instance from the process registry
 
         Returns:
             ChatVertexAI instance
@@ -149,6 +332,10 @@ class LLMManager:
         Raises:
             Exception: For initialization errors
         """
+        return self.registry.get_or_create("vertex", LLMType.GEMINI.value, self.config,
+                                           self._build_google_llm)
+
+    def _build_google_llm(self) -> ChatVertexAI:
         try:
             return ChatVertexAI(
                 model_name="gemini-2.0-flash-exp",
@@ -162,6 +349,26 @@ class LLMManager:
             logger.error(f"Failed to initialize Google Vertex AI LLM: {str(e)}")
             raise
 
+    def get_fake_llm(self, model: str = LLMType.FAKE.value, latency: Optional[str] = None):
+        """
+        Get a shared fake chat model (no network) from the process registry
+
+        Args:
+            model: Model the fake stands in for; each one keeps its own instance
+            latency: Latency spec ("distribution:median:p95"); LLM_FAKE_LATENCY when None
+
+        Returns:
+            FakeChatModel configured from the LLM_FAKE_* environment variables
+        """
+        key = model if latency is None else f"{model}@{latency}"
+        return self.registry.get_or_create("fake", key, self.config, lambda: self._build_fake_llm(latency))
+
+    def _build_fake_llm(self, latency: Optional[str] = None):
+        # Import diferido: el módulo fake depende de este
+        from app.providers.fake import FakeChatModel, LatencyProfile, LLM_FAKE_SEED
+        profile = LatencyProfile.from_env() if latency is None else LatencyProfile.from_spec(latency)
+        return FakeChatModel(profile=profile, seed=LLM_FAKE_SEED, max_tokens=self.config.max_tokens)
+
     def get_llm(self, llm_type: LLMType) -> Union[ChatOpenAI, AzureChatOpenAI, ChatAnthropic, ChatVertexAI]:
         """
         Get an LLM instance based on the specified type
@@ -170,14 +377,18 @@ class LLMManager:
             llm_type: The type of LLM to initialize
 
         Returns:
-            An initialized LLM instance
+            An initialized LLM instance (a fake one for every type when LLM_OFFLINE is set)
 
         Raises:
             ValueError: For unknown LLM types
             Exception: For initialization errors
         """
         try:
-            if llm_type == LLMType.GPT_4O_MINI:
+            if in_offline_context():
+                return self.get_fake_llm(llm_type.value, _offline_latency.get())
+            elif llm_type == LLMType.FAKE or LLM_OFFLINE:
+                return self.get_fake_llm(llm_type.value)
+            elif llm_type == LLMType.GPT_4O_MINI:
                 return self.get_openai_llm()
             elif llm_type == LLMType.GPT_4O:
                 return self.get_openai_llm(model="gpt-4o")
@@ -195,10 +406,8 @@ class LLMManager:
             raise
 
     def clear_caches(self):
-        """Clear all LLM instance caches"""
-        self.get_openai_llm.cache_clear()
-        self.get_anthropic_llm.cache_clear()
-        self.get_google_llm.cache_clear()
+        """Clear the shared LLM client registry (the HTTP pools stay open)"""
+        self.registry.clear()
 
 
 # Example usage
@@ -214,4 +423,4 @@ def get_default_llm(config: Optional[LLMConfig] = None) -> Union[
         An initialized LLM instance using default settings
     """
     manager = LLMManager(config or LLMConfig())
-    return manager.get_llm(LLMType.get_default())
\ No newline at end of file
+    return manager.get_llm(LLMType.get_default())
@@ -0,0 +1,351 @@
+"""
+Invocation Policy Module - Deadlines, hedging and circuit breakers for LLM calls
+
+Wraps the clients handed out by ``LLMManager`` with:
+- A per-call deadline, so a slow provider can never hang a validation
+- Hedged requests: when the primary has not answered after its observed p95
+  latency, a backup request goes to a second model/provider and the first
+  successful answer wins (the loser is cancelled)
+- Per-provider circuit breakers with half-open probing, so a failing provider
+  is skipped until it recovers
+- Scheduling through the process-wide rate limiter, so calls queue for RPM/TPM
+  capacity instead of being rejected with a 429. The primary reserves its
+  capacity before the deadline and the hedge timer start, and only calls that
+  reached the provider count as breaker failures, so queueing under load never
+  opens a circuit or triggers a hedge
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set
+
+from pydantic import BaseModel, Field
+
+from app.providers.llm_manager import LLMManager, LLMType, in_offline_context
+from app.providers.rate_limit import (LLM_RATE_LIMIT_RETRIES, Priority, estimate_tokens, get_rate_limiter,
+                                      is_rate_limited, retry_after)
+
+logger = logging.getLogger(__name__)
+
+# Parámetros por defecto de la política de invocación
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", 90))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", 0.95))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", 1.0))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", 15.0))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30.0))
+# Backups por modelo, p.ej. "gpt-4o=claude-3-5-sonnet-20240620;gpt-4o-mini=gpt-4o"
+LLM_BACKUPS = os.getenv("LLM_BACKUPS", "")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when every candidate provider has its circuit open"""
+
+
+class PolicyConfig(BaseModel):
+    """Configuration of the invocation policy"""
+    timeout: float = Field(default=LLM_CALL_TIMEOUT, gt=0)
+    hedge: bool = Field(default=LLM_HEDGE_ENABLED)
+    hedge_quantile: float = Field(default=LLM_HEDGE_QUANTILE, gt=0, lt=1)
+    hedge_min_delay: float = Field(default=LLM_HEDGE_MIN_DELAY, ge=0)
+    hedge_default_delay: float = Field(default=LLM_HEDGE_DEFAULT_DELAY, ge=0)
+    min_samples: int = Field(default=20, ge=1)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per model"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Dict[str, Deque[float]] = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self._window)).append(seconds)
+
+    def count(self, model: str) -> int:
+        return len(self._samples.get(model, ()))
+
+    def quantile(self, model: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if not samples:
+            return None
+        index = min(int(q * len(samples)), len(samples) - 1)
+        return samples[index]
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures → half-open probe after the reset timeout"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_timeout: float = LLM_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (reserves the probe slot when half-open)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Circuit {self.name} half-open, probing")
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} open after {self.failures} failure(s)")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Free the half-open probe slot when the probe was cancelled without an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker of a provider"""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+@lru_cache()
+def get_latency_tracker() -> LatencyTracker:
+    """Get the process-wide latency tracker"""
+    return LatencyTracker()
+
+
+def default_backups(primary: LLMType) -> List[LLMType]:
+    """Backups configured in LLM_BACKUPS for a model; a second request to the same model otherwise"""
+    for entry in filter(None, LLM_BACKUPS.split(";")):
+        model, _, backups = entry.partition("=")
+        if model.strip() == primary.value:
+            return [LLMType(backup.strip()) for backup in backups.split(",") if backup.strip()]
+    return [primary]
+
+
+def policy_snapshot() -> dict:
+    """Breaker states and observed latency quantiles, for metrics endpoints"""
+    tracker = get_latency_tracker()
+    return {
+        "breakers": {name: {"state": b.state, "failures": b.failures} for name, b in _breakers.items()},
+        "latency": {
+            model: {"count": tracker.count(model),
+                    "p50": tracker.quantile(model, 0.5),
+                    "p95": tracker.quantile(model, 0.95)}
+            for model in list(tracker._samples)
+        },
+    }
+
+
+class ResilientLLM:
+    """LLM facade that applies the invocation policy to every call.
+
+    Exposes the subset of the chat model interface the agents use
+    (``with_structured_output`` and ``ainvoke``); clients are resolved from the
+    manager on every call, so they always come from the shared registry.
+
+    Args:
+        manager: LLMManager used to resolve the clients.
+        primary: Model answering first.
+        backups: Models used for hedging and failover, in order.
+        config: Optional policy configuration.
+        priority: Scheduling priority in the rate limiter queues.
+    """
+
+    def __init__(self, manager: LLMManager, primary: LLMType, backups: Optional[Sequence[LLMType]] = None,
+                 config: Optional[PolicyConfig] = None, schema: Any = None, schema_kwargs: Optional[dict] = None,
+                 priority: Priority = Priority.NORMAL):
+        self.manager = manager
+        self.primary = primary
+        self.backups = list(default_backups(primary) if backups is None else backups)
+        self.config = config or PolicyConfig()
+        self.schema = schema
+        self.schema_kwargs = schema_kwargs or {}
+        self.priority = priority
+
+    def with_structured_output(self, schema: Any, **kwargs) -> "ResilientLLM":
+        """Same policy, answering with the given structured output schema"""
+        return ResilientLLM(self.manager, self.primary, self.backups, self.config, schema, kwargs, self.priority)
+
+    def _runnable(self, llm_type: LLMType):
+        llm = self.manager.get_llm(llm_type)
+        if self.schema is None:
+            return llm
+        return llm.with_structured_output(self.schema, **self.schema_kwargs)
+
+    def hedge_delay(self, llm_type: LLMType) -> float:
+        """Delay before the backup request: observed p95 of the primary model"""
+        tracker = get_latency_tracker()
+        if tracker.count(llm_type.value) < self.config.min_samples:
+            return self.config.hedge_default_delay
+        observed = tracker.quantile(llm_type.value, self.config.hedge_quantile)
+        return max(observed, self.config.hedge_min_delay)
+
+    async def _acquire(self, llm_type: LLMType, messages: Any) -> None:
+        """Wait for rate limiter capacity (fake warmup traffic does not consume any)"""
+        if not in_offline_context():
+            await get_rate_limiter().acquire(llm_type.value,
+                                             estimate_tokens(messages, self.manager.config.max_tokens),
+                                             self.priority)
+
+    async def _call(self, llm_type: LLMType, messages: Any, config: Optional[dict],
+                    sent: Set[asyncio.Task], acquired: bool = False) -> Any:
+        """
+        One request to ``llm_type``, retried after a 429.
+
+        Args:
+            sent: Tasks whose request reached the provider; this task is in it only while
+                waiting for the answer, not while queued in the rate limiter
+            acquired: The caller already reserved capacity for the first attempt
+        """
+        breaker = get_breaker(llm_type.provider)
+        task = asyncio.current_task()
+        # El tráfico fake del warmup no entra en las latencias observadas
+        offline = in_offline_context()
+        for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+            try:
+                if not acquired:
+                    await self._acquire(llm_type, messages)
+                acquired = False
+                sent.add(task)
+                start = time.monotonic()
+                result = await self._runnable(llm_type).ainvoke(messages, config=config)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                sent.discard(task)
+                if is_rate_limited(e) and attempt < LLM_RATE_LIMIT_RETRIES:
+                    # Un 429 no indica que el proveedor esté caído: se reencola la petición
+                    get_rate_limiter().penalize(llm_type.value, retry_after(e))
+                    continue
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            if not offline:
+                get_latency_tracker().record(llm_type.value, time.monotonic() - start)
+            return result
+
+    async def ainvoke(self, messages: Any, config: Optional[dict] = None) -> Any:
+        """
+        Invoke with deadline, hedging and circuit breaking
+
+        Raises:
+            CircuitOpenError: If every candidate provider is open
+            asyncio.TimeoutError: If no candidate answered before the deadline
+            Exception: The last provider error when every candidate failed
+        """
+        loop = asyncio.get_running_loop()
+        candidates = [self.primary] + self.backups
+        tasks: Dict[asyncio.Task, LLMType] = {}
+        sent: Set[asyncio.Task] = set()
+        last_error: Optional[BaseException] = None
+
+        def next_available() -> Optional[LLMType]:
+            while candidates:
+                llm_type = candidates.pop(0)
+                if get_breaker(llm_type.provider).allow():
+                    return llm_type
+                logger.warning(f"Skipping {llm_type.value}: circuit {llm_type.provider} is open")
+            return None
+
+        def launch_next() -> bool:
+            llm_type = next_available()
+            if llm_type is None:
+                return False
+            tasks[asyncio.ensure_future(self._call(llm_type, messages, config, sent))] = llm_type
+            return True
+
+        first = next_available()
+        if first is None:
+            raise CircuitOpenError(f"No provider available for {self.primary.value}")
+        # La espera en la cola del limitador no cuenta para el deadline ni para el hedge
+        try:
+            await self._acquire(first, messages)
+        except asyncio.CancelledError:
+            get_breaker(first.provider).release()
+            raise
+        deadline = loop.time() + self.config.timeout
+        tasks[asyncio.ensure_future(self._call(first, messages, config, sent, acquired=True))] = first
+        hedge_at = loop.time() + self.hedge_delay(self.primary) if self.config.hedge else None
+
+        try:
+            while tasks:
+                now = loop.time()
+                if now >= deadline:
+                    # Las que siguen en la cola del limitador no llegaron al proveedor: no son fallos suyos
+                    for task, llm_type in tasks.items():
+                        if task in sent:
+                            get_breaker(llm_type.provider).record_failure()
+                    raise asyncio.TimeoutError(
+                        f"LLM call exceeded {self.config.timeout}s ({[t.value for t in tasks.values()]})")
+                wait = deadline - now
+                if hedge_at is not None and candidates:
+                    wait = min(wait, max(hedge_at - now, 0))
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    llm_type = tasks.pop(task)
+                    if task.exception() is None:
+                        if llm_type != self.primary or len(tasks):
+                            logger.info(f"LLM call answered by {llm_type.value}")
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"LLM call to {llm_type.value} failed: {str(last_error)}")
+                    launch_next()  # failover inmediato
+
+                if not done and hedge_at is not None and loop.time() >= hedge_at and candidates:
+                    hedge_at = None
+                    if get_rate_limiter().queued(candidates[0].value):
+                        # El backup ya tiene cola: duplicar la petición solo añadiría carga
+                        logger.debug(f"Not hedging {self.primary.value}: {candidates[0].value} is queued")
+                        continue
+                    logger.info(f"Hedging {self.primary.value} after {self.hedge_delay(self.primary):.2f}s")
+                    launch_next()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        raise last_error or CircuitOpenError(f"No provider available for {self.primary.value}")
@@ -0,0 +1,347 @@
+"""
+Rate Limit Module - Provider-aware request scheduler for LLM calls
+
+Every LLM request reserves capacity from two token buckets of its model, one
+for requests per minute and one for tokens per minute, before it is sent.
+Callers that do not fit are queued by priority and released as the buckets
+refill, instead of being rejected by the provider with a 429.
+
+When ``LLM_RATE_LIMIT_REDIS_URL`` is set the buckets live in Redis (updated
+atomically by a Lua script), so every uvicorn worker draws from the same
+budget; otherwise each worker gets ``1/LLM_RATE_LIMIT_WORKERS`` of the limits.
+If Redis fails at runtime the worker falls back to local buckets with that same
+share, so the fleet never exceeds the provider limits.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from app.providers.llm_manager import LLMType
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis es opcional
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+LLM_RATE_LIMIT_ENABLED = os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() == "true"
+LLM_RATE_LIMIT_REDIS_URL = os.getenv("LLM_RATE_LIMIT_REDIS_URL", "")
+LLM_RATE_LIMIT_WORKERS = int(os.getenv("LLM_RATE_LIMIT_WORKERS", os.getenv("WEB_CONCURRENCY", 1)))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", 2))
+# Límites por modelo, p.ej. "gpt-4o=500:30000;gpt-4o-mini=500:200000" (RPM:TPM)
+LLM_LIMITS = os.getenv("LLM_LIMITS", "")
+# Tokens estimados por imagen (página A4 en alta resolución)
+IMAGE_TOKENS_ESTIMATE = 765
+CHARS_PER_TOKEN = 4
+MAX_SLEEP = 1.0
+
+# Límites por defecto (tier 2 de OpenAI, tier 1 del resto)
+DEFAULT_LIMITS: Dict[str, Tuple[int, int]] = {
+    LLMType.GPT_4O_MINI.value: (5000, 2_000_000),
+    LLMType.GPT_4O.value: (5000, 450_000),
+    LLMType.AZURE_OPENAI.value: (300, 60_000),
+    LLMType.ANTHROPIC_CLAUDE.value: (50, 40_000),
+    LLMType.GEMINI.value: (60, 100_000),
+}
+
+# KEYS: bucket de peticiones, bucket de tokens
+# ARGV: capacidad y recarga/s de peticiones, capacidad y recarga/s de tokens, tokens pedidos
+# Devuelve los segundos a esperar (0 si la reserva se hizo)
+TOKEN_BUCKET_LUA = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local amount = i == 1 and 1 or math.min(tonumber(ARGV[5]), capacity)
+    local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + (now - ts) * rate)
+    levels[i] = level
+    if level < amount then
+        wait = math.max(wait, (amount - level) / rate)
+    end
+end
+for i = 1, 2 do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local level = levels[i]
+    if wait == 0 then
+        level = level - (i == 1 and 1 or math.min(tonumber(ARGV[5]), capacity))
+    end
+    redis.call('HSET', KEYS[i], 'level', level, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class Priority(IntEnum):
+    """Scheduling priority; lower values are served first"""
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+@dataclass
+class ModelLimits:
+    """Requests and tokens per minute allowed for a model"""
+    rpm: int
+    tpm: int
+
+    def share(self, workers: int) -> "ModelLimits":
+        workers = max(workers, 1)
+        return ModelLimits(rpm=max(self.rpm // workers, 1), tpm=max(self.tpm // workers, 1))
+
+
+def load_limits() -> Dict[str, ModelLimits]:
+    """Default limits overridden by LLM_LIMITS"""
+    limits = {model: ModelLimits(rpm, tpm) for model, (rpm, tpm) in DEFAULT_LIMITS.items()}
+    for entry in filter(None, LLM_LIMITS.split(";")):
+        model, _, values = entry.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = ModelLimits(int(rpm), int(tpm))
+    return limits
+
+
+def estimate_tokens(messages: Any, max_tokens: Optional[int] = None) -> int:
+    """Tokens a request counts against the TPM limit: prompt estimate plus the completion allowance"""
+    if isinstance(messages, str):
+        messages = [messages]
+    text_chars, images = 0, 0
+    for message in messages or []:
+        content = getattr(message, "content", message)
+        parts = content if isinstance(content, list) else [content]
+        for part in parts:
+            if isinstance(part, dict):
+                if part.get("type") == "image_url":
+                    images += 1
+                else:
+                    text_chars += len(str(part.get("text", "")))
+            else:
+                text_chars += len(str(part))
+    return math.ceil(text_chars / CHARS_PER_TOKEN) + images * IMAGE_TOKENS_ESTIMATE + (max_tokens or 0)
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether a provider error is a 429"""
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after(error: BaseException, default: float = 1.0) -> float:
+    """Seconds suggested by the provider in the Retry-After header"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", default))
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """In-process token bucket refilled continuously"""
+
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+
+
+class _ModelQueue:
+    """Priority queue and buckets of a single model"""
+
+    def __init__(self, model: str, limits: ModelLimits):
+        self.model = model
+        self.limits = limits
+        self.requests = TokenBucket(limits.rpm, limits.rpm)
+        self.tokens = TokenBucket(limits.tpm, limits.tpm)
+        self.waiters: List[_Waiter] = []
+        self.dispatcher: Optional[asyncio.Task] = None
+        self.penalty_until = 0.0
+        self.waits: Deque[float] = deque(maxlen=500)
+        self.acquired = 0
+        self.max_wait = 0.0
+
+
+class RateLimiter:
+    """Process-wide scheduler smoothing LLM requests under each model's RPM/TPM limits
+
+    Args:
+        limits: Limits per model name; unknown models are not limited.
+        redis_url: Optional Redis URL to share the buckets across workers.
+        workers: Workers sharing the limits when Redis is not configured.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, ModelLimits]] = None, redis_url: str = "",
+                 workers: int = 1, enabled: bool = True):
+        self.enabled = enabled
+        self.redis = aioredis.from_url(redis_url) if (redis_url and aioredis) else None
+        if redis_url and aioredis is None:
+            logger.warning("LLM_RATE_LIMIT_REDIS_URL set but redis is not installed; using local buckets")
+        shared = self.redis is not None
+        self.workers = workers
+        self.limits = {model: (limit if shared else limit.share(workers))
+                       for model, limit in (limits if limits is not None else load_limits()).items()}
+        self._script = self.redis.register_script(TOKEN_BUCKET_LUA) if self.redis else None
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _queue(self, model: str) -> _ModelQueue:
+        with self._lock:
+            if model not in self._queues:
+                self._queues[model] = _ModelQueue(model, self.limits[model])
+            return self._queues[model]
+
+    def queued(self, model: str) -> int:
+        """Requests of a model currently waiting for capacity"""
+        queue = self._queues.get(model)
+        return len(queue.waiters) if queue else 0
+
+    async def acquire(self, model: str, tokens: int, priority: Priority = Priority.NORMAL) -> float:
+        """
+        Wait until the model has capacity for one request of ``tokens`` tokens
+
+        Returns:
+            Seconds spent in the queue
+        """
+        if not self.enabled or model not in self.limits:
+            return 0.0
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Nuevo event loop (p.ej. tests): las colas del anterior ya no son válidas
+            self._queues.clear()
+            self._loop = loop
+
+        queue = self._queue(model)
+        waiter = _Waiter(int(priority), next(self._seq), tokens, loop.create_future(), loop.time())
+        heapq.heappush(queue.waiters, waiter)
+        if queue.dispatcher is None or queue.dispatcher.done():
+            queue.dispatcher = asyncio.ensure_future(self._dispatch(queue))
+        await waiter.future
+        return waiter.future.result()
+
+    def penalize(self, model: str, seconds: float) -> None:
+        """Hold the model's queue after the provider answered 429"""
+        if model in self.limits:
+            queue = self._queue(model)
+            queue.penalty_until = max(queue.penalty_until, time.monotonic() + seconds)
+            logger.warning(f"Rate limited by provider on {model}, holding queue {seconds:.1f}s")
+
+    async def _reserve(self, queue: _ModelQueue, tokens: int) -> float:
+        if self._script is not None:
+            try:
+                limits = queue.limits
+                wait = await self._script(
+                    keys=[f"llm:rate:{queue.model}:requests", f"llm:rate:{queue.model}:tokens"],
+                    args=[limits.rpm, limits.rpm / 60.0, limits.tpm, limits.tpm / 60.0, tokens]
+                )
+                return float(wait)
+            except Exception as e:
+                logger.warning(f"Redis rate limiter unavailable, using local buckets: {str(e)}")
+                self._use_local_buckets()
+        wait = max(queue.requests.wait_time(1), queue.tokens.wait_time(tokens))
+        if wait == 0:
+            queue.requests.consume(1)
+            queue.tokens.consume(tokens)
+        return wait
+
+    def _use_local_buckets(self) -> None:
+        """Switch from Redis to per-worker buckets holding this worker's share of each limit."""
+        with self._lock:
+            if self._script is None:
+                return
+            self._script = None
+            self.limits = {model: limit.share(self.workers) for model, limit in self.limits.items()}
+            for model, queue in self._queues.items():
+                queue.limits = self.limits[model]
+                queue.requests = TokenBucket(queue.limits.rpm, queue.limits.rpm)
+                queue.tokens = TokenBucket(queue.limits.tpm, queue.limits.tpm)
+
+    async def _dispatch(self, queue: _ModelQueue) -> None:
+        loop = asyncio.get_running_loop()
+        while queue.waiters:
+            waiter = queue.waiters[0]
+            if waiter.future.done():  # cancelado mientras esperaba
+                heapq.heappop(queue.waiters)
+                continue
+            wait = queue.penalty_until - time.monotonic()
+            if wait <= 0:
+                wait = await self._reserve(queue, waiter.tokens)
+            if wait > 0:
+                await asyncio.sleep(min(wait, MAX_SLEEP))
+                continue
+            heapq.heappop(queue.waiters)
+            waited = loop.time() - waiter.enqueued
+            queue.waits.append(waited)
+            queue.acquired += 1
+            queue.max_wait = max(queue.max_wait, waited)
+            if not waiter.future.done():
+                waiter.future.set_result(waited)
+
+    def snapshot(self) -> dict:
+        """Queue depth and queue wait time per model"""
+        result = {}
+        for model, queue in list(self._queues.items()):
+            waits = sorted(queue.waits)
+            quantile = lambda q: waits[min(int(q * len(waits)), len(waits) - 1)] if waits else 0.0
+            result[model] = {
+                "rpm": queue.limits.rpm,
+                "tpm": queue.limits.tpm,
+                "queued": len(queue.waiters),
+                "acquired": queue.acquired,
+                "wait_p50": quantile(0.5),
+                "wait_p95": quantile(0.95),
+                "wait_max": queue.max_wait,
+            }
+        return {"backend": "redis" if self._script is not None else "local", "models": result}
+
+    async def aclose(self) -> None:
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+@lru_cache()
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter"""
+    return RateLimiter(redis_url=LLM_RATE_LIMIT_REDIS_URL, workers=LLM_RATE_LIMIT_WORKERS,
+                       enabled=LLM_RATE_LIMIT_ENABLED)
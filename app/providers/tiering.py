@@ -0,0 +1,120 @@
+"""
+Tiering Module - Confidence-based model routing
+
+Each node asks its cheapest tier first, with a ``confidence`` field added to the
+structured output schema. The answer is accepted when the self-reported
+confidence reaches the node threshold and the caller's deterministic
+cross-check agrees; otherwise the request escalates to the next tier. The last
+tier's answer is always accepted.
+
+Tiers and thresholds are configured per node:
+    LLM_TIERS_VALIDATE_PAGE="gpt-4o-mini,gpt-4o"
+    LLM_TIER_THRESHOLD_VALIDATE_PAGE=0.8
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Sequence, get_type_hints
+
+from typing_extensions import Annotated, TypedDict
+
+from app.providers.llm_manager import LLMManager, LLMType
+from app.providers.policy import ResilientLLM
+from app.providers.rate_limit import Priority
+
+logger = logging.getLogger(__name__)
+
+LLM_TIER_THRESHOLD = float(os.getenv("LLM_TIER_THRESHOLD", 0.75))
+CONFIDENCE_FIELD = "confidence"
+CONFIDENCE_DESCRIPTION = ("Confianza de 0 a 1 en que la respuesta es correcta y completa según el documento; "
+                          "usa valores bajos si faltan datos, hay ambigüedad o tuviste que suponer algo.")
+
+# Una comprobación devuelve el motivo del desacuerdo, o None si la respuesta es coherente
+CrossCheck = Callable[[dict], Optional[str]]
+
+_scored_schemas: Dict[Any, Any] = {}
+_outcomes: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_outcomes_lock = threading.Lock()
+
+
+def scored_schema(schema: Any) -> Any:
+    """The TypedDict ``schema`` with a ``confidence`` field, keeping its name"""
+    if schema not in _scored_schemas:
+        fields = dict(get_type_hints(schema))
+        fields[CONFIDENCE_FIELD] = Annotated[float, ..., CONFIDENCE_DESCRIPTION]
+        scored = TypedDict(schema.__name__, fields)
+        scored.__doc__ = schema.__doc__
+        _scored_schemas[schema] = scored
+    return _scored_schemas[schema]
+
+
+def node_tiers(node: str, default: Sequence[LLMType]) -> tuple:
+    """Tiers and threshold of a node, from LLM_TIERS_<NODE> and LLM_TIER_THRESHOLD_<NODE>"""
+    env_tiers = os.getenv(f"LLM_TIERS_{node.upper()}")
+    tiers = [LLMType(t.strip()) for t in env_tiers.split(",") if t.strip()] if env_tiers else list(default)
+    threshold = float(os.getenv(f"LLM_TIER_THRESHOLD_{node.upper()}", LLM_TIER_THRESHOLD))
+    return tiers, threshold
+
+
+def tiering_snapshot() -> dict:
+    """Answers accepted per node and tier, plus escalations"""
+    with _outcomes_lock:
+        return {node: dict(counts) for node, counts in _outcomes.items()}
+
+
+def _count(node: str, key: str) -> None:
+    with _outcomes_lock:
+        _outcomes[node][key] += 1
+
+
+class TieredLLM:
+    """Routes a node's structured calls through increasingly capable models
+
+    Args:
+        manager: LLMManager used to resolve the clients.
+        node: Graph node name, used for configuration and metrics.
+        tiers: Default models from cheapest to most capable.
+        priority: Scheduling priority in the rate limiter queues.
+    """
+
+    def __init__(self, manager: LLMManager, node: str, tiers: Sequence[LLMType],
+                 priority: Priority = Priority.NORMAL, schema: Any = None):
+        self.manager = manager
+        self.node = node
+        self.tiers, self.threshold = node_tiers(node, tiers)
+        self.priority = priority
+        self.schema = schema
+
+    def with_structured_output(self, schema: Any) -> "TieredLLM":
+        """Same routing, answering with the given TypedDict schema"""
+        return TieredLLM(self.manager, self.node, self.tiers, self.priority, schema)
+
+    async def ainvoke(self, messages: Any, check: Optional[CrossCheck] = None) -> dict:
+        """
+        Invoke tier by tier until an answer is confident and passes ``check``
+
+        Args:
+            messages: Messages of the request
+            check: Deterministic cross-check of the answer (without its confidence)
+
+        Returns:
+            The accepted answer, in the original schema (confidence removed)
+        """
+        schema = scored_schema(self.schema)
+        result: dict = {}
+        for index, llm_type in enumerate(self.tiers):
+            llm = ResilientLLM(self.manager, llm_type, priority=self.priority).with_structured_output(schema)
+            result = dict(await llm.ainvoke(messages))
+            confidence = result.pop(CONFIDENCE_FIELD, None)
+            if index == len(self.tiers) - 1:
+                break
+            disagreement = check(result) if check else None
+            if confidence is not None and confidence >= self.threshold and disagreement is None:
+                break
+            reason = disagreement or f"confidence {confidence} < {self.threshold}"
+            logger.info(f"{self.node}: escalating from {llm_type.value} ({reason})")
+            _count(self.node, "escalations")
+        _count(self.node, llm_type.value)
+        return result
@@ -0,0 +1,153 @@
+"""
+Almacén de documentos por contenido.
+
+El estado del grafo no guarda ``UploadFile`` (no se puede serializar en un
+checkpoint): guarda el SHA-256 del PDF y el nombre del archivo. El contenido se
+escribe una vez en ``DOCUMENT_STORE_DIR`` y cada nodo abre su propia copia en
+memoria, de modo que las ramas paralelas no comparten puntero de lectura y una
+ejecución reanudada encuentra el mismo documento.
+
+Los documentos son datos personales y no se conservan más de lo necesario: cada
+petición o trabajo que guarda un documento lo retiene con un ``holder`` y lo
+libera al terminar; el archivo se borra cuando ya no lo retiene nadie. Las
+retenciones huérfanas (procesos caídos) y los archivos sin retener se podan con
+la misma antigüedad que los checkpoints. Las retenciones viven en una base SQLite
+del propio directorio, compartida por los workers de uvicorn.
+"""
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Mapping, Optional
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "uploaded_files/documents")
+
+
+def document_digest(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class DocumentStore:
+    """PDFs en disco indexados por su digest, con las retenciones que los mantienen."""
+
+    def __init__(self, directory: str = DOCUMENT_STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.holds_db = os.path.join(directory, "holds.sqlite")
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS document_holds "
+                       "(holder TEXT PRIMARY KEY, digest TEXT NOT NULL, created_at REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS document_holds_digest ON document_holds (digest)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transacción exclusiva: retener, liberar y borrar archivos no se entrelazan entre procesos."""
+        db = sqlite3.connect(self.holds_db, timeout=30, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.pdf")
+
+    def put(self, content: bytes, holder: Optional[str] = None) -> str:
+        """
+        Guarda el documento (si no estaba ya) y devuelve su digest.
+
+        Args:
+            holder: Retiene el documento hasta ``release(holder)``; sin él, el archivo solo
+                sobrevive hasta la siguiente poda
+        """
+        digest = document_digest(content)
+        path = self.path(digest)
+        with self._transaction() as db:
+            if holder:
+                db.execute("INSERT OR REPLACE INTO document_holds (holder, digest, created_at) VALUES (?, ?, ?)",
+                           (holder, digest, time.time()))
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as fh:
+                    fh.write(content)
+                os.replace(tmp_path, path)
+                logger.debug(f"Documento {digest[:12]} guardado ({len(content)} bytes)")
+        return digest
+
+    def _delete_unheld(self, db: sqlite3.Connection, digest: str) -> bool:
+        if db.execute("SELECT 1 FROM document_holds WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return False
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            return False
+        logger.debug(f"Documento {digest[:12]} eliminado")
+        return True
+
+    def release(self, holder: str) -> None:
+        """Libera la retención; el documento se borra si nadie más lo retiene."""
+        with self._transaction() as db:
+            row = db.execute("SELECT digest FROM document_holds WHERE holder = ?", (holder,)).fetchone()
+            if row is None:
+                return
+            db.execute("DELETE FROM document_holds WHERE holder = ?", (holder,))
+            self._delete_unheld(db, row[0])
+
+    def prune(self, max_age_hours: float) -> int:
+        """
+        Elimina las retenciones más antiguas que ``max_age_hours`` y los documentos sin retener
+        que nadie ha guardado desde entonces.
+
+        Returns:
+            Documentos eliminados
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        with self._transaction() as db:
+            db.execute("DELETE FROM document_holds WHERE created_at < ?", (cutoff,))
+            for name in os.listdir(self.directory):
+                if not name.endswith(".pdf"):
+                    continue
+                try:
+                    if os.path.getmtime(os.path.join(self.directory, name)) >= cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                removed += self._delete_unheld(db, name[:-len(".pdf")])
+        if removed:
+            logger.info(f"Documentos: {removed} archivo(s) sin retener eliminados")
+        return removed
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as fh:
+            return fh.read()
+
+    def upload(self, digest: str, filename: str) -> UploadFile:
+        """Copia en memoria del documento, con la interfaz que esperan los agentes."""
+        return UploadFile(file=io.BytesIO(self.get(digest)), filename=filename)
+
+
+@lru_cache()
+def get_document_store() -> DocumentStore:
+    """Almacén compartido por el proceso."""
+    return DocumentStore()
+
+
+def document_file(state: Mapping) -> UploadFile:
+    """Archivo del documento referenciado por el estado del grafo."""
+    return get_document_store().upload(state["document_digest"], state["filename"])
@@ -0,0 +1,118 @@
+"""
+Extracciones de documento reutilizables entre personas.
+
+Los datos de una constancia (vigencia, póliza, aseguradora, fechas) no dependen de
+quién se consulte, así que se extraen una vez por sección y se guardan en la tabla
+``document_extractions`` con una caché LRU en memoria delante. Validar el mismo
+documento para otro trabajador solo cuesta buscar la sección aquí y localizar a la
+persona en el índice de asegurados.
+
+Si la base de datos no está disponible se sigue funcionando solo con la memoria.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional
+
+from app.providers.llm_manager import in_offline_context
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_STORE_DB = os.getenv("EXTRACTION_STORE_DB", "true").lower() == "true"
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", 4096))
+# Tras un error de base de datos se deja de consultarla durante este tiempo
+DB_RETRY_SECONDS = 60
+
+
+def section_digest(page_content: str, insurer: Optional[str]) -> str:
+    """Clave de la extracción: solo depende del documento (texto de la sección y aseguradora)."""
+    return hashlib.sha256(f"{insurer or ''}\n{page_content}".encode("utf-8")).hexdigest()
+
+
+class ExtractionStore:
+    """LRU en memoria respaldado por la tabla document_extractions."""
+
+    def __init__(self, max_entries: int = EXTRACTION_CACHE_SIZE, use_db: bool = EXTRACTION_STORE_DB):
+        self.max_entries = max(max_entries, 1)
+        self.use_db = use_db
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_down_until = 0.0
+        self.stats: Dict[str, int] = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stored": 0, "db_errors": 0}
+
+    def _remember(self, key: str, fields: dict) -> None:
+        with self._lock:
+            self._memory[key] = fields
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _db_enabled(self) -> bool:
+        return self.use_db and time.monotonic() >= self._db_down_until
+
+    def _db_failed(self, action: str, error: Exception) -> None:
+        self.stats["db_errors"] += 1
+        self._db_down_until = time.monotonic() + DB_RETRY_SECONDS
+        logger.warning(f"Extraction store: {action} failed, using memory only for {DB_RETRY_SECONDS}s: {error}")
+
+    @staticmethod
+    def _load(key: str) -> Optional[dict]:
+        from app.config.database import SessionLocal
+        from app.model.model import DocumentExtraction
+        with SessionLocal() as session:
+            row = session.get(DocumentExtraction, key)
+            return dict(row.fields) if row else None
+
+    @staticmethod
+    def _save(key: str, insurer: Optional[str], fields: dict, source: str) -> None:
+        from app.config.database import SessionLocal
+        from app.model.model import DocumentExtraction
+        with SessionLocal() as session:
+            session.merge(DocumentExtraction(section_digest=key, insurer=insurer, fields=fields, source=source))
+            session.commit()
+
+    async def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            fields = self._memory.get(key)
+            if fields is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return dict(fields)
+        if self._db_enabled():
+            try:
+                fields = await asyncio.to_thread(self._load, key)
+            except Exception as e:
+                self._db_failed("load", e)
+            if fields is not None:
+                self.stats["db_hits"] += 1
+                self._remember(key, fields)
+                return dict(fields)
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, insurer: Optional[str], fields: dict, source: str) -> None:
+        if in_offline_context():
+            # Las extracciones del proveedor fake (warmup) no se guardan
+            return
+        self._remember(key, dict(fields))
+        self.stats["stored"] += 1
+        if self._db_enabled():
+            try:
+                await asyncio.to_thread(self._save, key, insurer, fields, source)
+            except Exception as e:
+                self._db_failed("save", e)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._memory)}
+
+
+@lru_cache()
+def get_extraction_store() -> ExtractionStore:
+    """Almacén compartido por el proceso."""
+    return ExtractionStore()
@@ -0,0 +1,155 @@
+"""
+Registro de aseguradoras conocidas.
+
+Las aseguradoras y sus variantes de nombre se cargan, por orden, desde el JSON
+de ``INSURERS_FILE``, desde la tabla ``insurers`` o desde ``DEFAULT_INSURERS``,
+y se pueden recargar en caliente con ``POST /insurers/reload``. Todas las
+variantes se compilan en una sola expresión regular de alternativas (de la más
+larga a la más corta), así que identificar la aseguradora es una única pasada
+por el nombre del archivo y la primera página, sin importar cuántas haya.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.util.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+INSURERS_FILE = os.getenv("INSURERS_FILE", "")
+
+DEFAULT_INSURERS: Dict[str, List[str]] = {
+    "MAPFRE": ["MAPFRE", "MAPFRE PERU"],
+    "PACIFICO": ["PACIFICO", "PACIFICO SEGUROS", "PACIFICO EPS"],
+    "RIMAC": ["RIMAC", "RIMAC SEGUROS"],
+    "SANITAS": ["SANITAS", "SANITAS PERU"],
+    "LA POSITIVA": ["LA POSITIVA", "LA POSITIVA VIDA"]
+}
+
+# Confianza según dónde se encontró la aseguradora
+FILENAME_CONFIDENCE = 0.8
+TEXT_CONFIDENCE = 0.9
+CONFIRMED_CONFIDENCE = 0.99  # nombre de archivo y texto coinciden
+CONTRADICTED_CONFIDENCE = 0.5  # el texto nombra otra aseguradora
+
+
+@dataclass(frozen=True)
+class InsurerMatch:
+    """Aseguradora encontrada, con la variante y su posición en el texto normalizado."""
+    company: str
+    variant: str
+    source: str  # filename o text
+    position: int
+    confidence: float
+
+
+class InsurerMatcher:
+    """Alternativa única precompilada sobre todas las variantes."""
+
+    def __init__(self, insurers: Dict[str, List[str]]):
+        self.insurers = {company: list(variations) for company, variations in insurers.items()}
+        self.companies: Dict[str, str] = {}
+        for company, variations in self.insurers.items():
+            for variation in [company, *variations]:
+                key = normalize_text(variation)
+                if key:
+                    self.companies.setdefault(key, company)
+        alternatives = sorted(self.companies, key=len, reverse=True)
+        body = "|".join(re.escape(key).replace(r"\ ", r"\s+") for key in alternatives)
+        self.pattern = re.compile(rf"(?<![A-Z0-9])(?:{body})(?![A-Z0-9])") if alternatives else None
+
+    def search(self, text: str, source: str, confidence: float) -> Optional[InsurerMatch]:
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(normalize_text(text))
+        if not match:
+            return None
+        variant = " ".join(match.group(0).split())
+        return InsurerMatch(company=self.companies[variant], variant=variant, source=source,
+                            position=match.start(), confidence=confidence)
+
+
+class InsurerRegistry:
+    """Aseguradoras vigentes; ``reload`` sustituye el matcher sin reiniciar el servicio."""
+
+    def __init__(self, insurers: Optional[Dict[str, List[str]]] = None):
+        self._lock = threading.Lock()
+        self._matcher = InsurerMatcher(insurers or DEFAULT_INSURERS)
+        self.source = "default"
+
+    @property
+    def insurers(self) -> Dict[str, List[str]]:
+        return self._matcher.insurers
+
+    def variations(self, company: str) -> List[str]:
+        """Variantes de nombre de una aseguradora (el propio nombre si no está registrada)."""
+        return self._matcher.insurers.get(company, [company])
+
+    def match_filename(self, filename: str) -> Optional[InsurerMatch]:
+        clean_filename = re.sub(r'\.[^.]+$', '', filename or "")
+        return self._matcher.search(clean_filename, "filename", FILENAME_CONFIDENCE)
+
+    def match_text(self, text: str) -> Optional[InsurerMatch]:
+        return self._matcher.search(text or "", "text", TEXT_CONFIDENCE)
+
+    def identify(self, filename: str, first_page: str = "") -> Optional[InsurerMatch]:
+        """
+        Identifica la aseguradora; el nombre del archivo tiene prioridad y el texto lo confirma.
+
+        Args:
+            filename: Nombre del archivo subido
+            first_page: Texto de la primera página
+
+        Returns:
+            InsurerMatch con la confianza ajustada, o None si no se reconoce
+        """
+        by_filename = self.match_filename(filename)
+        by_text = self.match_text(first_page) if first_page else None
+        if by_filename is None:
+            return by_text
+        if by_text is None:
+            return by_filename
+        if by_text.company == by_filename.company:
+            confidence = CONFIRMED_CONFIDENCE
+        else:
+            logger.warning(f"Archivo {filename} indica {by_filename.company} pero el texto nombra a {by_text.company}")
+            confidence = CONTRADICTED_CONFIDENCE
+        return InsurerMatch(by_filename.company, by_filename.variant, "filename", by_filename.position, confidence)
+
+    def reload(self, session: Optional[Session] = None) -> Dict[str, List[str]]:
+        """Vuelve a cargar las aseguradoras desde el archivo, la base de datos o los valores por defecto."""
+        insurers, source = load_insurers(session)
+        matcher = InsurerMatcher(insurers)
+        with self._lock:
+            self._matcher, self.source = matcher, source
+        logger.info(f"Registro de aseguradoras recargado desde {source}: {len(insurers)} aseguradoras")
+        return matcher.insurers
+
+
+def load_insurers(session: Optional[Session] = None) -> tuple:
+    """Aseguradoras y su origen: INSURERS_FILE, tabla insurers o DEFAULT_INSURERS."""
+    if INSURERS_FILE:
+        with open(INSURERS_FILE, encoding="utf-8") as fh:
+            return json.load(fh), "file"
+    if session is not None:
+        from app.model.model import Insurer
+        rows = session.query(Insurer).filter(Insurer.active.is_(True)).all()
+        if rows:
+            return {row.name: list(row.variations or []) for row in rows}, "database"
+    return DEFAULT_INSURERS, "default"
+
+
+@lru_cache()
+def get_insurer_registry() -> InsurerRegistry:
+    """Registro compartido por el proceso."""
+    registry = InsurerRegistry()
+    if INSURERS_FILE:
+        registry.reload()
+    return registry
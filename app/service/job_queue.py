@@ -0,0 +1,363 @@
+"""
+Cola de trabajos de validación.
+
+``POST /document/v2/jobs`` guarda el documento, encola el trabajo en SQLite
+(``JOB_QUEUE_DB``) y responde enseguida con su id. Un pool de ``JOB_WORKERS``
+tareas del proceso drena la cola y guarda el resultado, que se consulta por id o
+se recibe en el webhook indicado al encolar.
+
+El webhook lo elige quien encola, así que se valida antes de encolar y otra vez
+antes de cada entrega (la resolución DNS puede cambiar entre ambas): si se
+configura ``JOB_WEBHOOK_ALLOWED_HOSTS`` solo se aceptan esos hosts; si no, se
+rechazan los que resuelven a direcciones privadas, de loopback, link-local o
+reservadas.
+
+Un trabajo se reclama con un lease (``JOB_LEASE_SECONDS``) que el worker renueva
+cada ``JOB_HEARTBEAT_INTERVAL`` mientras lo ejecuta: si el proceso muere a mitad,
+al vencer el lease otro worker lo retoma y, como el grafo de diagnóstico guarda
+checkpoints, la validación reanuda desde el último nodo completado. El reclamo es
+una única sentencia UPDATE, así que varios procesos (uvicorn con varios workers)
+pueden drenar la misma cola. Cada reclamo lleva un token nuevo y las escrituras
+posteriores (renovar, completar, fallar, liberar) solo se aplican con ese token:
+un worker que perdió el lease no pisa el resultado de quien lo retomó.
+"""
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from functools import lru_cache
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs.sqlite")
+# Tareas del pool por proceso (0 = este proceso solo encola)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 900))
+# Cada cuánto renueva el lease el worker que ejecuta el trabajo
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", JOB_LEASE_SECONDS / 3))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Espera máxima entre consultas a la cola (los trabajos de otros procesos no despiertan a este)
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 10))
+WEBHOOK_RETRIES = int(os.getenv("WEBHOOK_RETRIES", 3))
+# Hosts de webhook permitidos, separados por comas ("hooks.example.com,*.example.org");
+# vacío = cualquier host que resuelva a direcciones públicas
+JOB_WEBHOOK_ALLOWED_HOSTS = [host.strip().lower() for host in os.getenv("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",")
+                             if host.strip()]
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS validation_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    webhook_url TEXT,
+    result TEXT,
+    error TEXT,
+    webhook_status TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    claim_token TEXT
+);
+CREATE INDEX IF NOT EXISTS validation_jobs_pending ON validation_jobs (status, created_at);
+"""
+
+JobHandler = Callable[[dict], Awaitable[dict]]
+JobCallback = Callable[[dict], Awaitable[None]]
+
+
+class JobQueue:
+    """Trabajos persistidos en SQLite; cada operación abre su conexión en un hilo."""
+
+    def __init__(self, path: str = JOB_QUEUE_DB):
+        self.path = path
+        self.wakeup = asyncio.Event()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(validation_jobs)")}
+            if "claim_token" not in columns:
+                db.execute("ALTER TABLE validation_jobs ADD COLUMN claim_token TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        db = self._connect()
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for field in ("payload", "result"):
+            if job.get(field) is not None:
+                job[field] = json.loads(job[field])
+        return job
+
+    async def submit(self, payload: dict, webhook_url: Optional[str] = None) -> str:
+        """Encola un trabajo y despierta al pool del proceso."""
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO validation_jobs (id, status, payload, webhook_url, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), webhook_url, time.time()))
+        self.wakeup.set()
+        return job_id
+
+    async def claim(self) -> Optional[dict]:
+        """
+        El trabajo pendiente más antiguo (o uno cuyo lease venció), marcado como en curso.
+
+        El trabajo devuelto incluye su ``claim_token``, necesario para las escrituras posteriores.
+        """
+        now = time.time()
+        rows = await asyncio.to_thread(
+            self._execute,
+            """UPDATE validation_jobs
+               SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ?, claim_token = ?
+               WHERE id = (SELECT id FROM validation_jobs
+                           WHERE status = ? OR (status = ? AND lease_until < ?)
+                           ORDER BY created_at LIMIT 1)
+               RETURNING *""",
+            (RUNNING, now, now + JOB_LEASE_SECONDS, uuid.uuid4().hex, QUEUED, RUNNING, now))
+        return self._job(rows[0]) if rows else None
+
+    async def _update_claimed(self, sql: str, params: tuple, job_id: str, claim_token: str) -> bool:
+        """UPDATE de un trabajo en curso que solo se aplica si este reclamo sigue siendo el dueño."""
+        rows = await asyncio.to_thread(
+            self._execute, f"{sql} WHERE id = ? AND claim_token = ? AND status = ? RETURNING id",
+            (*params, job_id, claim_token, RUNNING))
+        if not rows:
+            logger.warning(f"Job {job_id}: lease lost, update skipped")
+        return bool(rows)
+
+    async def extend_lease(self, job_id: str, claim_token: str) -> bool:
+        """Renueva el lease; False si otro worker retomó el trabajo."""
+        return await self._update_claimed("UPDATE validation_jobs SET lease_until = ?",
+                                          (time.time() + JOB_LEASE_SECONDS,), job_id, claim_token)
+
+    async def complete(self, job_id: str, claim_token: str, result: dict) -> bool:
+        return await self._update_claimed(
+            "UPDATE validation_jobs SET status = ?, result = ?, error = NULL, finished_at = ?, lease_until = NULL",
+            (DONE, json.dumps(result, default=str), time.time()), job_id, claim_token)
+
+    async def fail(self, job_id: str, claim_token: str, error: str, retry: bool = False) -> bool:
+        """Marca el trabajo como fallido, o lo devuelve a la cola si quedan intentos."""
+        return await self._update_claimed(
+            "UPDATE validation_jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL",
+            (QUEUED if retry else FAILED, error, None if retry else time.time()), job_id, claim_token)
+
+    async def release(self, job_id: str, claim_token: str) -> bool:
+        """Devuelve a la cola un trabajo interrumpido (apagado del proceso) sin gastar un intento."""
+        return await self._update_claimed(
+            "UPDATE validation_jobs SET status = ?, attempts = attempts - 1, lease_until = NULL",
+            (QUEUED,), job_id, claim_token)
+
+    async def set_webhook_status(self, job_id: str, webhook_status: str) -> None:
+        await asyncio.to_thread(self._execute, "UPDATE validation_jobs SET webhook_status = ? WHERE id = ?",
+                                (webhook_status, job_id))
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        rows = await asyncio.to_thread(self._execute, "SELECT * FROM validation_jobs WHERE id = ?", (job_id,))
+        return self._job(rows[0]) if rows else None
+
+    async def snapshot(self) -> dict:
+        rows = await asyncio.to_thread(self._execute,
+                                       "SELECT status, COUNT(*) AS jobs FROM validation_jobs GROUP BY status")
+        return {row["status"]: row["jobs"] for row in rows}
+
+
+class WebhookRejectedError(ValueError):
+    """La URL del webhook no es un destino permitido."""
+
+
+def _host_allowed(host: str, allowed_hosts: List[str]) -> bool:
+    return any(host == allowed or (allowed.startswith("*.") and host.endswith(allowed[1:]))
+               for allowed in allowed_hosts)
+
+
+async def check_webhook_url(url: str, allowed_hosts: Optional[List[str]] = None) -> None:
+    """
+    Comprueba que el webhook sea un destino permitido.
+
+    Los hosts de ``allowed_hosts`` (por defecto ``JOB_WEBHOOK_ALLOWED_HOSTS``) se aceptan
+    tal cual; con la lista vacía, todas las direcciones del host deben ser públicas.
+
+    Raises:
+        WebhookRejectedError: Si la URL no es http(s), el host no está permitido o no resuelve
+    """
+    allowed_hosts = JOB_WEBHOOK_ALLOWED_HOSTS if allowed_hosts is None else allowed_hosts
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError as e:
+        raise WebhookRejectedError(f"invalid webhook_url: {e}")
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise WebhookRejectedError("webhook_url must be an http(s) URL")
+    if parts.username or parts.password:
+        raise WebhookRejectedError("webhook_url must not carry credentials")
+    if allowed_hosts:
+        if not _host_allowed(host, allowed_hosts):
+            raise WebhookRejectedError(f"webhook host {host} is not allowed")
+        return
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise WebhookRejectedError(f"webhook host {host} does not resolve: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise WebhookRejectedError(f"webhook host {host} resolves to a non-public address ({address})")
+
+
+async def deliver_webhook(url: str, body: dict) -> str:
+    """POST del resultado al webhook, con reintentos; devuelve el estado de la entrega."""
+    try:
+        await check_webhook_url(url)
+    except WebhookRejectedError as e:
+        logger.warning(f"Webhook {url} rejected: {e}")
+        return f"rejected: {e}"
+    error = ""
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+        for attempt in range(max(WEBHOOK_RETRIES, 1)):
+            if attempt:
+                await asyncio.sleep(2 ** (attempt - 1))
+            try:
+                response = await client.post(url, content=json.dumps(body, default=str),
+                                             headers={"Content-Type": "application/json"})
+                if response.status_code < 400:
+                    return "delivered"
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Webhook {url} attempt {attempt + 1} failed: {error}")
+    return f"failed: {error}"
+
+
+class JobWorkerPool:
+    """
+    Tareas asyncio que ejecutan los trabajos de la cola con ``handler``.
+
+    ``on_finished`` recibe el trabajo cuando ya no se volverá a ejecutar (terminado o fallido sin
+    más intentos), p.ej. para liberar su documento.
+    """
+
+    def __init__(self, queue: JobQueue, handler: JobHandler, workers: int = JOB_WORKERS,
+                 on_finished: Optional[JobCallback] = None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.on_finished = on_finished
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.workers)]
+        logger.info(f"Job pool started with {self.workers} worker(s) on {self.queue.path}")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self, worker: int) -> None:
+        while True:
+            self.queue.wakeup.clear()
+            try:
+                job = await self.queue.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Job worker {worker}: queue unavailable: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.queue.wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job_id: str, claim_token: str) -> None:
+        """Renueva el lease mientras el trabajo se ejecuta; se detiene si otro worker lo retomó."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                if not await self.queue.extend_lease(job_id, claim_token):
+                    return
+            except sqlite3.Error as e:
+                logger.error(f"Job {job_id}: lease renewal failed: {e}")
+
+    async def _run(self, job: dict) -> None:
+        job_id, claim_token = job["id"], job["claim_token"]
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            # Solo ocurre si el lease venció en todos los intentos (procesos caídos a mitad)
+            error = f"abandoned after {JOB_MAX_ATTEMPTS} attempts"
+            if await self.queue.fail(job_id, claim_token, error):
+                await self._finished(job)
+                await self._notify(job, FAILED, error=error)
+            return
+        logger.info(f"Job {job_id} started (attempt {job['attempts']})")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, claim_token))
+        try:
+            result = await self.handler(job["payload"])
+        except asyncio.CancelledError:
+            await asyncio.shield(self.queue.release(job_id, claim_token))
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            retry = job["attempts"] < JOB_MAX_ATTEMPTS
+            logger.error(f"Job {job_id} failed (attempt {job['attempts']}, retry={retry}): {error}")
+            if await self.queue.fail(job_id, claim_token, error, retry=retry) and not retry:
+                await self._finished(job)
+                await self._notify(job, FAILED, error=error)
+            return
+        finally:
+            heartbeat.cancel()
+        if not await self.queue.complete(job_id, claim_token, result):
+            return
+        logger.info(f"Job {job_id} done")
+        await self._finished(job)
+        await self._notify(job, DONE, result=result)
+
+    async def _finished(self, job: dict) -> None:
+        if self.on_finished is None:
+            return
+        try:
+            await self.on_finished(job)
+        except Exception as e:
+            logger.error(f"Job {job['id']}: on_finished failed: {type(e).__name__}: {e}")
+
+    async def _notify(self, job: dict, status: str, result: Optional[dict] = None,
+                      error: Optional[str] = None) -> None:
+        if not job.get("webhook_url"):
+            return
+        webhook_status = await deliver_webhook(job["webhook_url"], {"job_id": job["id"], "status": status,
+                                                                    "result": result, "error": error})
+        await self.queue.set_webhook_status(job["id"], webhook_status)
+
+
+@lru_cache()
+def get_job_queue() -> JobQueue:
+    """Cola compartida por el proceso."""
+    return JobQueue()
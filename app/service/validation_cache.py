@@ -0,0 +1,131 @@
+"""
+Coalescencia y caché de validaciones idénticas.
+
+Reintentos y dobles clics envían la misma validación (mismo PDF, persona y fecha)
+varias veces. La huella de la petición es el thread de la validación (digest del
+documento, persona normalizada y fecha de referencia; ver
+``validation_thread_id``): las opciones de ejecución como ``page_concurrency`` no
+cambian el resultado y no forman parte de ella.
+
+- Single-flight: mientras una validación está en curso, las peticiones idénticas
+  esperan a la misma ejecución en lugar de lanzar otra.
+- Caché: el resultado se guarda ``VALIDATION_CACHE_TTL`` segundos junto con su
+  ETag, de modo que las repeticiones no llaman al LLM y un cliente con
+  ``If-None-Match`` recibe 304.
+
+La ejecución compartida no se cancela si se desconecta el cliente que la inició:
+termina para los demás y su resultado queda en caché. Los errores no se guardan.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VALIDATION_CACHE_TTL = float(os.getenv("VALIDATION_CACHE_TTL", 3600))
+VALIDATION_CACHE_MAX_ENTRIES = int(os.getenv("VALIDATION_CACHE_MAX_ENTRIES", 1024))
+
+
+def result_etag(result: dict) -> str:
+    """ETag fuerte del cuerpo de la respuesta."""
+    payload = json.dumps(result, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return f'"{hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]}"'
+
+
+@dataclass(frozen=True)
+class CachedValidation:
+    result: dict
+    etag: str
+    source: str  # run, coalesced o cache
+
+
+class ValidationCache:
+    """Ejecuciones en curso por huella y resultados recientes con TTL."""
+
+    def __init__(self, ttl: float = VALIDATION_CACHE_TTL, max_entries: int = VALIDATION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self._results: "OrderedDict[str, Tuple[float, dict, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"runs": 0, "coalesced": 0, "hits": 0, "expired": 0, "errors": 0}
+
+    def cached(self, key: str) -> Optional[CachedValidation]:
+        """Resultado vigente de la huella, sin ejecutar nada."""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._results[key]
+                self.stats["expired"] += 1
+                entry = None
+            if entry is None:
+                return None
+            self._results.move_to_end(key)
+            self.stats["hits"] += 1
+            return CachedValidation(result=entry[1], etag=entry[2], source="cache")
+
+    def _store(self, key: str, result: dict) -> str:
+        etag = result_etag(result)
+        if self.ttl > 0:
+            with self._lock:
+                self._results[key] = (time.monotonic() + self.ttl, result, etag)
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        return etag
+
+    async def _execute(self, key: str, run: Callable[[], Awaitable[dict]]) -> Tuple[dict, str]:
+        try:
+            result = await run()
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        return result, self._store(key, result)
+
+    async def get_or_run(self, key: str, run: Callable[[], Awaitable[dict]]) -> CachedValidation:
+        """
+        Resultado de la validación ``key``: de la caché, de la ejecución en curso o de una nueva.
+
+        Args:
+            key: Huella de la petición
+            run: Ejecuta la validación (solo se llama si no hay resultado ni ejecución en curso)
+        """
+        cached = self.cached(key)
+        if cached is not None:
+            return cached
+        task = self._inflight.get(key)
+        source = "coalesced"
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._execute(key, run))
+            source = "run"
+            self.stats["runs"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            logger.info(f"Validation {key} already in flight, waiting for it")
+        # shield: si este cliente se va, la ejecución sigue para los demás
+        result, etag = await asyncio.shield(task)
+        return CachedValidation(result=result, etag=etag, source=source)
+
+    def in_flight(self, key: str) -> Optional[asyncio.Task]:
+        """Ejecución en curso de la huella, si la hay."""
+        return self._inflight.get(key)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._results), "in_flight": len(self._inflight)}
+
+
+@lru_cache()
+def get_validation_cache() -> ValidationCache:
+    """Caché compartida por el proceso."""
+    return ValidationCache()
@@ -0,0 +1,10 @@
+"""Normalización de texto compartida por los agentes y los servicios."""
+import re
+import unicodedata
+
+
+def normalize_text(text: str) -> str:
+    """Mayúsculas sin tildes ni signos de puntuación, con espacios simples."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).upper()
+    return " ".join(re.sub(r"[^A-Z0-9Ñ]+", " ", text).split())
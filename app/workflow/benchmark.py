@@ -0,0 +1,133 @@
+"""
+Offline benchmark of the diagnosis validation graph.
+
+Runs ``DiagnosisValidationGraph`` end to end against the fake LLM provider at a
+given concurrency and reports latency percentiles and throughput, which isolates
+the non-LLM overhead of the pipeline (PDF handling, prompt building, graph
+scheduling) from provider latency. With ``--cassette`` the run replays recorded
+provider traffic instead (real response shapes and timings).
+
+Usage:
+    python -m app.workflow.benchmark uploaded_file.pdf --requests 50 --concurrency 10 \\
+        --latency lognormal:1.5:6.0 --error-rate 0.01
+    LLM_CASSETTE_MODE=record LLM_CASSETTE_PATH=day.jsonl uvicorn main:app   # grabar tráfico real
+    python -m app.workflow.benchmark uploaded_file.pdf --cassette day.jsonl
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from typing import List, Optional
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def run_benchmark(pdf_path: str, requests: int, concurrency: int, worker: str, user_date: str,
+                        page_concurrency: Optional[int] = None) -> dict:
+    """Run the graph ``requests`` times with at most ``concurrency`` runs in flight."""
+    from app.service.document_store import get_document_store
+    from app.service.extraction_store import get_extraction_store
+
+    from app.providers.cassette import cassette_stats
+    from app.providers.policy import policy_snapshot
+    from app.providers.rate_limit import get_rate_limiter
+    from app.workflow.node_cache import node_cache_snapshot
+    from app.workflow.registry import get_graph_registry
+
+    with open(pdf_path, "rb") as f:
+        content = f.read()
+    # Retención propia del benchmark, liberada al terminar
+    holder = f"benchmark:{os.getpid()}"
+    digest = get_document_store().put(content, holder=holder)
+    component = get_graph_registry().get("diagnosis")
+    semaphore = asyncio.Semaphore(concurrency)
+    config = {"configurable": {"page_concurrency": page_concurrency}} if page_concurrency is not None else None
+    latencies: List[float] = []
+    errors: List[str] = []
+
+    async def run_once() -> None:
+        async with semaphore:
+            state = {"document_digest": digest, "filename": os.path.basename(pdf_path), "worker": worker,
+                     "worker_type": "dni" if worker.isdigit() else "name", "user_date": user_date}
+            start = time.perf_counter()
+            try:
+                await component.ainvoke(state, config)
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {str(e)}")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[run_once() for _ in range(requests)])
+    finally:
+        get_document_store().release(holder)
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "errors": sorted(set(errors))[:10],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_s": {name: round(_percentile(latencies, q), 3)
+                      for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "rate_limit": get_rate_limiter().snapshot(),
+        "policy": policy_snapshot(),
+        "cassette": cassette_stats(),
+        "graphs": get_graph_registry().snapshot(),
+        "node_cache": node_cache_snapshot(),
+        "document_extractions": get_extraction_store().snapshot(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the diagnosis validation graph")
+    parser.add_argument("pdf", help="PDF used for every run")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--latency", default=None,
+                        help="Fake latency as distribution:median:p95 (e.g. constant:0.001:0.001)")
+    parser.add_argument("--error-rate", type=float, default=None)
+    parser.add_argument("--cassette", default=None, help="Replay this cassette instead of the fake provider")
+    parser.add_argument("--speed", type=float, default=None, help="Factor applied to recorded latencies")
+    parser.add_argument("--cassette-match", choices=("exact", "endpoint"), default=None,
+                        help="Serve unmatched requests from unused recordings of the same endpoint and model")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--worker", default="FAKE WORKER")
+    parser.add_argument("--user-date", default=None, help="Reference date dd/mm/yyyy")
+    parser.add_argument("--page-concurrency", type=int, default=None,
+                        help="Max validate_page subgraphs in flight per run (default PAGE_CONCURRENCY)")
+    args = parser.parse_args()
+
+    # La configuración de proveedores se lee al importar los módulos de la app
+    if args.cassette:
+        os.environ["LLM_CASSETTE_MODE"] = "replay"
+        os.environ["LLM_CASSETTE_PATH"] = args.cassette
+        if args.speed is not None:
+            os.environ["LLM_CASSETTE_SPEED"] = str(args.speed)
+        if args.cassette_match:
+            os.environ["LLM_CASSETTE_MATCH"] = args.cassette_match
+    else:
+        os.environ["LLM_OFFLINE"] = "true"
+    if args.latency:
+        os.environ["LLM_FAKE_LATENCY"] = args.latency
+    if args.error_rate is not None:
+        os.environ["LLM_FAKE_ERROR_RATE"] = str(args.error_rate)
+    if args.seed is not None:
+        os.environ["LLM_FAKE_SEED"] = str(args.seed)
+
+    report = asyncio.run(run_benchmark(args.pdf, args.requests, args.concurrency, args.worker, args.user_date,
+                                       args.page_concurrency))
+    print(json.dumps(report, indent=2, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Validación masiva: un documento, muchos trabajadores.
+
+Validar una planilla contra una constancia con el grafo de diagnóstico supone una
+ejecución completa por persona. Aquí lo que depende solo del documento se hace
+una vez: segmentación, aseguradora, logotipo, firmas, datos de cada sección
+(``DocumentAgent.document_fields``) e índice de asegurados de cada sección.
+Después cada trabajador es una búsqueda en esos índices y el veredicto de sus
+secciones, con las mismas reglas, terminación anticipada y veredicto final que el
+grafo; el LLM solo interviene en los casos ambiguos.
+
+Los resultados se emiten a medida que terminan, con ``BULK_WORKER_CONCURRENCY``
+trabajadores en curso como máximo.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Tuple
+
+from app.agent.state.state import DocumentFields, PageContent
+from app.agent.utils.insured_index import InsuredIndex, build_insured_index
+from app.workflow.diagnosis_validation_graph_builder import DiagnosisValidationGraph, LOGO_CACHE, SIGNATURE_CACHE
+from app.agent.utils.early_exit_rules import decisive_rule
+from app.workflow.node_cache import cached_node
+from app.workflow.registry import get_graph_registry
+
+logger = logging.getLogger(__name__)
+
+BULK_WORKER_CONCURRENCY = int(os.getenv("BULK_WORKER_CONCURRENCY", 16))
+BULK_MAX_WORKERS = int(os.getenv("BULK_MAX_WORKERS", 1000))
+
+
+@dataclass
+class PreparedSection:
+    """Sección con sus datos de documento e índice de asegurados, compartidos por todos los trabajadores."""
+    page_num: int
+    page_content: str
+    fields: DocumentFields
+    index: InsuredIndex
+
+
+@dataclass
+class PreparedDocument:
+    document_digest: str
+    filename: str
+    enterprise: str
+    sections: List[PreparedSection]
+    logo_diagnosis: list
+    signature_diagnosis: list
+
+
+class BulkValidator:
+    """Valida un documento para una lista de trabajadores reutilizando los agentes del grafo de diagnóstico."""
+
+    def __init__(self, graph: DiagnosisValidationGraph, concurrency: int = BULK_WORKER_CONCURRENCY):
+        self.graph = graph
+        # Mismas políticas que los nodos del grafo: las validaciones individuales y masivas comparten caché
+        self.logo = cached_node("logo_detection", self.graph.logo.verify_logo, LOGO_CACHE)
+        self.signatures = cached_node("detect_signatures", self.graph.signature.verify_signatures, SIGNATURE_CACHE)
+        self.concurrency = max(concurrency, 1)
+
+    async def prepare(self, document_digest: str, filename: str) -> PreparedDocument:
+        """Todo lo que depende solo del documento, una sola vez."""
+        state = {"document_digest": document_digest, "filename": filename}
+        segmented, logo, signatures = await asyncio.gather(self.graph.segment(state), self.logo(state),
+                                                           self.signatures(state))
+        enterprise = segmented["enterprise"]
+        contents = segmented["sections"]
+        fields = await asyncio.gather(*(self.graph.document.document_fields(content, enterprise)
+                                        for content in contents))
+        sections = [
+            PreparedSection(page_num=i + 1, page_content=content, fields=section_fields,
+                            index=build_insured_index(content, section_fields.get("policy_number"),
+                                                      section_fields.get("start_date_validity")))
+            for i, (content, section_fields) in enumerate(zip(contents, fields))
+        ]
+        logger.info(f"Bulk validation: {filename} prepared with {len(sections)} section(s)")
+        return PreparedDocument(document_digest=document_digest, filename=filename, enterprise=enterprise,
+                                sections=sections, logo_diagnosis=logo["logo_diagnosis"],
+                                signature_diagnosis=signatures.get("signature_diagnosis") or [])
+
+    async def validate_worker(self, document: PreparedDocument, worker: str, worker_type: str,
+                              user_date: Optional[str]) -> dict:
+        """
+        Veredicto de un trabajador sobre el documento preparado.
+
+        Las secciones donde figura (o puede figurar) se validan primero: suelen decidir el
+        documento, y entonces las demás no se validan, igual que en el grafo.
+        """
+        pages = [
+            self.graph.document.apply_person(
+                PageContent(page_num=section.page_num, page_content=section.page_content, valid_data=None,
+                            pages_verdicts=None, enterprise=document.enterprise, person=worker,
+                            reference_date=user_date, document_type=worker_type),
+                section.fields, section.index)
+            for section in document.sections
+        ]
+        pages.sort(key=lambda page: page["person_found"] is False)
+
+        page_diagnosis, pages_verdicts, skipped_pages = [], [], []
+        early_exit = None
+        for page in pages:
+            if early_exit is not None:
+                skipped_pages.append(page["page_num"])
+                continue
+            result = await self.graph.judge.validate(page)
+            page_diagnosis.extend(result["page_diagnosis"])
+            pages_verdicts.extend(result["pages_verdicts"])
+            for verdict in result["pages_verdicts"]:
+                rule = decisive_rule(verdict)
+                if rule and early_exit is None:
+                    early_exit = {"rule": rule, "page_num": verdict.get("page_num"), "verdict": verdict}
+
+        summary = await self.graph.judge.summarize({
+            "pages_verdicts": pages_verdicts,
+            "page_diagnosis": page_diagnosis,
+            "logo_diagnosis": document.logo_diagnosis,
+            "signature_diagnosis": document.signature_diagnosis,
+            "page_contents": pages,
+            "early_exit": early_exit,
+            "skipped_pages": skipped_pages,
+        })
+        return {
+            "worker": worker,
+            "worker_type": worker_type,
+            "final_verdict": summary["final_verdict"],
+            "observations": sorted(pages_verdicts, key=lambda verdict: verdict.get("page_num") or 0),
+            "insured_match": [{"page_number": page["page_num"], **page["insured_match"]}
+                              for page in pages if page.get("insured_match")],
+            "skipped_pages": sorted(skipped_pages),
+            "early_exit": early_exit["rule"] if early_exit else None,
+        }
+
+    async def stream(self, document: PreparedDocument, workers: List[Tuple[str, str]],
+                     user_date: Optional[str]) -> AsyncIterator[dict]:
+        """
+        Resultados por trabajador en orden de llegada, precedidos por el documento y seguidos del resumen.
+
+        Si el consumidor deja de leer (cliente desconectado) se cancelan los trabajadores pendientes.
+        """
+        start = time.perf_counter()
+        yield {
+            "event": "document",
+            "document_digest": document.document_digest,
+            "filename": document.filename,
+            "enterprise": document.enterprise,
+            "total_pages": len(document.sections),
+            "workers": len(workers),
+            "signatures": document.signature_diagnosis,
+            "validation_images": document.logo_diagnosis,
+        }
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def validate(position: int, worker: str, worker_type: str) -> dict:
+            async with semaphore:
+                try:
+                    result = await self.validate_worker(document, worker, worker_type, user_date)
+                except Exception as e:
+                    logger.error(f"Bulk validation failed for {worker}: {e}")
+                    return {"event": "worker", "index": position, "worker": worker, "worker_type": worker_type,
+                            "error": f"{type(e).__name__}: {e}"}
+                return {"event": "worker", "index": position, **result}
+
+        tasks = [asyncio.ensure_future(validate(i, worker, worker_type))
+                 for i, (worker, worker_type) in enumerate(workers)]
+        verdicts: Counter = Counter()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                verdicts["error" if "error" in line else str(line["final_verdict"]["verdict"]).lower()] += 1
+                yield line
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield {"event": "done", "workers": len(workers), "verdicts": dict(verdicts),
+               "elapsed_s": round(time.perf_counter() - start, 3)}
+
+
+@lru_cache()
+def get_bulk_validator() -> BulkValidator:
+    """Validador masivo del proceso, sobre el builder del grafo de diagnóstico del registro."""
+    return BulkValidator(get_graph_registry().builder("diagnosis"))
@@ -1,3 +1,4 @@
-from app.workflow.director import GraphDirector
+"""Punto de entrada de ``langgraph.json``: el grafo de diagnóstico compilado por el registro."""
+from app.workflow.registry import get_graph_registry
 
-diagnosis_graph = GraphDirector.diagnosis_validation_graph()
+diagnosis_graph = get_graph_registry().get("diagnosis")
@@ -1,5 +1,9 @@
+import math
+import os
+import uuid
 from typing import List
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from langgraph.types import Send
@@ -10,15 +14,48 @@ from app.agent.judge import JudgeAgent
 from app.agent.signature import SignatureAgent
 from app.agent.single_logo import SingleLogoAgent
 from app.agent.state.state import OverallState, PageContent
+from app.agent.utils.layout_segmenter import segment_pdf_layout
+from app.service.document_store import document_file
 from app.agent.utils.util import semantic_segment_pdf_with_llm, extract_name_enterprise, \
     semantic_segment_pdf_with_llm_v2, count_pdf_pages, semantic_segment_pdf_with_llm_v3
 
 from app.workflow.builder.base import GraphBuilder
+from app.agent.utils.early_exit_rules import decisive_rule
+from app.workflow.early_exit import run_decision, until_decided
+from app.workflow.node_cache import CachePolicy, cached_node
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# "layout" segmenta localmente y solo recurre al LLM sin capa de texto; "llm" mantiene la segmentación anterior
+DOCUMENT_SEGMENTER = os.getenv("DOCUMENT_SEGMENTER", "layout")
+# Máximo de subgrafos validate_page simultáneos (0 = sin límite) y secciones mínimas por subgrafo;
+# cada petición puede sobrescribirlos en config["configurable"]
+PAGE_CONCURRENCY = int(os.getenv("PAGE_CONCURRENCY", 10))
+PAGES_PER_BATCH = int(os.getenv("PAGES_PER_BATCH", 1))
+
+# Logotipo, firmas y segmentación dependen solo del documento; la extracción, además, de la persona y la fecha
+SEGMENTATION_CACHE = CachePolicy(reads=("document_digest", "filename"), ttl=86400)
+LOGO_CACHE = CachePolicy(reads=("document_digest", "filename"), ttl=86400)
+SIGNATURE_CACHE = CachePolicy(reads=("document_digest",), ttl=86400)
+EXTRACTION_CACHE = CachePolicy(reads=("document_digest", "filename", "worker", "worker_type", "user_date"))
+# Una sección ya validada con los mismos datos salta el subgrafo entero; sin fecha de referencia se usa "hoy"
+PAGE_VALIDATION_CACHE = CachePolicy(
+    reads=("page_content", "enterprise", "valid_data", "page_num", "person", "reference_date", "document_type"),
+    daily=True)
+VERDICT_CACHE = CachePolicy(
+    reads=("pages_verdicts", "page_diagnosis", "logo_diagnosis", "signature_diagnosis", "page_contents",
+           "early_exit", "skipped_pages"))
+
+
+def page_batch_size(sections: int, concurrency: int, pages_per_batch: int = 1) -> int:
+    """Sections per validate_page task so that no more than ``concurrency`` tasks run (0 = unlimited)."""
+    size = max(pages_per_batch, 1)
+    if concurrency > 0 and sections > 0:
+        size = max(size, math.ceil(sections / concurrency))
+    return size
+
 
 class DiagnosisValidationGraph(GraphBuilder):
     def __init__(self):
@@ -28,46 +65,82 @@ class DiagnosisValidationGraph(GraphBuilder):
         self.signature = SignatureAgent()
         self.judge = JudgeAgent()
         self.document_graph = None
-        self.PAGE_PER_TIME = 5
+        self.validate_section = cached_node("validate_page", self.validate_page, PAGE_VALIDATION_CACHE)
+        self.segment = cached_node("segment_document", self.segment_document, SEGMENTATION_CACHE)
 
     def init_graph(self) -> None:
         self.graph = StateGraph(OverallState)
         from .document_validation_grap_builder import DocumentValidationGraphBuilder
-        document_graph = DocumentValidationGraphBuilder()
+        document_graph = DocumentValidationGraphBuilder(document=self.document, judge=self.judge)
         self.document_graph = document_graph.build().compile()
 
     def add_nodes(self) -> None:
         self.graph.add_node("extract_pages_content",
-                            self.extract_pages_content)  # **Nuevo nodo de extracción por página**
-        self.graph.add_node("detect_signatures", self.signature.verify_signatures)
-        self.graph.add_node("validate_page", self.document_graph)
-        self.graph.add_node("compile_verdict", self.judge.summarize)
-        self.graph.add_node("logo_detection", self.logo.verify_logo)
+                            cached_node("extract_pages_content", self.extract_pages_content, EXTRACTION_CACHE))
+        self.graph.add_node("detect_signatures",
+                            cached_node("detect_signatures", self.signature.verify_signatures, SIGNATURE_CACHE))
+        self.graph.add_node("validate_page", self.validate_pages)
+        self.graph.add_node("compile_verdict", cached_node("compile_verdict", self.judge.summarize, VERDICT_CACHE))
+        self.graph.add_node("logo_detection", cached_node("logo_detection", self.logo.verify_logo, LOGO_CACHE))
 
     def add_edges(self) -> None:
-        # Parallel branches for signature and logo detection
-        #self.graph.add_edge(START, "detect_signatures")
-        #self.graph.add_edge(START, "logo_detection")
-        #self.graph.add_edge(START, "detect_signatures")
-        #self.graph.add_edge("detect_signatures", "logo_detection")
-        #self.graph..add_conditional_edges("node_a", routing_function)
-        # After both signature and logo detection are done, proceed to extract_pages_content
-        #self.graph.add_edge(["detect_signatures", "logo_detection"], "extract_pages_content")
+        # Logo, firmas y extracción no dependen entre sí: salen en paralelo desde START
+        # (cada rama abre su propia copia del documento desde el almacén)
         self.graph.add_edge(START, "logo_detection")
-        self.graph.add_edge("logo_detection", "extract_pages_content")
-        #self.graph.add_edge(START, "extract_pages_content")
+        self.graph.add_edge(START, "detect_signatures")
+        self.graph.add_edge(START, "extract_pages_content")
         self.graph.add_conditional_edges("extract_pages_content",
                                          self.generate_pages_to_validate,
                                          ["validate_page"]
                                          )
-        self.graph.add_edge("validate_page", "compile_verdict")
+        # El veredicto final espera a las tres ramas
+        self.graph.add_edge(["validate_page", "logo_detection", "detect_signatures"], "compile_verdict")
         self.graph.add_edge("compile_verdict", END)
 
-    async def extract_pages_content(self, state: OverallState) -> dict:
-        """Extracts page content using semantic segmentation with LLM."""
-        pdf_file = state["file"]
-        total_pages = await count_pdf_pages(pdf_file)
-        if total_pages > 1:
+    async def validate_page(self, state: PageContent, config: RunnableConfig) -> dict:
+        """Runs the document subgraph for one section and keeps only what the parent graph collects."""
+        result = await self.document_graph.ainvoke(state, config)
+        return {"page_diagnosis": result["page_diagnosis"], "pages_verdicts": result["pages_verdicts"]}
+
+    async def validate_pages(self, state: dict, config: RunnableConfig) -> dict:
+        """
+        Validates a batch of sections one after another; batches run in parallel.
+
+        Once any branch of the run gets a decisive verdict (see early_exit), the remaining sections
+        are skipped and the one in flight is cancelled.
+        """
+        decision = run_decision(state["run_key"])
+        page_diagnosis, pages_verdicts, skipped_pages = [], [], []
+        early_exit = None
+        for section in state["sections"]:
+            result = None
+            if not decision.decided:
+                result = await until_decided(self.validate_section(section, config), decision)
+            if result is None:
+                skipped_pages.append(section["page_num"])
+                continue
+            page_diagnosis.extend(result["page_diagnosis"])
+            pages_verdicts.extend(result["pages_verdicts"])
+            for verdict in result["pages_verdicts"]:
+                rule = decisive_rule(verdict)
+                if rule and decision.decide(rule, verdict):
+                    early_exit = decision.decision
+        if skipped_pages:
+            logger.info(f"Early exit: skipped sections {skipped_pages}")
+        return {"page_diagnosis": page_diagnosis, "pages_verdicts": pages_verdicts,
+                "skipped_pages": skipped_pages, "early_exit": early_exit}
+
+    async def segment_document(self, state: OverallState) -> dict:
+        """
+        Splits the document into sections and identifies the insurer; depends only on the document.
+
+        Uses layout segmentation, with the LLM as fallback for scanned documents.
+        """
+        pdf_file = document_file(state)
+        segmented_sections = await segment_pdf_layout(pdf_file) if DOCUMENT_SEGMENTER == "layout" else []
+        if segmented_sections:
+            logger.info(f"Layout segmentation: {len(segmented_sections)} sections")
+        elif await count_pdf_pages(pdf_file) > 1:
             # Use semantic segmentation instead of page-based extraction
             segmented_sections = await semantic_segment_pdf_with_llm_v2(pdf_file,
                                                                         self.document.llm_manager)  # Use LLM for segmentation
@@ -77,9 +150,15 @@ class DiagnosisValidationGraph(GraphBuilder):
                                                                         self.document.llm_manager)
 
         try:
-            enterprise = await extract_name_enterprise(state["file"])
+            enterprise = await extract_name_enterprise(pdf_file)
         except Exception as e:
             enterprise = ""
+        return {"sections": segmented_sections, "enterprise": enterprise}
+
+    async def extract_pages_content(self, state: OverallState) -> dict:
+        """Extracts page content using layout segmentation, with the LLM as fallback for scanned documents."""
+        segmented = await self.segment(state)
+        segmented_sections, enterprise = segmented["sections"], segmented["enterprise"]
 
         person = state["worker"]
         document_type = state["worker_type"]
@@ -99,23 +178,39 @@ class DiagnosisValidationGraph(GraphBuilder):
             )
             page_content_list.append(page_content)
 
-        print("Page content list: ", page_content_list)
+        logger.debug(f"Extracted {len(page_content_list)} section(s)")
         return {"page_contents": page_content_list}
 
-    def generate_pages_to_validate(self, state: OverallState) -> list[Send]:
-        """Creates Send objects for each PageContent in OverallState['page_contents'] for parallel validation."""
-        return [
-            Send("validate_page",
-                 {"page_content": page["page_content"],
-                  "enterprise": page["enterprise"],
-                  "valid_data": page["valid_data"],
-                  "page_num": page["page_num"],
-                  "person": page["person"],
-                  "reference_date": page["reference_date"],
-                  "document_type": page["document_type"]}
-                 )
+    def generate_pages_to_validate(self, state: OverallState, config: RunnableConfig) -> list[Send]:
+        """
+        Creates one Send per batch of sections, so at most ``page_concurrency`` subgraphs run at once.
+
+        ``page_concurrency`` and ``pages_per_batch`` come from ``config["configurable"]`` (falling back to
+        PAGE_CONCURRENCY / PAGES_PER_BATCH). Documents with fewer sections than the limit keep one
+        section per subgraph.
+        """
+        configurable = (config or {}).get("configurable") or {}
+        sections = [
+            {"page_content": page["page_content"],
+             "enterprise": page["enterprise"],
+             "valid_data": page["valid_data"],
+             "page_num": page["page_num"],
+             "person": page["person"],
+             "reference_date": page["reference_date"],
+             "document_type": page["document_type"]}
             for page in state["page_contents"]
         ]
+        # 0 es un valor válido (sin límite), solo None recurre al valor del servicio
+        page_concurrency = configurable.get("page_concurrency")
+        pages_per_batch = configurable.get("pages_per_batch")
+        batch_size = page_batch_size(len(sections),
+                                     int(page_concurrency if page_concurrency is not None else PAGE_CONCURRENCY),
+                                     int(pages_per_batch if pages_per_batch is not None else PAGES_PER_BATCH))
+        batches = [sections[i:i + batch_size] for i in range(0, len(sections), batch_size)]
+        logger.info(f"Validating {len(sections)} section(s) in {len(batches)} batch(es) of up to {batch_size}")
+        # Las ramas de esta ejecución comparten la decisión de terminación anticipada
+        run_key = uuid.uuid4().hex
+        return [Send("validate_page", {"sections": batch, "run_key": run_key}) for batch in batches]
 
     def issue_date_detection(self, state: OverallState) -> str:
         """Detects the issue date of the document."""
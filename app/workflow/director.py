@@ -1,5 +1,7 @@
 from langgraph.graph import StateGraph
 
+from app.workflow.builder.base import GraphBuilder
+
 from app.workflow.document_validation_grap_builder import DocumentValidationGraphBuilder
 from app.workflow.diagnosis_validation_graph_builder import DiagnosisValidationGraph
 
@@ -16,3 +18,11 @@ class GraphDirector:
     def document_validation_graph() -> StateGraph:
         builder = DocumentValidationGraphBuilder()
         return builder.build()
+
+    @staticmethod
+    def diagnosis_validation_builder() -> GraphBuilder:
+        return DiagnosisValidationGraph()
+
+    @staticmethod
+    def document_validation_builder() -> GraphBuilder:
+        return DocumentValidationGraphBuilder()
@@ -1,3 +1,4 @@
-from app.workflow.director import GraphDirector
+"""Punto de entrada de ``langgraph.json``: el grafo de documento compilado por el registro."""
+from app.workflow.registry import get_graph_registry
 
-document_graph = GraphDirector.document_validation_graph()
+document_graph = get_graph_registry().get("document")
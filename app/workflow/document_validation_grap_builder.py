@@ -3,28 +3,34 @@ from langgraph.graph import StateGraph
 
 from app.agent.document import DocumentAgent
 from app.agent.judge import JudgeAgent
-from app.agent.logo import LogoAgent
 from app.agent.signature import SignatureAgent
 from app.agent.state.state import DocumentValidationResponse, PageContent
 
 from app.agent.evaluator import DocumentValidatorAgent
 from app.agent.loader import extract_text_with_pypdfloader
 from app.workflow.builder.base import GraphBuilder
+from app.workflow.node_cache import CachePolicy, cached_node
+
+# La extracción depende del texto de la sección y de la persona, no de la página ni de la fecha
+DOCUMENT_PROCESSOR_CACHE = CachePolicy(reads=("page_content", "enterprise", "person"),
+                                       writes=("valid_data", "insured_match", "person_found"))
 
 
 class DocumentValidationGraphBuilder(GraphBuilder):
 
-    def __init__(self):
+    def __init__(self, document: DocumentAgent = None, judge: JudgeAgent = None):
         super().__init__()
-        self.document = DocumentAgent()
-        self.logo = LogoAgent()
-        self.judge = JudgeAgent()
+        # El grafo de diagnóstico comparte sus agentes con este subgrafo
+        self.document = document or DocumentAgent()
+        self.judge = judge or JudgeAgent()
 
     def init_graph(self) -> None:
         self.graph = StateGraph(PageContent)
 
     def add_nodes(self) -> None:
-        self.graph.add_node("document_processor", self.document.document_processor)
+        self.graph.add_node("document_processor",
+                            cached_node("document_processor", self.document.document_processor,
+                                        DOCUMENT_PROCESSOR_CACHE))
         self.graph.add_node("page_validation", self.judge.validate)
 
     def add_edges(self) -> None:
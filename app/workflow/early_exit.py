@@ -0,0 +1,76 @@
+"""
+Terminación anticipada de la validación.
+
+Cuando una sección obtiene un veredicto decisivo (ver
+``app.agent.utils.early_exit_rules``) se marca la decisión de la ejecución: las
+secciones pendientes no se validan, las que están en curso se cancelan (abortando
+su llamada al LLM) y el veredicto final se arma sin la llamada de resumen.
+"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.agent.state.state import VerdictResponse
+
+logger = logging.getLogger(__name__)
+
+# Ejecuciones con decisión en memoria como máximo (las más antiguas se descartan)
+MAX_TRACKED_RUNS = 1024
+
+
+class RunDecision:
+    """Decisión compartida por las ramas validate_page de una ejecución."""
+
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.decision: Optional[dict] = None
+
+    def decide(self, rule: str, verdict: VerdictResponse) -> bool:
+        """Registra la decisión; False si otra rama ya había decidido."""
+        if self.decision is not None:
+            return False
+        self.decision = {"rule": rule, "page_num": verdict.get("page_num"), "verdict": verdict}
+        self.event.set()
+        logger.info(f"Early exit on page {verdict.get('page_num')}: {rule}")
+        return True
+
+    @property
+    def decided(self) -> bool:
+        return self.decision is not None
+
+
+_runs: "OrderedDict[str, RunDecision]" = OrderedDict()
+_runs_lock = threading.Lock()
+
+
+def run_decision(run_key: str) -> RunDecision:
+    with _runs_lock:
+        decision = _runs.get(run_key)
+        if decision is None:
+            decision = _runs[run_key] = RunDecision()
+            while len(_runs) > MAX_TRACKED_RUNS:
+                _runs.popitem(last=False)
+        return decision
+
+
+async def until_decided(coro, decision: RunDecision):
+    """
+    Ejecuta ``coro`` salvo que la ejecución se decida antes; entonces la cancela.
+
+    Si se cancela quien espera (cliente desconectado, rama cancelada), ``coro`` se cancela
+    también: su llamada al LLM no queda huérfana.
+
+    Returns:
+        El resultado de ``coro``, o None si se canceló por la decisión
+    """
+    task = asyncio.ensure_future(coro)
+    waiter = asyncio.ensure_future(decision.event.wait())
+    try:
+        await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        return task.result() if task.done() else None
+    finally:
+        task.cancel()
+        waiter.cancel()
+        await asyncio.gather(task, waiter, return_exceptions=True)
@@ -0,0 +1,137 @@
+"""
+Memoización de nodos del grafo de validación.
+
+Cada nodo declara su ``CachePolicy``: los campos del estado que lee (la clave es
+un hash estable de solo esos campos), las claves que produce y su TTL. Si la
+entrada está en caché el nodo no se ejecuta: se devuelve la actualización
+guardada. Así, validar el mismo documento para otra persona u otra fecha reutiliza
+la detección de logotipo y firmas, y una sección ya validada con los mismos datos
+se salta entera, subgrafo incluido, no solo su llamada al LLM.
+
+La caché es en memoria, por proceso, con LRU acotado (``NODE_CACHE_MAX_ENTRIES``)
+y TTL por nodo; ``NODE_CACHE_TTLS`` (JSON ``{"nodo": segundos}``) sobrescribe los
+TTL declarados. Las ejecuciones offline (warmup) no leen ni escriben la caché.
+"""
+import copy
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+from app.providers.llm_manager import in_offline_context
+
+logger = logging.getLogger(__name__)
+
+NODE_CACHE_ENABLED = os.getenv("NODE_CACHE_ENABLED", "true").lower() == "true"
+NODE_CACHE_MAX_ENTRIES = int(os.getenv("NODE_CACHE_MAX_ENTRIES", 2048))
+NODE_CACHE_TTLS: Dict[str, float] = json.loads(os.getenv("NODE_CACHE_TTLS", "{}"))
+
+NodeFn = Callable[..., Awaitable[dict]]
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Qué lee y qué escribe un nodo, y cuánto vive su resultado."""
+    reads: Tuple[str, ...]
+    ttl: float = 3600
+    writes: Optional[Tuple[str, ...]] = None  # None guarda la actualización completa
+    daily: bool = False  # la clave incluye la fecha del día (nodos que usan "hoy" sin fecha de referencia)
+
+
+def state_key(node: str, state: Mapping, policy: CachePolicy) -> str:
+    """Hash estable de los campos que lee el nodo."""
+    values = {field: state.get(field) for field in policy.reads}
+    if policy.daily:
+        values["__today__"] = date.today().isoformat()
+    payload = json.dumps(values, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{node}\n{payload}".encode("utf-8")).hexdigest()
+
+
+class NodeCache:
+    """LRU con caducidad por entrada."""
+
+    def __init__(self, max_entries: int = NODE_CACHE_MAX_ENTRIES):
+        self.max_entries = max(max_entries, 1)
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "expired": 0})
+        self.evictions = 0
+
+    def get(self, node: str, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.stats[node]["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats[node]["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats[node]["hits"] += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, key: str, update: dict, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(update))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "evictions": self.evictions, "nodes": {node: dict(s) for node, s in self.stats.items()}}
+
+
+_cache = NodeCache()
+
+
+def cached_node(name: str, fn: NodeFn, policy: CachePolicy, cache: NodeCache = _cache) -> NodeFn:
+    """
+    Envuelve un nodo para saltarlo cuando sus entradas ya se procesaron.
+
+    Args:
+        name: Nombre del nodo (forma parte de la clave y de las métricas)
+        fn: Nodo asíncrono ``fn(state)`` que devuelve la actualización del estado
+        policy: Campos leídos y escritos, TTL
+
+    Returns:
+        Nodo con la misma firma
+    """
+    if not NODE_CACHE_ENABLED:
+        return fn
+    ttl = float(NODE_CACHE_TTLS.get(name, policy.ttl))
+
+    @functools.wraps(fn)
+    async def node(state: dict, *args: Any, **kwargs: Any) -> dict:
+        if in_offline_context():
+            return await fn(state, *args, **kwargs)
+        key = state_key(name, state, policy)
+        update = cache.get(name, key)
+        if update is not None:
+            logger.debug(f"Node cache hit: {name}")
+            return update
+        update = await fn(state, *args, **kwargs)
+        if policy.writes is not None:
+            update = {field: update.get(field) for field in policy.writes}
+        cache.put(key, update, ttl)
+        return update
+
+    return node
+
+
+def node_cache_snapshot() -> dict:
+    return _cache.snapshot()
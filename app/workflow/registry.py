@@ -0,0 +1,374 @@
+"""
+Registro de los grafos LangGraph compilados.
+
+Cada workflow se construye y compila una sola vez en el arranque (lifespan de
+FastAPI) y las peticiones reutilizan el grafo compilado. Opcionalmente se
+ejecuta un warmup del grafo de diagnóstico contra el proveedor fake, que recorre
+la segmentación, la extracción, las reglas y el veredicto sin llamadas reales.
+
+El grafo de diagnóstico se compila con un checkpointer SQLite (``CHECKPOINT_DB``):
+cada nodo completado queda guardado bajo el ``thread_id`` de la validación, así
+que si falla una sección o el veredicto final, reintentar la misma petición
+reanuda desde el último nodo completado en lugar de repetir la segmentación, el
+logotipo y todas las páginas. Los checkpoints solo sirven para reanudar: el thread
+se borra cuando la ejecución termina y un thread que ya terminó nunca se devuelve,
+se vuelve a ejecutar desde cero. Los threads de ejecuciones fallidas que nadie
+reintenta se eliminan tras ``CHECKPOINT_RETENTION_HOURS``.
+
+Los workers de uvicorn comparten la base de checkpoints, así que cada ejecución
+toma antes un lease del thread (``CHECKPOINT_THREAD_LEASE``, renovado mientras
+corre): una segunda ejecución del mismo thread espera a que termine la primera en
+lugar de "reanudar" un thread que sigue ejecutándose.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+import fitz
+
+from app.providers.llm_manager import offline_context
+from app.service.document_store import get_document_store
+from app.workflow.builder.base import GraphBuilder
+from app.workflow.director import GraphDirector
+
+logger = logging.getLogger(__name__)
+
+GRAPH_WARMUP = os.getenv("GRAPH_WARMUP", "true").lower() == "true"
+# PDF del warmup; sin él se usa una constancia sintética
+GRAPH_WARMUP_PDF = os.getenv("GRAPH_WARMUP_PDF", "")
+GRAPH_WARMUP_LATENCY = os.getenv("GRAPH_WARMUP_LATENCY", "constant:0.001:0.001")
+GRAPH_WARMUP_TIMEOUT = float(os.getenv("GRAPH_WARMUP_TIMEOUT", 60))
+# Base SQLite de checkpoints; vacío desactiva la reanudación
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.sqlite")
+# Threads sin actividad durante este tiempo se eliminan, y cada cuánto se revisan
+CHECKPOINT_RETENTION_HOURS = float(os.getenv("CHECKPOINT_RETENTION_HOURS", 24))
+CHECKPOINT_PRUNE_INTERVAL = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL", 3600))
+# Lease de un thread en ejecución (se renueva cada tercio) y espera entre intentos de tomarlo
+CHECKPOINT_THREAD_LEASE = float(os.getenv("CHECKPOINT_THREAD_LEASE", 300))
+CHECKPOINT_THREAD_POLL = float(os.getenv("CHECKPOINT_THREAD_POLL", 0.5))
+# Grafos que se compilan con checkpointer (el de documento corre como subgrafo del de diagnóstico)
+CHECKPOINTED_GRAPHS = ("diagnosis",)
+WARMUP_THREAD_ID = "warmup"
+
+WARMUP_WORKER = "PEREZ GOMEZ, JUAN CARLOS"
+WARMUP_LINES = [
+    "Lima, 02 de enero de 2025",
+    "CONSTANCIA",
+    "SEGURO COMPLEMENTARIO DE TRABAJO DE RIESGO",
+    "VIGENCIA: 01/01/2025 AL 31/01/2025",
+    "SCTR PENSIONES Póliza 30000001",
+    "Nro NOMBRES PATERNO MATERNO TIPODOC NRODOC",
+    "1 PEREZ GOMEZ, JUAN CARLOS DNI 40000001",
+    "2 RAMOS DIAZ, ANA MARIA DNI 40000002",
+    "Extendemos la presente constancia a solicitud de nuestro cliente.",
+    "GERENTE DE DIVISION TECNICA",
+]
+
+
+def warmup_pdf() -> bytes:
+    """Constancia sintética de una página con tabla de asegurados."""
+    document = fitz.open()
+    page = document.new_page()
+    for i, line in enumerate(WARMUP_LINES):
+        page.insert_text((72, 72 + 18 * i), line, fontsize=10)
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+def validation_thread_id(document_digest: str, worker: str, worker_type: str, user_date: Optional[str]) -> str:
+    """
+    Thread de una validación: el mismo documento, persona y fecha reanudan el mismo thread.
+
+    Sin fecha de referencia se usa la del día, para no reutilizar una validación de otro día.
+    """
+    reference = user_date or date.today().strftime("%d/%m/%Y")
+    key = "|".join([document_digest, worker_type or "", worker or "", reference])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+class GraphRegistry:
+    """Grafos compilados por nombre, con los tiempos de compilación y warmup."""
+
+    def __init__(self, factories: Optional[Dict[str, Callable[[], GraphBuilder]]] = None):
+        self.factories = factories or {
+            "diagnosis": GraphDirector.diagnosis_validation_builder,
+            "document": GraphDirector.document_validation_builder,
+        }
+        # Un builder por workflow: sus agentes se comparten entre recompilaciones y con la validación masiva
+        self.builders: Dict[str, GraphBuilder] = {}
+        self.graphs: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.checkpointer = None
+        self.threads_db: Optional[str] = None
+        self._lock = threading.Lock()
+        # Aparte de _lock: builder() se llama al compilar, con _lock ya tomado
+        self._builders_lock = threading.Lock()
+
+    def set_checkpointer(self, checkpointer, threads_db: Optional[str] = CHECKPOINT_DB) -> None:
+        """
+        Asigna el checkpointer; los grafos ya compilados se recompilan con él.
+
+        Args:
+            threads_db: Base SQLite donde se registra la última actividad de cada thread para
+                aplicar la retención (None la desactiva)
+        """
+        with self._lock:
+            self.checkpointer = checkpointer
+            self.threads_db = threads_db or None
+            self.graphs.clear()
+        if self.threads_db:
+            self._threads_sql("CREATE TABLE IF NOT EXISTS checkpoint_threads "
+                              "(thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, owner TEXT, lease_until REAL)")
+            columns = {row[1] for row in self._threads_sql("PRAGMA table_info(checkpoint_threads)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._threads_sql(f"ALTER TABLE checkpoint_threads ADD COLUMN {column} {kind}")
+
+    def _threads_sql(self, sql: str, params: tuple = ()) -> list:
+        db = sqlite3.connect(self.threads_db, timeout=30, isolation_level=None)
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def _claim_thread(self, thread_id: str, owner: str) -> bool:
+        """Toma (o renueva) el lease del thread si está libre, vencido o ya es de ``owner``."""
+        now = time.time()
+        rows = self._threads_sql(
+            """INSERT INTO checkpoint_threads (thread_id, updated_at, owner, lease_until) VALUES (?, ?, ?, ?)
+               ON CONFLICT (thread_id) DO UPDATE
+               SET updated_at = excluded.updated_at, owner = excluded.owner, lease_until = excluded.lease_until
+               WHERE checkpoint_threads.owner IS NULL OR checkpoint_threads.owner = excluded.owner
+                  OR checkpoint_threads.lease_until < ?
+               RETURNING thread_id""",
+            (thread_id, now, owner, now + CHECKPOINT_THREAD_LEASE, now))
+        return bool(rows)
+
+    async def _keep_thread(self, thread_id: str, owner: str) -> None:
+        while True:
+            await asyncio.sleep(CHECKPOINT_THREAD_LEASE / 3)
+            try:
+                if not await asyncio.to_thread(self._claim_thread, thread_id, owner):
+                    logger.warning(f"Lease del thread {thread_id} perdido")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"No se pudo renovar el lease del thread {thread_id}: {e}")
+
+    @asynccontextmanager
+    async def _thread_lease(self, thread_id: str):
+        """
+        Exclusión de un thread entre ejecuciones y procesos; espera si otra ejecución lo tiene.
+
+        Sin checkpointer no hay nada que reanudar y las ejecuciones son independientes.
+        """
+        if self.checkpointer is None or not self.threads_db:
+            yield
+            return
+        owner = uuid.uuid4().hex
+        waiting = False
+        while not await asyncio.to_thread(self._claim_thread, thread_id, owner):
+            if not waiting:
+                logger.info(f"Thread {thread_id} en ejecución en otro worker, esperando")
+                waiting = True
+            await asyncio.sleep(CHECKPOINT_THREAD_POLL)
+        keeper = asyncio.create_task(self._keep_thread(thread_id, owner))
+        try:
+            yield
+        finally:
+            keeper.cancel()
+            # Si terminó, _finished ya borró la fila; si falló, queda para reanudar o podar
+            await asyncio.shield(asyncio.to_thread(
+                self._threads_sql,
+                "UPDATE checkpoint_threads SET owner = NULL, lease_until = NULL WHERE thread_id = ? AND owner = ?",
+                (thread_id, owner)))
+
+    async def forget_thread(self, thread_id: str) -> None:
+        """Borra los checkpoints de un thread."""
+        if self.checkpointer is None:
+            return
+        await self.checkpointer.adelete_thread(thread_id)
+        if self.threads_db:
+            await asyncio.to_thread(self._threads_sql, "DELETE FROM checkpoint_threads WHERE thread_id = ?",
+                                    (thread_id,))
+
+    async def prune_checkpoints(self, max_age_hours: float = CHECKPOINT_RETENTION_HOURS) -> int:
+        """
+        Elimina los threads sin actividad desde hace ``max_age_hours`` (ejecuciones fallidas no reintentadas).
+
+        Returns:
+            Threads eliminados
+        """
+        if self.checkpointer is None or not self.threads_db:
+            return 0
+        cutoff = time.time() - max_age_hours * 3600
+        rows = await asyncio.to_thread(
+            self._threads_sql,
+            "SELECT thread_id FROM checkpoint_threads WHERE updated_at < ? AND (owner IS NULL OR lease_until < ?)",
+            (cutoff, time.time()))
+        for (thread_id,) in rows:
+            await self.forget_thread(thread_id)
+        if rows:
+            logger.info(f"Checkpoints: {len(rows)} thread(s) sin actividad eliminados")
+        return len(rows)
+
+    async def prune_checkpoints_forever(self, interval: float = CHECKPOINT_PRUNE_INTERVAL,
+                                        max_age_hours: float = CHECKPOINT_RETENTION_HOURS) -> None:
+        """
+        Aplica la retención periódicamente (tarea de fondo del lifespan).
+
+        Los documentos subidos se podan con la misma antigüedad que los checkpoints, haya o no
+        checkpointer.
+        """
+        while True:
+            try:
+                await self.prune_checkpoints(max_age_hours)
+                await asyncio.to_thread(get_document_store().prune, max_age_hours)
+            except Exception as e:
+                logger.warning(f"Poda de checkpoints fallida: {type(e).__name__}: {e}")
+            await asyncio.sleep(interval)
+
+    def compile(self, name: str) -> Any:
+        """Construye y compila un workflow, registrando el tiempo empleado."""
+        start = time.perf_counter()
+        checkpointer = self.checkpointer if name in CHECKPOINTED_GRAPHS else None
+        graph = self.builder(name).build().compile(checkpointer=checkpointer)
+        self.timings.setdefault(name, {})["compile_s"] = round(time.perf_counter() - start, 3)
+        logger.info(f"Grafo {name} compilado en {self.timings[name]['compile_s']}s")
+        return graph
+
+    def builder(self, name: str) -> GraphBuilder:
+        """Builder del workflow (con sus agentes), creado una sola vez."""
+        builder = self.builders.get(name)
+        if builder is None:
+            with self._builders_lock:
+                builder = self.builders.get(name)
+                if builder is None:
+                    builder = self.builders[name] = self.factories[name]()
+        return builder
+
+    def compile_all(self) -> None:
+        for name in self.factories:
+            self.get(name)
+
+    def get(self, name: str) -> Any:
+        """Grafo compilado; se compila la primera vez si el arranque no lo hizo."""
+        graph = self.graphs.get(name)
+        if graph is None:
+            with self._lock:
+                graph = self.graphs.get(name)
+                if graph is None:
+                    graph = self.graphs[name] = self.compile(name)
+        return graph
+
+    async def run(self, name: str, state: dict, thread_id: str, configurable: Optional[dict] = None) -> dict:
+        """
+        Ejecuta un grafo en su thread, reanudando una ejecución previa si quedó a medias.
+
+        Args:
+            name: Grafo registrado
+            state: Estado inicial (se ignora al reanudar)
+            thread_id: Identificador del thread en el checkpointer
+            configurable: Opciones de la ejecución (p.ej. page_concurrency, pages_per_batch)
+
+        Returns:
+            Estado final del grafo
+        """
+        graph = self.get(name)
+        config = {"configurable": {**(configurable or {}), "thread_id": thread_id}}
+        async with self._thread_lease(thread_id):
+            graph_input = await self._resume_input(name, graph, state, config)
+            result = await graph.ainvoke(graph_input, config)
+            await self._finished(graph, thread_id)
+        return result
+
+    async def stream(self, name: str, state: dict, thread_id: str,
+                     configurable: Optional[dict] = None) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Como ``run``, pero emitiendo el progreso de la ejecución.
+
+        Yields:
+            ``("updates", {nodo: actualización})`` al completarse cada nodo y ``("values", estado)``
+            tras cada paso
+        """
+        graph = self.get(name)
+        config = {"configurable": {**(configurable or {}), "thread_id": thread_id}}
+        async with self._thread_lease(thread_id):
+            graph_input = await self._resume_input(name, graph, state, config)
+            async for mode, chunk in graph.astream(graph_input, config, stream_mode=["updates", "values"]):
+                yield mode, chunk
+            await self._finished(graph, thread_id)
+
+    async def _resume_input(self, name: str, graph: Any, state: dict, config: dict) -> Optional[dict]:
+        """
+        Entrada de la ejecución: None para reanudar un thread interrumpido, el estado inicial si no.
+
+        Se llama con el lease del thread tomado, así que un ``snapshot.next`` pendiente es de una
+        ejecución que ya no corre. Un thread que ya terminó (p.ej. si el proceso cayó antes de
+        borrarlo) no se reutiliza: se borran sus checkpoints y la validación se ejecuta de nuevo.
+        """
+        if graph.checkpointer is None:
+            return state
+        thread_id = config["configurable"]["thread_id"]
+        snapshot = await graph.aget_state(config)
+        if snapshot.next:
+            logger.info(f"Reanudando {name} ({thread_id}) en {list(snapshot.next)}")
+            return None
+        if snapshot.values:
+            logger.info(f"{name} ({thread_id}) ya terminado, se ejecuta de nuevo")
+            # Solo los checkpoints: la fila del thread guarda el lease de esta ejecución
+            await self.checkpointer.adelete_thread(thread_id)
+        return state
+
+    async def _finished(self, graph: Any, thread_id: str) -> None:
+        """Los checkpoints de una ejecución completa ya no sirven para reanudar nada."""
+        if graph.checkpointer is not None:
+            await self.forget_thread(thread_id)
+
+    async def warmup(self, pdf_path: str = GRAPH_WARMUP_PDF) -> Optional[float]:
+        """
+        Ejecuta una vez el grafo de diagnóstico contra el proveedor fake.
+
+        Returns:
+            Segundos empleados, o None si el warmup falló
+        """
+        content = Path(pdf_path).read_bytes() if pdf_path else warmup_pdf()
+        state = {"document_digest": get_document_store().put(content, holder=WARMUP_THREAD_ID),
+                 "filename": os.path.basename(pdf_path) or "warmup.pdf",
+                 "worker": WARMUP_WORKER, "worker_type": "name", "user_date": None}
+        # Siempre una ejecución completa en un thread propio que no se conserva
+        config = {"configurable": {"thread_id": WARMUP_THREAD_ID}}
+        start = time.perf_counter()
+        try:
+            await self.forget_thread(WARMUP_THREAD_ID)
+            with offline_context(GRAPH_WARMUP_LATENCY):
+                await asyncio.wait_for(self.get("diagnosis").ainvoke(state, config), GRAPH_WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Warmup del grafo de diagnóstico fallido: {type(e).__name__}: {e}")
+            return None
+        finally:
+            await self.forget_thread(WARMUP_THREAD_ID)
+            get_document_store().release(WARMUP_THREAD_ID)
+        elapsed = round(time.perf_counter() - start, 3)
+        self.timings.setdefault("diagnosis", {})["warmup_s"] = elapsed
+        logger.info(f"Warmup del grafo de diagnóstico en {elapsed}s")
+        return elapsed
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {name: dict(timings) for name, timings in self.timings.items()}
+
+
+@lru_cache()
+def get_graph_registry() -> GraphRegistry:
+    """Registro de grafos del proceso."""
+    return GraphRegistry()
@@ -1,12 +1,46 @@
+from contextlib import asynccontextmanager, AsyncExitStack
+
 from fastapi import FastAPI
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.v1.endpoints import evaluator
+from app.api.v1.endpoints import evaluator, insurers, metrics
 import logging
 from app.config.database import init_db
+from app.providers.llm_manager import get_llm_registry
+from app.providers.rate_limit import get_rate_limiter
+from app.service.job_queue import JOB_WORKERS, JobWorkerPool, get_job_queue
+from app.workflow.registry import CHECKPOINT_DB, GRAPH_WARMUP, get_graph_registry
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abre el pool HTTP compartido de los LLM antes de la primera petición
+    registry = get_llm_registry()
+    await registry.preconnect()
+    async with AsyncExitStack() as stack:
+        graphs = get_graph_registry()
+        if CHECKPOINT_DB:
+            # Checkpoints locales: una validación fallida se reanuda desde el último nodo completado
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            graphs.set_checkpointer(await stack.enter_async_context(AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB)))
+        # Retención de los threads de ejecuciones fallidas que nadie reintentó y de los documentos subidos
+        pruning = asyncio.create_task(graphs.prune_checkpoints_forever())
+        stack.callback(pruning.cancel)
+        # Los grafos se compilan una vez; el warmup recorre el de diagnóstico con el proveedor fake
+        graphs.compile_all()
+        if GRAPH_WARMUP:
+            await graphs.warmup()
+        # Los trabajos encolados (/document/v2/jobs) se ejecutan en segundo plano con el checkpointer abierto
+        jobs = JobWorkerPool(get_job_queue(), evaluator.run_validation, on_finished=evaluator.finish_validation_job)
+        if JOB_WORKERS > 0:
+            jobs.start()
+        yield
+        await jobs.stop()
+    await get_rate_limiter().aclose()
+    await registry.aclose()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configurar el logger
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +57,12 @@ app.add_middleware(
 app.include_router(
     evaluator.router
 )
+app.include_router(
+    metrics.router
+)
+app.include_router(
+    insurers.router
+)
 
 # Inicializa la base de datos
 init_db()
@@ -0,0 +1,55 @@
+"""
+Configuración común de las pruebas.
+
+Las variables se fijan antes de importar ``app``: los módulos leen su
+configuración al importarse. Todo corre contra el proveedor fake, sin red ni
+base de datos, y los archivos (documentos, colas, checkpoints) van a un
+directorio temporal.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="tests-")
+for name, value in {
+    "OPENAI_API_KEY": "sk-test",
+    "TAVILY_API_KEY": "test",
+    "DB_NAME": "test",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "LANGSMITH_API_KEY": "test",
+    "LANGSMITH_ENDPOINT": "http://localhost",
+    "LANGSMITH_PROJECT": "test",
+    "LANGCHAIN_TRACING_V2": "false",
+    "LLM_OFFLINE": "true",
+    "LLM_RATE_LIMIT_REDIS_URL": "",
+    "NODE_CACHE_ENABLED": "false",
+    "CHECKPOINT_DB": "",
+    "CHECKPOINT_THREAD_POLL": "0.05",
+    "GRAPH_WARMUP": "false",
+    "DOCUMENT_STORE_DIR": os.path.join(_TMP, "documents"),
+    "JOB_QUEUE_DB": os.path.join(_TMP, "jobs.sqlite"),
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest  # noqa: E402
+
+
+def run(coro):
+    """Ejecuta una corrutina en un event loop nuevo."""
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    """Los circuit breakers son del proceso: cada prueba empieza con todos cerrados."""
+    from app.providers import policy
+    policy._breakers.clear()
+    policy.get_latency_tracker.cache_clear()
+    yield
+    policy._breakers.clear()
@@ -0,0 +1,182 @@
+import asyncio
+import operator
+import os
+import time
+from typing import Annotated, List, TypedDict
+
+import pytest
+from conftest import run
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph import END, START, StateGraph
+
+from app.service.document_store import DocumentStore
+from app.workflow.builder.base import GraphBuilder
+from app.workflow.registry import GraphRegistry
+
+
+class StepsState(TypedDict):
+    steps: Annotated[List[str], operator.add]
+
+
+class StepsBuilder(GraphBuilder):
+    """extract → validate → summarize; ``failures`` hace fallar los primeros summarize."""
+
+    def __init__(self, calls: dict, failures: int = 0, delay: float = 0.0):
+        super().__init__()
+        self.calls = calls
+        self.failures = failures
+        self.delay = delay
+
+    def node(self, name: str):
+        async def run_node(state: StepsState) -> dict:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.calls["running"] = self.calls.get("running", 0) + 1
+            self.calls["max_running"] = max(self.calls.get("max_running", 0), self.calls["running"])
+            try:
+                await asyncio.sleep(self.delay)
+                if name == "summarize" and self.failures:
+                    self.failures -= 1
+                    raise RuntimeError("summarize failed")
+            finally:
+                self.calls["running"] -= 1
+            return {"steps": [name]}
+        return run_node
+
+    def init_graph(self) -> None:
+        self.graph = StateGraph(StepsState)
+
+    def add_nodes(self) -> None:
+        for name in ("extract", "validate", "summarize"):
+            self.graph.add_node(name, self.node(name))
+
+    def add_edges(self) -> None:
+        self.graph.add_edge(START, "extract")
+        self.graph.add_edge("extract", "validate")
+        self.graph.add_edge("validate", "summarize")
+        self.graph.add_edge("summarize", END)
+
+
+def with_registry(tmp_path, calls, test, failures=0, delay=0.0, registries=1):
+    """Ejecuta ``test(*registries, saver)`` con registros que comparten la base de checkpoints."""
+    db = str(tmp_path / "checkpoints.sqlite")
+
+    async def main():
+        async with AsyncSqliteSaver.from_conn_string(db) as saver:
+            builder = StepsBuilder(calls, failures, delay)
+            instances = []
+            for _ in range(registries):
+                registry = GraphRegistry({"diagnosis": lambda: builder})
+                registry.set_checkpointer(saver, db)
+                instances.append(registry)
+            return await test(*instances, saver)
+
+    return run(main())
+
+
+async def checkpoints(saver, thread_id):
+    return [c async for c in saver.alist({"configurable": {"thread_id": thread_id}})]
+
+
+def test_failed_run_resumes_from_the_last_completed_node(tmp_path):
+    calls = {}
+
+    async def test(registry, saver):
+        with pytest.raises(RuntimeError):
+            await registry.run("diagnosis", {"steps": []}, "thread")
+        assert await checkpoints(saver, "thread")
+        result = await registry.run("diagnosis", {"steps": []}, "thread")
+        return result, await checkpoints(saver, "thread")
+
+    result, remaining = with_registry(tmp_path, calls, test, failures=1)
+    assert result["steps"] == ["extract", "validate", "summarize"]
+    assert (calls["extract"], calls["validate"], calls["summarize"]) == (1, 1, 2)
+    # Un thread terminado no se conserva
+    assert remaining == []
+
+
+def test_finished_thread_runs_again_from_scratch(tmp_path):
+    calls = {}
+
+    async def test(registry, saver):
+        await registry.run("diagnosis", {"steps": []}, "thread")
+        return await registry.run("diagnosis", {"steps": []}, "thread")
+
+    result = with_registry(tmp_path, calls, test)
+    assert result["steps"] == ["extract", "validate", "summarize"]
+    assert calls["extract"] == 2
+
+
+def test_stream_resumes_and_emits_progress(tmp_path):
+    calls = {}
+
+    async def test(registry, saver):
+        with pytest.raises(RuntimeError):
+            await registry.run("diagnosis", {"steps": []}, "thread")
+        return [chunk async for mode, chunk in registry.stream("diagnosis", {"steps": []}, "thread")
+                if mode == "updates"]
+
+    updates = with_registry(tmp_path, calls, test, failures=1)
+    assert updates == [{"summarize": {"steps": ["summarize"]}}]
+    assert calls["extract"] == 1
+
+
+def test_prune_removes_only_stale_unleased_threads(tmp_path):
+    calls = {}
+
+    async def test(registry, saver):
+        for thread_id in ("stale", "recent"):
+            with pytest.raises(RuntimeError):
+                await registry.run("diagnosis", {"steps": []}, thread_id)
+        assert await registry.prune_checkpoints(24) == 0
+        registry._threads_sql("UPDATE checkpoint_threads SET updated_at = 0 WHERE thread_id = 'stale'")
+        # Un thread antiguo con lease vigente está en ejecución: no se poda
+        registry._threads_sql("INSERT INTO checkpoint_threads VALUES ('running', 0, 'other', ?)",
+                              (time.time() + 60,))
+        pruned = await registry.prune_checkpoints(24)
+        return pruned, await checkpoints(saver, "stale"), await checkpoints(saver, "recent")
+
+    pruned, stale, recent = with_registry(tmp_path, calls, test, failures=2)
+    assert pruned == 1
+    assert stale == [] and recent
+
+
+def test_concurrent_runs_of_a_thread_do_not_overlap(tmp_path):
+    calls = {}
+
+    async def test(first, second, saver):
+        return await asyncio.gather(first.run("diagnosis", {"steps": []}, "thread"),
+                                    second.run("diagnosis", {"steps": []}, "thread"))
+
+    results = with_registry(tmp_path, calls, test, delay=0.05, registries=2)
+    assert calls["max_running"] == 1
+    assert all(result["steps"] == ["extract", "validate", "summarize"] for result in results)
+
+
+def test_expired_lease_can_be_taken_over(tmp_path):
+    calls = {}
+
+    async def test(registry, saver):
+        registry._threads_sql("INSERT INTO checkpoint_threads VALUES ('thread', ?, 'dead-worker', ?)",
+                              (time.time(), time.time() - 1))
+        return await asyncio.wait_for(registry.run("diagnosis", {"steps": []}, "thread"), 5)
+
+    assert with_registry(tmp_path, calls, test)["steps"] == ["extract", "validate", "summarize"]
+
+
+def test_document_store_deletes_released_and_stale_documents(tmp_path):
+    store = DocumentStore(str(tmp_path / "documents"))
+    digest = store.put(b"%PDF-1.4 a", holder="request-a")
+    store.put(b"%PDF-1.4 a", holder="request-b")
+    path = store.path(digest)
+
+    store.release("request-a")
+    assert os.path.exists(path)  # request-b todavía lo usa
+    store.release("request-b")
+    assert not os.path.exists(path)
+
+    unheld = store.put(b"%PDF-1.4 b")
+    assert store.prune(24) == 0
+    old = time.time() - 48 * 3600
+    os.utime(store.path(unheld), (old, old))
+    assert store.prune(24) == 1
+    assert not os.path.exists(store.path(unheld))
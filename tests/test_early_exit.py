@@ -0,0 +1,90 @@
+import asyncio
+
+from conftest import run
+
+from app.agent.utils.early_exit_rules import decided_final_verdict, decisive_rule
+from app.workflow.early_exit import RunDecision, run_decision, until_decided
+
+
+def verdict(page_num, passed, person=True, validity=True):
+    return {"page_num": page_num, "verdict": passed,
+            "details": {"person_validation_passed": person, "validity_validation_passed": validity}}
+
+
+def test_decisive_rules():
+    assert decisive_rule(verdict(1, True)) == "asegurado_aprobado"
+    assert decisive_rule(verdict(1, False, validity=False)) == "asegurado_con_vigencia_vencida"
+    assert decisive_rule(verdict(1, False, person=False)) is None
+    assert decisive_rule(verdict(1, False)) is None
+
+
+def test_only_the_first_decision_counts():
+    decision = RunDecision()
+    assert decision.decide("asegurado_aprobado", verdict(2, True))
+    assert not decision.decide("asegurado_aprobado", verdict(3, True))
+    assert decision.decided and decision.decision["page_num"] == 2
+
+
+def test_run_decision_is_shared_by_run_key():
+    assert run_decision("run-a") is run_decision("run-a")
+    assert run_decision("run-a") is not run_decision("run-b")
+
+
+def test_until_decided_returns_the_result_when_undecided():
+    async def main():
+        async def validate():
+            await asyncio.sleep(0.01)
+            return "page"
+        return await until_decided(validate(), RunDecision())
+
+    assert run(main()) == "page"
+
+
+def test_until_decided_cancels_pending_sections_on_decision():
+    cancelled = []
+
+    async def main():
+        decision = RunDecision()
+
+        async def validate():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        pending = asyncio.ensure_future(until_decided(validate(), decision))
+        await asyncio.sleep(0.01)
+        decision.decide("asegurado_aprobado", verdict(1, True))
+        return await asyncio.wait_for(pending, 1)
+
+    assert run(main()) is None
+    assert cancelled == [True]
+
+
+def test_cancelling_the_waiter_cancels_the_section():
+    cancelled = []
+
+    async def main():
+        async def validate():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        waiter = asyncio.ensure_future(until_decided(validate(), RunDecision()))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    run(main())
+    assert cancelled == [True]
+
+
+def test_decided_final_verdict_without_llm():
+    page = verdict(2, True)
+    final = decided_final_verdict({"rule": "asegurado_aprobado", "page_num": 2, "verdict": page},
+                                  [page], [{"logo_status": True, "signature_status": True}], [], [3, 4])
+    assert final is not None
+    assert final["verdict"] == "true"
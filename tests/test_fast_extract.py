@@ -0,0 +1,66 @@
+from app.agent.utils.fast_extract import (AMBIGUOUS_CONFIDENCE, DOCUMENT_FIELDS, FAST_PATH_MIN_CONFIDENCE,
+                                          extract_known_fields)
+from app.agent.utils.insured_index import build_insured_index, person_context
+from app.workflow.registry import WARMUP_LINES
+
+TEXT = "\n".join(WARMUP_LINES)
+
+
+def test_known_fields_are_read_from_the_text_layer():
+    extraction = extract_known_fields(TEXT, None, "PEREZ GOMEZ, JUAN CARLOS")
+    assert extraction.values["start_date_validity"] == "01/01/2025"
+    assert extraction.values["end_date_validity"] == "31/01/2025"
+    assert extraction.values["policy_number"] == "30000001"
+    assert extraction.values["date_of_issuance"] == "02/01/2025"
+    assert extraction.person_found is True
+    assert extraction.values["person_by_policy"]["policy_number"] == "30000001"
+    assert all(extraction.confidence[name] >= FAST_PATH_MIN_CONFIDENCE
+               for name in ("start_date_validity", "policy_number", "person_by_policy"))
+    # Sin aseguradora identificada la compañía queda para el LLM
+    assert extraction.missing() == ["company"]
+
+
+def test_person_by_document_and_absent_person():
+    assert extract_known_fields(TEXT, None, "40000002").person_found is True
+    assert extract_known_fields(TEXT, None, "LOPEZ QUISPE MARIO").person_found is False
+
+
+def test_ambiguous_validity_is_left_to_the_llm():
+    text = "VIGENCIA: 01/01/2025 AL 31/01/2025\nVIGENCIA: 01/02/2025 AL 28/02/2025"
+    extraction = extract_known_fields(text, None)
+    assert extraction.confidence["start_date_validity"] == AMBIGUOUS_CONFIDENCE
+    assert "start_date_validity" in extraction.missing(required=DOCUMENT_FIELDS)
+
+
+def test_insured_index_lookups():
+    index = build_insured_index(TEXT, "30000001", "01/01/2025")
+    assert [row.document for row in index.rows] == ["40000001", "40000002"]
+    assert index.rows[0].policy_number == "30000001" and index.rows[0].start_date == "01/01/2025"
+
+    assert index.lookup("40000001").method == "document"
+    # Mismo nombre en otro orden, sin coma y con minúsculas
+    match = index.lookup("Juan Carlos Perez Gomez")
+    assert (match.method, match.insured.document) == ("name", "40000001")
+    # Clave principal: primer apellido y primer nombre
+    assert index.lookup("PEREZ JUAN").insured.document == "40000001"
+    assert index.lookup("RAMOS DIAZ ANA MARIA").insured.document == "40000002"
+
+
+def test_person_found_distinguishes_fuzzy_and_absent():
+    index = build_insured_index(TEXT)
+    assert index.person_found("PEREZ GOMEZ JUAN CARLOS") is True
+    assert index.lookup("PERES GOMES JUAN CARLOS").method == "fuzzy"
+    assert index.person_found("PERES GOMES JUAN CARLOS") is None
+    assert index.person_found("ZAPATA") is False
+    assert index.person_found("99999999") is False
+    assert build_insured_index("sin tabla de asegurados").person_found("40000001") is None
+
+
+def test_person_context_keeps_only_nearby_rows():
+    rows = [f"{i} APELLIDO{i} PATERNO, NOMBRE{i} DNI {40000000 + i}" for i in range(1, 21)]
+    text = "\n".join(["VIGENCIA: 01/01/2025 AL 31/01/2025", *rows])
+    pruned = person_context(text, "40000010", window=1)
+    assert "VIGENCIA: 01/01/2025 AL 31/01/2025" in pruned
+    assert all(row in pruned for row in rows[8:11])
+    assert rows[0] not in pruned and rows[-1] not in pruned
+    assert "[... 8 filas de asegurados omitidas ...]" in pruned
@@ -0,0 +1,70 @@
+import io
+
+import fitz
+from conftest import run
+from fastapi import UploadFile
+
+from app.agent.utils.layout_segmenter import is_insured_row, segment_pdf_bytes, segment_pdf_layout
+from app.workflow.registry import warmup_pdf
+
+ROWS = [f"{i} APELLIDO{i} PATERNO, NOMBRE{i} DNI {40000000 + i}" for i in range(1, 8)]
+
+
+def pdf(lines):
+    document = fitz.open()
+    page = document.new_page()
+    for i, line in enumerate(lines):
+        page.insert_text((72, 72 + 18 * i), line, fontsize=10)
+    content = document.tobytes()
+    document.close()
+    return content
+
+
+def test_sections_carry_the_document_context_and_the_insured_rows():
+    sections = segment_pdf_bytes(warmup_pdf())
+    assert len(sections) == 1
+    section = sections[0]
+    assert "VIGENCIA: 01/01/2025 AL 31/01/2025" in section
+    assert "Póliza 30000001" in section
+    assert "1 PEREZ GOMEZ, JUAN CARLOS DNI 40000001" in section
+    assert "2 RAMOS DIAZ, ANA MARIA DNI 40000002" in section
+
+
+def test_insured_table_is_split_by_max_rows():
+    lines = ["CONSTANCIA", "VIGENCIA: 01/01/2025 AL 31/01/2025", "Póliza 30000001",
+             "Nro NOMBRES PATERNO MATERNO TIPODOC NRODOC", *ROWS, "GERENTE DE DIVISION TECNICA"]
+    sections = segment_pdf_bytes(pdf(lines), max_rows=3)
+    assert len(sections) == 3
+    for section in sections:
+        assert "VIGENCIA: 01/01/2025 AL 31/01/2025" in section
+    # Cada fila en exactamente una sección
+    for row in ROWS:
+        assert sum(row in section for section in sections) == 1
+
+
+def test_disclaimers_are_not_sent_to_validation():
+    lines = ["CONSTANCIA", "VIGENCIA: 01/01/2025 AL 31/01/2025", "Póliza 30000001",
+             "Nro NOMBRES PATERNO MATERNO TIPODOC NRODOC", ROWS[0],
+             "Nota: no se brindará cobertura fuera del horario laboral"]
+    assert all("no se brindará cobertura" not in section for section in segment_pdf_bytes(pdf(lines)))
+
+
+def test_scanned_pdf_without_text_has_no_sections():
+    document = fitz.open()
+    document.new_page()
+    content = document.tobytes()
+    document.close()
+    assert segment_pdf_bytes(content) == []
+
+
+def test_upload_is_rewound_after_segmentation():
+    content = warmup_pdf()
+    upload = UploadFile(file=io.BytesIO(content), filename="constancia.pdf")
+    assert len(run(segment_pdf_layout(upload))) == 1
+    assert run(upload.read()) == content
+
+
+def test_insured_rows():
+    assert is_insured_row("1 PEREZ GOMEZ, JUAN CARLOS DNI 40000001")
+    assert not is_insured_row("SCTR PENSIONES Póliza 30000001")
+    assert not is_insured_row("VIGENCIA: 01/01/2025 AL 31/01/2025")
@@ -0,0 +1,138 @@
+import asyncio
+import time
+
+import pytest
+from conftest import run
+
+from app.providers import policy
+from app.providers.fake import FakeChatModel, FakeLLMManager, FakeProviderError, LatencyProfile
+from app.providers.llm_manager import LLMType
+from app.providers.policy import CircuitBreaker, CircuitOpenError, PolicyConfig, ResilientLLM, get_breaker
+from app.providers.rate_limit import ModelLimits, RateLimiter
+
+PRIMARY, BACKUP = LLMType.GPT_4O, LLMType.ANTHROPIC_CLAUDE
+
+
+def fake(response, latency=0.01, error_rate=0.0):
+    profile = LatencyProfile(distribution="constant", median=latency, p95=latency, error_rate=error_rate)
+    return FakeChatModel(profile=profile, response=response)
+
+
+@pytest.fixture
+def manager():
+    manager = FakeLLMManager()
+    manager.fakes[PRIMARY] = fake("primary")
+    manager.fakes[BACKUP] = fake("backup")
+    return manager
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = RateLimiter(limits={PRIMARY.value: ModelLimits(120, 1_000_000),
+                                  BACKUP.value: ModelLimits(120, 1_000_000)})
+    monkeypatch.setattr(policy, "get_rate_limiter", lambda: limiter)
+    return limiter
+
+
+def resilient(manager, backups=(BACKUP,), **config):
+    return ResilientLLM(manager, PRIMARY, list(backups), PolicyConfig(**{"timeout": 5, "hedge": False, **config}))
+
+
+def test_breaker_opens_and_probes_once_when_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # una sola sonda a la vez
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_cancelled_probe_releases_the_slot():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_failing_provider_opens_its_circuit(manager, limiter):
+    manager.fakes[PRIMARY] = fake("primary", error_rate=1.0)
+    get_breaker(PRIMARY.provider).failure_threshold = 2
+    llm = resilient(manager, backups=())
+
+    for _ in range(2):
+        with pytest.raises(FakeProviderError):
+            run(llm.ainvoke("hola"))
+    with pytest.raises(CircuitOpenError):
+        run(llm.ainvoke("hola"))
+
+
+def test_failover_to_backup_when_primary_fails(manager, limiter):
+    manager.fakes[PRIMARY] = fake("primary", error_rate=1.0)
+    assert run(resilient(manager).ainvoke("hola")).content == "backup"
+    assert get_breaker(PRIMARY.provider).failures == 1
+    assert get_breaker(BACKUP.provider).failures == 0
+
+
+def test_open_primary_is_skipped(manager, limiter):
+    breaker = get_breaker(PRIMARY.provider)
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    assert run(resilient(manager).ainvoke("hola")).content == "backup"
+
+
+def test_hedge_fires_after_delay_and_fastest_answer_wins(manager, limiter):
+    manager.fakes[PRIMARY] = fake("primary", latency=2.0)
+    llm = resilient(manager, hedge=True, hedge_default_delay=0.05)
+
+    start = time.monotonic()
+    assert run(llm.ainvoke("hola")).content == "backup"
+    assert time.monotonic() - start < 1.0
+    # El primario cancelado no cuenta como fallo
+    assert get_breaker(PRIMARY.provider).failures == 0
+
+
+def test_no_hedge_when_primary_answers_in_time(manager, limiter):
+    llm = resilient(manager, hedge=True, hedge_default_delay=0.5)
+    assert run(llm.ainvoke("hola")).content == "primary"
+    assert limiter.snapshot()["models"].get(BACKUP.value, {}).get("acquired", 0) == 0
+
+
+def test_deadline_counts_as_provider_failure(manager, limiter):
+    manager.fakes[PRIMARY] = fake("primary", latency=1.0)
+    with pytest.raises(asyncio.TimeoutError):
+        run(resilient(manager, backups=(), timeout=0.1).ainvoke("hola"))
+    assert get_breaker(PRIMARY.provider).failures == 1
+
+
+def test_queued_calls_neither_time_out_nor_trip_the_breaker(manager, limiter):
+    llm = resilient(manager, backups=(), timeout=0.2)
+
+    async def main():
+        # Recarga de 2 peticiones/s: las dos últimas esperan en cola más que el deadline
+        await asyncio.gather(*(limiter.acquire(PRIMARY.value, 1) for _ in range(120)))
+        return await asyncio.gather(*(llm.ainvoke("hola") for _ in range(2)))
+
+    answers = run(main())
+    assert [answer.content for answer in answers] == ["primary", "primary"]
+    breaker = get_breaker(PRIMARY.provider)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_structured_output_goes_through_the_policy(manager, limiter):
+    manager.fakes[PRIMARY] = fake({"verdict": True})
+    llm = resilient(manager).with_structured_output(dict)
+    assert run(llm.ainvoke("hola")) == {"verdict": True}
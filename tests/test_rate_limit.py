@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from conftest import run
+
+from app.providers.rate_limit import ModelLimits, Priority, RateLimiter, estimate_tokens, is_rate_limited
+
+
+def test_share_divides_limits_between_workers():
+    assert ModelLimits(600, 60000).share(3) == ModelLimits(200, 20000)
+    assert ModelLimits(2, 10).share(4) == ModelLimits(1, 2)
+
+
+def test_local_limits_are_shared_without_redis():
+    limiter = RateLimiter(limits={"m": ModelLimits(600, 60000)}, workers=2)
+    assert limiter.limits["m"] == ModelLimits(300, 30000)
+
+
+async def drain(limiter, model, requests):
+    """Agota el bucket de peticiones (su capacidad es el límite por minuto)."""
+    await asyncio.gather(*(limiter.acquire(model, 1) for _ in range(requests)))
+
+
+def test_requests_over_capacity_are_queued_not_rejected():
+    # Recarga de 2 peticiones por segundo
+    limiter = RateLimiter(limits={"m": ModelLimits(120, 1_000_000)})
+
+    async def main():
+        await drain(limiter, "m", 120)
+        start = time.monotonic()
+        waits = await asyncio.gather(*(limiter.acquire("m", 1) for _ in range(2)))
+        return waits, time.monotonic() - start
+
+    waits, elapsed = run(main())
+    assert min(waits) >= 0.4
+    assert elapsed >= 0.9
+    assert limiter.snapshot()["models"]["m"]["acquired"] == 122
+
+
+def test_high_priority_is_served_first():
+    limiter = RateLimiter(limits={"m": ModelLimits(60, 1_000_000)})
+    served = []
+
+    async def request(name, priority):
+        await limiter.acquire("m", 1, priority)
+        served.append(name)
+
+    async def main():
+        await drain(limiter, "m", 60)
+        low = asyncio.ensure_future(request("low", Priority.LOW))
+        await asyncio.sleep(0)
+        high = asyncio.ensure_future(request("high", Priority.HIGH))
+        await asyncio.gather(low, high)
+
+    run(main())
+    assert served == ["high", "low"]
+
+
+def test_unknown_models_and_disabled_limiter_do_not_wait():
+    limiter = RateLimiter(limits={"m": ModelLimits(1, 1)})
+    assert run(limiter.acquire("other", 10_000)) == 0.0
+    disabled = RateLimiter(limits={"m": ModelLimits(1, 1)}, enabled=False)
+    assert run(disabled.acquire("m", 10_000)) == 0.0
+
+
+def test_redis_failure_falls_back_to_the_worker_share():
+    async def broken_script(**kwargs):
+        raise ConnectionError("redis down")
+
+    limiter = RateLimiter(limits={"m": ModelLimits(600, 60000)}, workers=3)
+    # Como si Redis estuviera configurado: límites completos compartidos por el script
+    limiter.limits = {"m": ModelLimits(600, 60000)}
+    limiter._script = broken_script
+
+    run(limiter.acquire("m", 10))
+    snapshot = limiter.snapshot()
+    assert snapshot["backend"] == "local"
+    assert (snapshot["models"]["m"]["rpm"], snapshot["models"]["m"]["tpm"]) == (200, 20000)
+
+
+def test_estimate_tokens_counts_text_images_and_completion():
+    messages = [{"type": "text", "text": "x" * 40}, {"type": "image_url", "image_url": {"url": "data:"}}]
+
+    class Message:
+        content = messages
+
+    assert estimate_tokens([Message()], max_tokens=100) == 10 + 765 + 100
+
+
+def test_is_rate_limited():
+    class TooManyRequests(Exception):
+        status_code = 429
+
+    assert is_rate_limited(TooManyRequests())
+    assert not is_rate_limited(RuntimeError())
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from conftest import run
+
+from app.service.validation_cache import ValidationCache, result_etag
+
+
+def counting_run(result, calls, delay=0.05):
+    async def execute():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+    return execute
+
+
+def test_identical_requests_share_one_run():
+    cache = ValidationCache(ttl=60)
+    calls = []
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_run("k", counting_run({"verdict": "true"}, calls))
+                                      for _ in range(5)))
+
+    answers = run(main())
+    assert len(calls) == 1
+    assert sorted(answer.source for answer in answers) == ["coalesced"] * 4 + ["run"]
+    assert len({answer.etag for answer in answers}) == 1
+    assert cache.snapshot()["in_flight"] == 0
+
+
+def test_result_is_served_from_cache_with_its_etag():
+    cache = ValidationCache(ttl=60)
+    calls = []
+    first = run(cache.get_or_run("k", counting_run({"verdict": "true"}, calls)))
+    second = run(cache.get_or_run("k", counting_run({"verdict": "false"}, calls)))
+    assert len(calls) == 1
+    assert second.source == "cache"
+    assert second.result == first.result and second.etag == first.etag == result_etag({"verdict": "true"})
+
+
+def test_expired_entries_run_again():
+    cache = ValidationCache(ttl=0.01)
+    calls = []
+    run(cache.get_or_run("k", counting_run({"verdict": "true"}, calls)))
+    run(asyncio.sleep(0.02))
+    assert cache.cached("k") is None
+    assert run(cache.get_or_run("k", counting_run({"verdict": "true"}, calls))).source == "run"
+    assert len(calls) == 2
+
+
+def test_errors_are_shared_but_not_cached():
+    cache = ValidationCache(ttl=60)
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def main():
+        return await asyncio.gather(cache.get_or_run("k", failing), cache.get_or_run("k", failing),
+                                    return_exceptions=True)
+
+    errors = run(main())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert cache.cached("k") is None
+    assert cache.stats["errors"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_run():
+    cache = ValidationCache(ttl=60)
+    calls = []
+
+    async def main():
+        leaver = asyncio.ensure_future(cache.get_or_run("k", counting_run({"verdict": "true"}, calls, 0.1)))
+        await asyncio.sleep(0.01)
+        assert cache.in_flight("k") is not None
+        stayer = asyncio.ensure_future(cache.get_or_run("k", counting_run({"verdict": "true"}, calls)))
+        leaver.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaver
+        return await stayer
+
+    assert run(main()).result == {"verdict": "true"}
+    assert len(calls) == 1
+    assert cache.in_flight("k") is None
+
+
+def test_etag_ignores_key_order():
+    assert result_etag({"a": 1, "b": 2}) == result_etag({"b": 2, "a": 1})
+    assert result_etag({"a": 1}) != result_etag({"a": 2})